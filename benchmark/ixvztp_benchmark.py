@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: benchmark/ixvztp_benchmark.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Benchmark ixvztp actions against a local mock NPB
+# 1. For each NPB size, start a fresh mock NPB and run a typical sequence of ixvztp actions against it, each as a separate process
+# 2. For each action, measure wall time, number of REST requests served by the mock NPB and peak memory of the ixvztp process
+# 3. Compare results with a stored baseline. Growth in REST requests beyond the tolerance is a regression, as it usually
+#    means per-object requests were added somewhere. Slower time and larger memory are reported, and fail the run only if asked to
+#
+# Usage: ixvztp_benchmark.py [-P 32,256,1024] [-l latency] [-L link_delay] [-b baseline.json] [--save-baseline] [--strict]
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import subprocess
+
+from mock_npb import *
+
+# DEFINE VARs HERE
+benchmark_dir = os.path.dirname(os.path.abspath(__file__))
+ixvztp_launcher = os.path.join(os.path.dirname(benchmark_dir), 'ixvztp')
+benchmark_baseline_default = os.path.join(benchmark_dir, 'baseline.json')
+benchmark_port_counts_default = '32,256'
+benchmark_latency_default = 0.002
+benchmark_link_delay_default = 0.5
+call_tolerance_default = 0.1            # Relative growth in REST requests that is still not a regression
+time_tolerance_default = 0.5            # Relative growth in wall time that is still not a regression
+time_tolerance_min = 0.5                # Seconds of growth in wall time that are always tolerated
+memory_tolerance_default = 0.5          # Relative growth in peak memory that is still not a regression
+
+# Sequence of actions to run against each mock NPB. Each step works on the result of the previous ones
+# {criteria} and {append} are replaced with paths to files with filter criteria and values to append to them
+benchmark_steps = [
+    ('sysinfo',   ['sysinfo']),
+    ('stats',     ['sysinfo', '--stats', '-i', '0.2', '-n', '2']),
+    ('portup',    ['portup']),
+    ('lldptag',   ['lldptag', '-t', 'TAP,SPAN,probe']),
+    ('portmode',  ['portmode', '-t', 'PROBE', '-m', 'tool']),
+    ('pgform',    ['pgform', '-t', 'tap', '-n', 'TAPs', '-m', 'net']),
+    ('pgform-lb', ['pgform', '-t', 'probe', '-n', 'PROBES', '-m', 'lb']),
+    ('dfform',    ['dfform', '-n', 'AllTraffic', '-i', 'TAPs', '-o', 'PROBES', '-m', 'pbc', '-c', '{criteria}']),
+    ('dfupdate',  ['dfupdate', '-n', 'AllTraffic', '-f', 'ip', '-a', '{append}']),
+]
+benchmark_criteria = {'logical_operation': 'AND', 'ipv4_src_or_dst': {'addr': ['10.0.0.0/8']}}
+benchmark_append = {'addr': ['192.168.%d.0/24' % i for i in range(64)]}
+
+# DEFINE FUNCTIONS HERE
+
+# Run a single ixvztp action against a mock NPB
+# Returns a dictionary with exit code, wall time in seconds, REST requests served, peak memory in KB and output of the process
+def run_benchmark_step(server, work_dir, step_argv):
+    argv = [sys.executable, ixvztp_launcher, '-u', mock_username, '-p', mock_password, '-d', '127.0.0.1', \
+            '-r', str(server.server_port), '--metrics-dir', os.path.join(work_dir, 'metrics')] + step_argv
+    env = dict(os.environ)
+    env['HOME'] = work_dir              # Token and system information caches start empty for each NPB size
+    request_counts = server.npb.get_request_counts()
+
+    start_time = time.time()
+    process = subprocess.Popen(argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, cwd=work_dir, env=env)
+    output = process.stdout.read()
+    process.stdout.close()
+    pid, status, rusage = os.wait4(process.pid, 0)
+    process.returncode = os.WEXITSTATUS(status) if os.WIFEXITED(status) else 1
+    duration = time.time() - start_time
+
+    request_counts_after = server.npb.get_request_counts()
+    call_count = sum(request_counts_after.values()) - sum(request_counts.values())
+    # ru_maxrss is in KB on Linux, but in bytes on macOS
+    max_rss_kb = rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+    return {'returncode': process.returncode, 'seconds': round(duration, 3), 'calls': call_count, 'max_rss_kb': max_rss_kb, \
+            'output': output.decode('utf-8', 'replace')}
+
+# Run all benchmark steps against a fresh mock NPB of a given size
+# Returns a dictionary of results by step name, or None if a step failed
+def run_benchmark(port_count, latency, link_delay):
+    work_dir = tempfile.mkdtemp(prefix='ixvztp_benchmark_')
+    files = {'criteria': os.path.join(work_dir, 'criteria.json'), 'append': os.path.join(work_dir, 'append.json')}
+    with open(files['criteria'], 'w') as f:
+        json.dump(benchmark_criteria, f)
+    with open(files['append'], 'w') as f:
+        json.dump(benchmark_append, f)
+
+    server = start_mock_npb(MockNpb(port_count, latency, link_delay))
+    results = {}
+    try:
+        for step_name, step_argv in benchmark_steps:
+            step_result = run_benchmark_step(server, work_dir, [arg.format(**files) for arg in step_argv])
+            if step_result['returncode'] != 0:
+                print("Error: %s failed against a mock NPB with %d ports:" % (step_name, port_count))
+                print(step_result['output'])
+                return None
+            del step_result['output']
+            del step_result['returncode']
+            results[step_name] = step_result
+    finally:
+        stop_mock_npb(server)
+        shutil.rmtree(work_dir, ignore_errors=True)
+    return results
+
+# Compare a result with its baseline. Returns a list of regression descriptions, each as (kind, text)
+def compare_with_baseline(result, baseline, call_tolerance, time_tolerance, memory_tolerance):
+    regressions = []
+    if baseline is None:
+        return regressions
+    if result['calls'] > baseline['calls'] * (1 + call_tolerance):
+        regressions.append(('calls', "REST requests %d -> %d" % (baseline['calls'], result['calls'])))
+    if result['seconds'] > baseline['seconds'] * (1 + time_tolerance) and result['seconds'] - baseline['seconds'] > time_tolerance_min:
+        regressions.append(('time', "time %.2fs -> %.2fs" % (baseline['seconds'], result['seconds'])))
+    if result['max_rss_kb'] > baseline['max_rss_kb'] * (1 + memory_tolerance):
+        regressions.append(('memory', "peak memory %dKB -> %dKB" % (baseline['max_rss_kb'], result['max_rss_kb'])))
+    return regressions
+
+def load_baseline(filename):
+    try:
+        with open(filename) as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+# ****************************************************************************************** #
+# Main thread
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='ixvztp_benchmark.py', description='Benchmark ixvztp actions against a local mock NPB.')
+    parser.add_argument('-P', '--ports', default=benchmark_port_counts_default, help='Comma-separated list of mock NPB sizes, in ports')
+    parser.add_argument('-l', '--latency', type=float, default=benchmark_latency_default, help='Seconds the mock NPB delays each request by')
+    parser.add_argument('-L', '--link-delay', type=float, default=benchmark_link_delay_default, help='Seconds for a mock NPB link to come up')
+    parser.add_argument('-b', '--baseline', default=benchmark_baseline_default, help='A JSON file with baseline results to compare with')
+    parser.add_argument('--save-baseline', action='store_true', help='Save results as the new baseline instead of comparing with it')
+    parser.add_argument('--strict', action='store_true', help='Fail on slower time and larger memory too, not only on more REST requests')
+    parser.add_argument('--call-tolerance', type=float, default=call_tolerance_default)
+    parser.add_argument('--time-tolerance', type=float, default=time_tolerance_default)
+    parser.add_argument('--memory-tolerance', type=float, default=memory_tolerance_default)
+    args = parser.parse_args()
+
+    baseline = load_baseline(args.baseline)
+    all_results = {}
+    failed = False
+    print("%6s  %-10s  %8s  %6s  %10s  %s" % ('Ports', 'Action', 'Time', 'Calls', 'Peak mem', 'Baseline'))
+    for port_count in [int(p) for p in args.ports.split(',')]:
+        results = run_benchmark(port_count, args.latency, args.link_delay)
+        if results is None:
+            sys.exit(2)
+        all_results[str(port_count)] = results
+        for step_name, step_argv in benchmark_steps:
+            result = results[step_name]
+            step_baseline = baseline.get(str(port_count), {}).get(step_name)
+            regressions = compare_with_baseline(result, step_baseline, args.call_tolerance, args.time_tolerance, args.memory_tolerance)
+            if step_baseline is None:
+                status = 'no baseline'
+            elif len(regressions) == 0:
+                status = 'OK'
+            else:
+                status = 'REGRESSION: ' + ', '.join(text for kind, text in regressions)
+            if any(kind == 'calls' or args.strict for kind, text in regressions):
+                failed = True
+            print("%6d  %-10s  %7.2fs  %6d  %8dKB  %s" % (port_count, step_name, result['seconds'], result['calls'], result['max_rss_kb'], status))
+
+    if args.save_baseline:
+        baseline.update(all_results)
+        with open(args.baseline, 'w') as f:
+            json.dump(baseline, f, indent=2, sort_keys=True)
+        print("Saved results as baseline to %s" % args.baseline)
+    elif failed:
+        sys.exit(1)
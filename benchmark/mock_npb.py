@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: benchmark/mock_npb.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Local stand-in for the Vision NPB Web API, to measure ixvztp performance without a chassis
+# 1. Serves ports, port groups, filters, LLDP neighbors and system information over HTTPS, with a self-signed certificate made by openssl
+# 2. Simulates from a few to over a thousand ports of mixed media types. A port link comes up some time after the port
+#    is enabled in Network mode with settings that match its peer
+# 3. Every request can be delayed to simulate a remote NPB, and is counted by method
+# 4. Every other port has an LLDP neighbor with TAP, SPAN or probe in its port description
+# 5. An NPB with limited capacity can be simulated: requests beyond a number in flight at the same time are rejected with 503
+# 6. Port statistics grow at a steady rate per port from the start of the mock, with drops on every fifth port
+#
+# Usage: mock_npb.py [-P ports] [-l latency] [-L link_delay] [-c capacity] [-r port]
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import re
+import ssl
+import sys
+import json
+import time
+import copy
+import base64
+import shutil
+import argparse
+import tempfile
+import threading
+import subprocess
+
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+    from socketserver import ThreadingMixIn
+    from urllib.parse import urlparse, parse_qs
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+    from SocketServer import ThreadingMixIn
+    from urlparse import urlparse, parse_qs
+
+# DEFINE VARs HERE
+mock_ports_default = 64
+mock_latency_default = 0.0              # Seconds to delay each request by
+mock_link_delay_default = 1.0           # Seconds for a link to come up once a port is configured to match its peer
+mock_capacity_default = 0               # Requests the NPB handles at the same time before rejecting more with 503, 0 for no limit
+mock_username = 'admin'
+mock_password = 'admin'
+
+# Port media types and the settings their peers use, repeated across all ports. None for a peer means nothing is connected
+mock_port_layout = [{'media_type': 'QSFP28', 'peer_media_type': 'QSFP28', 'peer_fec': True}, \
+                    {'media_type': 'QSFP28', 'peer_media_type': 'QSFP28', 'peer_fec': False}, \
+                    {'media_type': 'QSFP_PLUS_40G', 'peer_media_type': 'QSFP_PLUS_40G', 'peer_fec': None}, \
+                    {'media_type': 'SFP_PLUS_10G', 'peer_media_type': 'SFP_PLUS_10G', 'peer_fec': None}, \
+                    {'media_type': 'SFP_PLUS_10G', 'peer_media_type': 'SFP_1G', 'peer_fec': None}, \
+                    {'media_type': 'SFP_1G', 'peer_media_type': 'SFP_1G', 'peer_fec': None}, \
+                    {'media_type': 'SFP_PLUS_10G', 'peer_media_type': None, 'peer_fec': None}, \
+                    {'media_type': 'QSFP28', 'peer_media_type': None, 'peer_fec': None}]
+mock_neighbor_descriptions = ['link to TAP aggregation', 'SPAN session 1', 'probe uplink', 'TAP 2', 'uplink to core', 'SPAN session 2']
+
+mock_object_types = ['ports', 'port_groups', 'filters']
+mock_stats_bytes_rate = 1000000        # Bytes per second a port with ID 1 receives or sends, other ports get multiples of it
+mock_stats_packet_size = 500            # Average packet size, in bytes
+
+# DEFINE FUNCTIONS HERE
+
+# In-memory state of a simulated NPB, and the Web API request handling on top of it
+class MockNpb(object):
+
+    def __init__(self, port_count=mock_ports_default, latency=mock_latency_default, link_delay=mock_link_delay_default, capacity=mock_capacity_default):
+        self.latency = latency
+        self.link_delay = link_delay
+        self.capacity = capacity
+        self.in_flight = 0
+        self.lock = threading.Lock()
+        self.tokens = set()
+        self.request_counts = {}
+        self.next_id = 1000
+        self.objects = {'ports': {}, 'port_groups': {}, 'filters': {}}
+        self.neighbors = {}
+        for i in range(port_count):
+            layout = mock_port_layout[i % len(mock_port_layout)]
+            port_id = i + 1
+            port_name = 'P%02d-%02d' % (i // 32 + 1, i % 32 + 1)
+            self.objects['ports'][port_id] = {'id': port_id, 'name': port_name, 'default_name': port_name, \
+                                              'media_type': layout['media_type'], 'link_settings': 'AUTO', 'mode': 'NETWORK', \
+                                              'enabled': False, 'forward_error_correction_settings': {'enabled': False, 'fec_type': 'RS_FEC'}, \
+                                              'link_status': {'link_up': False}, 'keywords': [], 'lldp_receive_enabled': False, \
+                                              'misc': {'board_type': 'MOCK_BOARD_%d' % (i // 32 + 1)}, 'port_group_id': None, \
+                                              'source_filter_list': [], 'dest_filter_list': [], \
+                                              '_peer_media_type': layout['peer_media_type'], '_peer_fec': layout['peer_fec'], '_link_up_at': None}
+            if i % 2 == 0:
+                self.neighbors[port_name] = [{'system_name': 'switch%d' % (i // 32 + 1), 'port_id': 'Ethernet%d' % (i + 1), \
+                                              'port_description': mock_neighbor_descriptions[(i // 2) % len(mock_neighbor_descriptions)]}]
+        self.system = {'software_version': '5.3.0.17', 'system_info': {'name': 'mock-npb', 'location': 'benchmark', 'contact_info': ''}, \
+                       'ip_config': {'ipv4_address': '127.0.0.1', 'ipv6_address': '::1'}, 'ports': port_count}
+        self.login_info = {'hardware_info': {'system_id': 'MOCK0001', 'mac_address': '00005E005301'}}
+        self.started = time.time()
+
+    # Number of requests served so far, by method
+    def get_request_counts(self):
+        with self.lock:
+            return dict(self.request_counts)
+
+    def update_link(self, port):
+        link_up = port['enabled'] and port['mode'] == 'NETWORK' and port['media_type'] == port['_peer_media_type']
+        if link_up and port['_peer_fec'] is not None:
+            link_up = port['forward_error_correction_settings']['enabled'] == port['_peer_fec']
+        if not link_up:
+            port['_link_up_at'] = None
+        elif port['_link_up_at'] is None:
+            port['_link_up_at'] = time.time() + self.link_delay
+        port['link_status'] = {'link_up': link_up and time.time() >= port['_link_up_at']}
+
+    def describe(self, object_type, obj, properties=None):
+        if object_type == 'ports':
+            self.update_link(obj)
+        details = dict((k, copy.deepcopy(v)) for k, v in obj.items() if not k.startswith('_'))
+        if properties is not None:
+            details = dict((k, details[k]) for k in properties.split(',') if k in details)
+        return details
+
+    # Statistics snapshot of a port, with counters for network or tool ports depending on its mode
+    def port_stats(self, port, stat_names):
+        elapsed = time.time() - self.started
+        byte_count = int(mock_stats_bytes_rate * (port['id'] % 7 + 1) * elapsed)
+        drop_count = int(port['id'] * 10 * elapsed) if port['id'] % 5 == 0 else 0
+        prefix = 'tp' if port['mode'] == 'TOOL' else 'np'
+        counters = {prefix + '_total_' + ('tx' if prefix == 'tp' else 'rx') + '_count_bytes': byte_count, \
+                    prefix + '_total_' + ('tx' if prefix == 'tp' else 'rx') + '_count_packets': byte_count // mock_stats_packet_size, \
+                    ('tp_total_drop_count_packets' if prefix == 'tp' else 'np_total_rx_count_invalid_packets'): drop_count}
+        stats = {'id': port['id'], 'default_name': port['default_name'], 'type': 'Port', 'stats_time': int(time.time() * 1000)}
+        stats.update((name, value) for name, value in counters.items() if stat_names is None or name in stat_names)
+        return stats
+
+    def find(self, object_type, key):
+        objects = self.objects[object_type]
+        if key.isdigit() and int(key) in objects:
+            return objects[int(key)]
+        for obj in objects.values():
+            if obj['name'] == key or obj['default_name'] == key:
+                return obj
+        return None
+
+    def matches(self, obj, search_terms):
+        for name, value in search_terms.items():
+            if name == 'keywords':
+                if not all(keyword in (obj.get('keywords') or []) for keyword in value):
+                    return False
+            elif obj.get(name) != value:
+                return False
+        return True
+
+    def modify(self, object_type, obj, changes):
+        for name, value in changes.items():
+            if name == 'keywords' and isinstance(value, list):
+                # NPBs keep keywords in upper case
+                obj[name] = [keyword.upper() for keyword in value]
+            elif name == 'forward_error_correction_settings' and isinstance(value, dict):
+                obj[name].update(value)
+            else:
+                obj[name] = copy.deepcopy(value)
+        if object_type == 'port_groups' and 'port_list' in changes:
+            for port in self.objects['ports'].values():
+                if port['id'] in obj['port_list']:
+                    port['port_group_id'] = obj['id']
+                elif port['port_group_id'] == obj['id']:
+                    port['port_group_id'] = None
+
+    def create(self, object_type, params):
+        self.next_id += 1
+        obj = {'id': self.next_id, 'name': params.get('name', 'object_%d' % self.next_id), 'default_name': 'object_%d' % self.next_id, 'keywords': []}
+        if object_type == 'port_groups':
+            obj.update({'port_list': [], 'mode': 'NETWORK', 'type': 'INTERCONNECT'})
+        elif object_type == 'filters':
+            obj.update({'mode': 'DISABLE', 'criteria': {}, 'source_port_list': [], 'dest_port_list': [], \
+                        'source_port_group_list': [], 'dest_port_group_list': []})
+        self.objects[object_type][obj['id']] = obj
+        self.modify(object_type, obj, params)
+        return {'id': obj['id']}
+
+    # Handle a Web API request
+    # Returns HTTP status, a dictionary of extra headers and a response body to be sent as JSON, or None for an empty body
+    def handle(self, method, url, headers, body):
+        with self.lock:
+            self.in_flight += 1
+            overloaded = self.capacity > 0 and self.in_flight > self.capacity
+            if overloaded:
+                self.request_counts[method] = self.request_counts.get(method, 0) + 1
+        try:
+            if self.latency > 0:
+                time.sleep(self.latency)
+            if overloaded:
+                return 503, {'Retry-After': '0'}, {'message': 'Too many requests in progress'}
+            return self.serve(method, url, headers, body)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+    # Handle a Web API request the NPB has capacity for
+    def serve(self, method, url, headers, body):
+        parsed_url = urlparse(url)
+        path = parsed_url.path.rstrip('/')
+        query = dict((k, v[0]) for k, v in parse_qs(parsed_url.query).items())
+        properties = query.get('properties')
+
+        with self.lock:
+            self.request_counts[method] = self.request_counts.get(method, 0) + 1
+
+            if path == '/api/auth':
+                authorization = headers.get('Authorization', '')
+                expected = 'Basic ' + base64.b64encode(('%s:%s' % (mock_username, mock_password)).encode('ascii')).decode('ascii')
+                if authorization != expected:
+                    return 401, {}, {'message': 'Invalid credentials'}
+                token = base64.b64encode(os.urandom(18)).decode('ascii')
+                self.tokens.add(token)
+                return 200, {'x-auth-token': token}, None
+            if headers.get('Authentication') not in self.tokens:
+                return 401, {}, {'message': 'Invalid or expired token'}
+
+            if path == '/api/auth/logout':
+                self.tokens.discard(headers.get('Authentication'))
+                return 200, {}, None
+            if path.endswith('login_info'):
+                return 200, {}, copy.deepcopy(self.login_info)
+            if path == '/api/system':
+                system = copy.deepcopy(self.system)
+                if properties is not None:
+                    system = dict((k, system[k]) for k in properties.split(',') if k in system)
+                return 200, {}, system
+            if 'neighbors' in path:
+                return 200, {}, copy.deepcopy(self.neighbors)
+            if path == '/api/stats' and method == 'POST':
+                port_id_list = (body or {}).get('port')
+                port_list = [port for port in self.objects['ports'].values() if port_id_list is None or port['id'] in port_id_list]
+                return 200, {}, {'stats_snapshot': [self.port_stats(port, (body or {}).get('stat_name')) for port in port_list]}
+
+            match = re.match(r'^/api/(ports|port_groups|filters)(?:/([^/]+))?$', path)
+            if match is None:
+                return 404, {}, {'message': 'Unknown resource %s' % path}
+            object_type, key = match.group(1), match.group(2)
+
+            if key is None:
+                if method == 'GET':
+                    if properties is None:
+                        return 200, {}, [{'id': o['id'], 'name': o['name']} for o in self.objects[object_type].values()]
+                    return 200, {}, [self.describe(object_type, o, properties) for o in self.objects[object_type].values()]
+                if method == 'POST' and object_type != 'ports':
+                    return 200, {}, self.create(object_type, body or {})
+                return 405, {}, {'message': 'Method not allowed'}
+
+            if key == 'search' and method == 'POST':
+                return 200, {}, [{'id': o['id'], 'name': o['name']} for o in self.objects[object_type].values() \
+                                 if self.matches(self.describe(object_type, o), body or {})]
+
+            obj = self.find(object_type, key)
+            if obj is None:
+                return 404, {}, {'message': 'No %s found with ID %s' % (object_type, key)}
+            if method == 'GET':
+                return 200, {}, self.describe(object_type, obj, properties)
+            if method == 'PUT':
+                self.modify(object_type, obj, body or {})
+                return 200, {}, None
+            if method == 'DELETE' and object_type != 'ports':
+                del self.objects[object_type][obj['id']]
+                return 200, {}, None
+            return 405, {}, {'message': 'Method not allowed'}
+
+class MockNpbRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True      # Otherwise small responses get delayed, adding to the measured latency
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_request(self, method):
+        content_length = int(self.headers.get('Content-Length') or 0)
+        body = None
+        if content_length > 0:
+            try:
+                body = json.loads(self.rfile.read(content_length).decode('utf-8'))
+            except ValueError:
+                body = None
+        status, extra_headers, response_body = self.server.npb.handle(method, self.path, self.headers, body)
+        content = b'' if response_body is None else json.dumps(response_body).encode('utf-8')
+        self.send_response(status)
+        for name, value in extra_headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def do_GET(self):
+        self.handle_request('GET')
+
+    def do_POST(self):
+        self.handle_request('POST')
+
+    def do_PUT(self):
+        self.handle_request('PUT')
+
+    def do_DELETE(self):
+        self.handle_request('DELETE')
+
+class MockNpbServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+# Make a self-signed certificate with openssl. Returns a directory with cert.pem and key.pem, to be removed by the caller
+def make_mock_certificate():
+    cert_dir = tempfile.mkdtemp(prefix='mock_npb_')
+    subprocess.check_call(['openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1', '-subj', '/CN=localhost', \
+                           '-keyout', os.path.join(cert_dir, 'key.pem'), '-out', os.path.join(cert_dir, 'cert.pem')], \
+                          stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+    return cert_dir
+
+# Start a mock NPB in a background thread
+# Input
+# - Simulated NPB as a MockNpb object
+# - Address and TCP port to listen on, 0 to pick a free port
+# Returns the server, with the TCP port it listens on as server.server_port. Stop it with stop_mock_npb()
+def start_mock_npb(npb, address='127.0.0.1', port=0):
+    cert_dir = make_mock_certificate()
+    server = MockNpbServer((address, port), MockNpbRequestHandler)
+    server.npb = npb
+    server.cert_dir = cert_dir
+    context = ssl.SSLContext(ssl.PROTOCOL_SSLv23)
+    context.load_cert_chain(os.path.join(cert_dir, 'cert.pem'), os.path.join(cert_dir, 'key.pem'))
+    server.socket = context.wrap_socket(server.socket, server_side=True)
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    return server
+
+def stop_mock_npb(server):
+    server.shutdown()
+    server.server_close()
+    shutil.rmtree(server.cert_dir, ignore_errors=True)
+
+# ****************************************************************************************** #
+# Main thread
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(prog='mock_npb.py', description='Local stand-in for the Vision NPB Web API.')
+    parser.add_argument('-P', '--ports', type=int, default=mock_ports_default, help='Number of ports to simulate')
+    parser.add_argument('-l', '--latency', type=float, default=mock_latency_default, help='Seconds to delay each request by')
+    parser.add_argument('-L', '--link-delay', type=float, default=mock_link_delay_default, help='Seconds for a link to come up')
+    parser.add_argument('-c', '--capacity', type=int, default=mock_capacity_default, help='Requests to handle at the same time before rejecting more with 503, 0 for no limit')
+    parser.add_argument('-a', '--address', default='127.0.0.1', help='Address to listen on')
+    parser.add_argument('-r', '--port', type=int, default=8000, help='TCP port to listen on')
+    args = parser.parse_args()
+
+    server = start_mock_npb(MockNpb(args.ports, args.latency, args.link_delay, args.capacity), args.address, args.port)
+    print("Mock NPB with %d ports listening on https://%s:%d, username %s, password %s" % (args.ports, args.address, server.server_port, mock_username, mock_password))
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        stop_mock_npb(server)
@@ -0,0 +1,131 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_cache.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: On-disk cache of NPB system information, one file per NPB
+# 1. Software version and login information, with the hardware serial number and MAC address, are saved after the first run.
+#    System name, location, contact and management addresses can be changed at any time, and are never cached
+# 2. Following runs use the cached information as is while it is fresh
+# 3. Once the cache gets stale, only the software version is checked. If it hasn't changed, the cache is renewed without reading anything else
+# 4. Cache is fully refreshed if the software version has changed, or if it can't be read
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import json
+import time
+
+from ksvisionlib import *
+
+from ixvision_ztp_ntolib import *
+
+# DEFINE VARs HERE
+ztp_cache_dir = os.path.join(os.path.expanduser('~'), '.ixvztp', 'cache')
+ztp_cache_ttl = 3600                    # Seconds to use cached information without checking the software version
+ztp_cache_version = 3                   # Format version of cache files, files in other formats are ignored
+ztp_cache_options = {'enabled': True}
+
+# DEFINE FUNCTIONS HERE
+
+# Don't use cached information, always read it from NPBs. Fresh information is still saved for the next run
+def disable_nto_system_cache():
+    ztp_cache_options['enabled'] = False
+
+def nto_system_cache_filename(host_ip, port):
+    return os.path.join(ztp_cache_dir, "%s_%s.json" % (host_ip, port))
+
+# Remove cached information for an NPB, so that it is read from the NPB next time
+def forget_nto_system_cache(host_ip, port):
+    try:
+        os.remove(nto_system_cache_filename(host_ip, port))
+    except Exception:
+        pass
+
+# Read cached information for an NPB. Returns None if there is no usable cache
+def load_nto_system_cache(host_ip, port):
+    try:
+        with open(nto_system_cache_filename(host_ip, port)) as f:
+            cache = json.load(f)
+    except Exception:
+        return None
+    if not isinstance(cache, dict) or cache.get('cache_version') != ztp_cache_version:
+        return None
+    return cache
+
+# Save information for an NPB. The file is replaced atomically, so that parallel runs never see a partial file
+def save_nto_system_cache(host_ip, port, cache):
+    try:
+        if not os.path.isdir(ztp_cache_dir):
+            os.makedirs(ztp_cache_dir, 0o700)
+        filename = nto_system_cache_filename(host_ip, port)
+        temp_filename = "%s.%d.tmp" % (filename, os.getpid())
+        with open(temp_filename, 'w') as f:
+            json.dump(cache, f)
+        os.rename(temp_filename, filename)
+    except Exception as e:
+        print("Warning: can't save NPB information cache: %s" % e)
+
+# Retrieve software version with as little data as possible
+def nto_get_software_version(nto):
+    try:
+        system_properties = nto._callServer('GET', '/api/system?properties=software_version', None)
+        if isinstance(system_properties, dict) and 'software_version' in system_properties:
+            return system_properties['software_version']
+    except Exception:
+        pass
+    return nto.getSystem()['software_version']
+
+# Read system information from an NPB, with the software version if it isn't known already
+# Port capabilities, like media and board types, are not cached: actions that need them get them along with the port
+# details they read anyway, and port media can be changed by port discovery
+def nto_read_system_cache(nto, software_version=None):
+    if software_version is None:
+        software_version = nto_get_software_version(nto)
+    return {'cache_version': ztp_cache_version, 'updated': time.time(), \
+            'software_version': software_version, \
+            'login_info': nto.getLoginInfo()}
+
+# Get system information for an NPB, from the on-disk cache when possible
+# The information is also kept with the NTO object for the rest of the session
+# Input
+# - NTO object as a connection to an NPB
+# - NPB address and port, to identify the cache file
+# - Current software version of the NPB, if the caller has just read it. The cache is then checked against it, even if fresh
+# Returns a dictionary with software_version and login_info (as returned by getLoginInfo)
+def get_nto_system_cache(nto, host_ip, port, software_version=None):
+    cache = getattr(nto, 'ztp_system_cache', None)
+    if cache is not None and software_version in [None, cache['software_version']]:
+        return cache
+
+    cache = None
+    if ztp_cache_options['enabled']:
+        cache = load_nto_system_cache(host_ip, port)
+    if cache is not None:
+        stale = time.time() - cache['updated'] > ztp_cache_ttl
+        if stale and software_version is None:
+            # Stale cache, check if the NPB software has changed since
+            software_version = nto_get_software_version(nto)
+        if software_version is not None and software_version != cache['software_version']:
+            cache = None
+        elif stale:
+            cache['updated'] = time.time()
+            save_nto_system_cache(host_ip, port, cache)
+    if cache is None:
+        cache = nto_read_system_cache(nto, software_version)
+        save_nto_system_cache(host_ip, port, cache)
+
+    nto.ztp_system_cache = cache
+    nto.ztp_system_cache_loaded = time.time()
+    return cache
+
+# Major software version number of an NPB, from cached information
+def nto_major_software_version(nto, host_ip, port):
+    return int(get_nto_system_cache(nto, host_ip, port)['software_version'].split('.')[0])
@@ -0,0 +1,328 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_changeset.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Change sets - collect intended changes to NPB ports, port groups and filters, then write and verify them together
+# 1. Actions add changes they need to a change set, object by object. Changes to the same object are merged into one,
+#    and changes that are already in effect according to the inventory are dropped
+# 2. Ports are written first, then port groups, then filters, so that port modes are in place before ports join groups
+#    or get connected to filters. Objects of the same type are written with bounded concurrency
+# 3. All written objects of a type are read back with a single bulk request and compared with what was asked for
+# 4. The result is a per-object report: which changes were made and verified, and which failed and why
+# 5. Pending creates and changes can be listed as a plan of creates, modifies and removes of list members, compared with the
+#    current state. With --plan, the plan is printed instead of applied
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import json
+
+from ksvisionlib import *
+
+from ixvision_ztp_ntolib import *
+from ixvision_ztp_criteria import *
+
+# DEFINE VARs HERE
+# Object types in the order they are written in, with their inventory lookup and update methods
+changeset_object_types = ['ports', 'port_groups', 'filters']
+changeset_object_labels = {'ports': 'Port', 'port_groups': 'Port group', 'filters': 'Filter'}
+# Properties whose list values are compared regardless of order, and of case for keywords
+changeset_unordered_properties = ['keywords', 'port_list', 'source_port_list', 'dest_port_list', 'source_port_group_list', 'dest_port_group_list']
+# Dictionary properties that are replaced as a whole when written, rather than merged with the current value
+changeset_whole_properties = ['criteria']
+changeset_describe_list_limit = 20                  # Lists longer than this are described by their size in plans
+
+# DEFINE FUNCTIONS HERE
+
+# Whether a property value read from an NPB matches the value that was written
+# Dictionary values, like FEC settings, match if the keys that were written have the same values
+# Filter criteria match if they are the same in their canonical form, regardless of order or duplicates
+def changeset_value_matches(key, value, current_value):
+    if key == 'criteria' and isinstance(value, dict) and isinstance(current_value, dict):
+        return criteria_match(value, current_value)
+    if isinstance(value, dict) and isinstance(current_value, dict) and key not in changeset_whole_properties:
+        return all(item_key in current_value and changeset_value_matches(item_key, item_value, current_value[item_key]) \
+                   for item_key, item_value in value.items())
+    if key in changeset_unordered_properties and isinstance(value, list) and isinstance(current_value, list):
+        def normalize(item):
+            return item.upper() if key == 'keywords' and hasattr(item, 'upper') else item
+        return sorted(normalize(item) for item in value) == sorted(normalize(item) for item in current_value)
+    return value == current_value
+
+class NpbChangeSet(object):
+
+    def __init__(self, nto, max_workers=bulk_fetch_concurrency):
+        self.nto = nto
+        self.max_workers = max_workers
+        self.inventory = get_nto_inventory(nto)
+        self.changes = dict((object_type, {}) for object_type in changeset_object_types)
+        self.creates = dict((object_type, []) for object_type in changeset_object_types)
+        self.current = {}
+        self.names = {}
+
+    def _get_object(self, object_type, object_id):
+        if object_type == 'ports':
+            return self.inventory.get_port(object_id)
+        if object_type == 'port_groups':
+            return self.inventory.get_port_group(object_id)
+        return self.inventory.get_filter(object_id)
+
+    def _update_inventory(self, object_type, object_id, changes):
+        if object_type == 'ports':
+            self.inventory.update_port(object_id, changes)
+        elif object_type == 'port_groups':
+            self.inventory.update_port_group(object_id, changes)
+        else:
+            self.inventory.update_filter(object_id, changes)
+
+    # Add an object created during the session to the inventory, with its ports pointing back to it
+    def _add_to_inventory(self, object_type, details):
+        if object_type == 'port_groups':
+            self.inventory.add_port_group(dict(details, port_list=[]))
+            self.inventory.update_port_group(details['id'], {'port_list': details.get('port_list') or []})
+        elif object_type == 'filters':
+            port_list_keys = [key for key in ['source_port_list', 'dest_port_list'] if key in details]
+            self.inventory.add_filter(dict(details, **dict((key, []) for key in port_list_keys)))
+            self.inventory.update_filter(details['id'], dict((key, details[key]) for key in port_list_keys))
+
+    def _create(self, object_type, params):
+        if object_type == 'port_groups':
+            return self.nto.createPortGroup(params)
+        return self.nto.createFilter(params, True) # the last parameter is for allowTemporayDataLoss
+
+    def _write(self, object_type, object_id, changes):
+        if object_type == 'ports':
+            apply_port_changes(self.nto, object_id, changes)
+        elif object_type == 'port_groups':
+            self.nto.modifyPortGroup(str(object_id), changes)
+        else:
+            self.nto.modifyFilter(str(object_id), changes)
+
+    # Add changes to an object, merging them with changes added before. Attributes already set to the requested values are skipped
+    # If an attribute was already changed to a different value in this change set, the latest value is used
+    # Input
+    # - Object type: ports, port_groups or filters
+    # - Object ID
+    # - Dictionary of attributes to change
+    # - Current object details with attributes the inventory doesn't keep, like filter criteria
+    def add(self, object_type, object_id, changes, current_details=None):
+        details = dict(self._get_object(object_type, object_id) or {})
+        details.update(current_details or {})
+        self.current[(object_type, object_id)] = details
+        self.names[(object_type, object_id)] = details.get('default_name') or details.get('name') or str(object_id)
+        pending_changes = self.changes[object_type].setdefault(object_id, {})
+        for key, value in changes.items():
+            if key in pending_changes and not changeset_value_matches(key, value, pending_changes[key]):
+                print("Warning: %s %s %s is changed more than once, using the latest value" % \
+                      (changeset_object_labels[object_type], self.names[(object_type, object_id)], key))
+            if key in details and key not in pending_changes and changeset_value_matches(key, value, details[key]):
+                continue
+            pending_changes[key] = value
+        if len(pending_changes) == 0:
+            del self.changes[object_type][object_id]
+
+    def add_port(self, port_id, changes):
+        self.add('ports', port_id, changes)
+
+    def add_port_group(self, pg_id, changes):
+        self.add('port_groups', pg_id, changes)
+
+    def add_filter(self, df_id, changes, current_details=None):
+        self.add('filters', df_id, changes, current_details)
+
+    # Add a new port group or filter to create. Objects are created before any objects of the same type are modified
+    # Input
+    # - Object type: port_groups or filters
+    # - Parameters to create the object with, including its name
+    # - Details to add to the inventory once created, in addition to the parameters
+    def add_create(self, object_type, params, details=None):
+        self.creates[object_type].append((params, details or {}))
+
+    # List pending creates and changes compared with the current state of the objects
+    # Returns a list of dictionaries with operation (create or modify), object type, ID, name, changes,
+    # and a description of each change, with members added to and removed from list attributes
+    def plan(self):
+        operation_list = []
+        for object_type in changeset_object_types:
+            for params, details in self.creates[object_type]:
+                description_list = ["%s %s" % (key, changeset_describe_value(params[key])) for key in sorted(params.keys()) if key != 'name']
+                operation_list.append({'operation': 'create', 'type': object_type, 'id': None, 'name': params.get('name'), 'changes': params, \
+                                       'description': description_list, 'removes': 0})
+            for object_id in sorted(self.changes[object_type].keys()):
+                changes = self.changes[object_type][object_id]
+                details = self.current.get((object_type, object_id), {})
+                description_list = []
+                remove_count = 0
+                for key in sorted(changes.keys()):
+                    if key in changeset_unordered_properties and isinstance(changes[key], list) and isinstance(details.get(key), list):
+                        added_list = [item for item in changes[key] if item not in details[key]]
+                        removed_list = [item for item in details[key] if item not in changes[key]]
+                        remove_count += len(removed_list)
+                        description_list.append("%s %s" % (key, " ".join(["+%s" % item for item in added_list] + ["-%s" % item for item in removed_list])))
+                    elif key in details:
+                        description_list.append("%s %s -> %s" % (key, changeset_describe_value(details[key]), changeset_describe_value(changes[key])))
+                    else:
+                        description_list.append("%s %s" % (key, changeset_describe_value(changes[key])))
+                operation_list.append({'operation': 'modify', 'type': object_type, 'id': object_id, 'name': self.names[(object_type, object_id)], \
+                                       'changes': changes, 'description': description_list, 'removes': remove_count})
+        return operation_list
+
+    # Changes pending for an object, None if there are none
+    def get(self, object_type, object_id):
+        return self.changes[object_type].get(object_id)
+
+    def __len__(self):
+        return sum(len(self.changes[object_type]) + len(self.creates[object_type]) for object_type in changeset_object_types)
+
+    # Read back all objects of a type that were written, with a single request where the NPB allows it
+    # Returns a dictionary of object details by ID. Objects that couldn't be read are left out
+    def _read_back(self, object_type, object_id_list):
+        properties = ['id']
+        for object_id in object_id_list:
+            properties.extend(key for key in self.changes[object_type][object_id] if key not in properties)
+        if object_type == 'ports':
+            return get_ports_properties(self.nto, object_id_list, ','.join(properties))
+        try:
+            object_list = nto_get_all_objects_properties(self.nto, object_type, ','.join(properties))
+        except Exception:
+            object_list = None
+        if isinstance(object_list, list):
+            return dict((obj['id'], obj) for obj in object_list if 'id' in obj)
+
+        if object_type == 'port_groups':
+            get_object = lambda object_id: self.nto.getPortGroup(str(object_id))
+        else:
+            get_object = lambda object_id: self.nto.getFilter(str(object_id))
+        details_list = {}
+        for object_id, details in run_in_parallel(get_object, object_id_list, self.max_workers):
+            if isinstance(details, dict):
+                details_list[object_id] = details
+        return details_list
+
+    # Create new objects, write all pending changes and verify them
+    # When only planning changes, the plan is printed and nothing is written
+    # Returns a report, a list of dictionaries with operation, object type, ID, name, changes, status (ok, failed or planned) and error
+    def apply(self):
+        report = []
+        if get_plan_only() and len(self) > 0:
+            operation_list = self.plan()
+            print_changeset_plan(operation_list)
+            for operation in operation_list:
+                report.append({'operation': operation['operation'], 'type': operation['type'], 'id': operation['id'], 'name': operation['name'], \
+                               'changes': operation['changes'], 'status': 'planned', 'error': None})
+            self._clear()
+            return report
+
+        for object_type in changeset_object_types:
+            for (params, details), new_object in run_in_parallel(lambda create: self._create(object_type, create[0]), \
+                                                                 self.creates[object_type], self.max_workers):
+                entry = {'operation': 'create', 'type': object_type, 'id': None, 'name': params.get('name'), 'changes': params, 'status': 'failed', 'error': None}
+                if isinstance(new_object, Exception):
+                    entry['error'] = str(new_object)
+                elif not isinstance(new_object, dict) or 'id' not in new_object:
+                    entry['error'] = "no ID returned"
+                else:
+                    entry['id'] = new_object['id']
+                    entry['status'] = 'ok'
+                    new_details = {'name': params.get('name'), 'default_name': params.get('name')}
+                    new_details.update(params)
+                    new_details.update(details)
+                    new_details['id'] = new_object['id']
+                    self._add_to_inventory(object_type, new_details)
+                report.append(entry)
+
+            object_id_list = sorted(self.changes[object_type].keys())
+            if len(object_id_list) == 0:
+                continue
+
+            results = {}
+            for object_id, result in run_in_parallel(lambda object_id: self._write(object_type, object_id, self.changes[object_type][object_id]), \
+                                                     object_id_list, self.max_workers):
+                results[object_id] = result
+
+            written_id_list = [object_id for object_id in object_id_list if not isinstance(results[object_id], Exception)]
+            details_list = self._read_back(object_type, written_id_list) if len(written_id_list) > 0 else {}
+            for object_id in object_id_list:
+                changes = self.changes[object_type][object_id]
+                entry = {'operation': 'modify', 'type': object_type, 'id': object_id, 'name': self.names[(object_type, object_id)], \
+                         'changes': changes, 'status': 'failed', 'error': None}
+                details = details_list.get(object_id)
+                if isinstance(results[object_id], Exception):
+                    entry['error'] = str(results[object_id])
+                elif details is None:
+                    entry['error'] = "can't read back to verify"
+                else:
+                    # Inventory gets the values the NPB has, whether or not they are the ones asked for
+                    self._update_inventory(object_type, object_id, dict((key, details[key]) for key in changes if key in details))
+                    mismatch_list = [key for key in changes if key not in details or not changeset_value_matches(key, changes[key], details[key])]
+                    if len(mismatch_list) > 0:
+                        entry['error'] = "%s not updated" % ", ".join(sorted(mismatch_list))
+                    else:
+                        entry['status'] = 'ok'
+                report.append(entry)
+
+        self._clear()
+        return report
+
+    def _clear(self):
+        for object_type in changeset_object_types:
+            self.changes[object_type] = {}
+            self.creates[object_type] = []
+        self.current = {}
+
+# Short description of an attribute value for a plan
+# Long lists, like address lists of filter criteria, are shown by their size only
+def changeset_summarize_value(value):
+    if isinstance(value, list) and len(value) > changeset_describe_list_limit:
+        return "<%d entries>" % len(value)
+    if isinstance(value, dict):
+        return dict((key, changeset_summarize_value(value[key])) for key in value)
+    return value
+
+def changeset_describe_value(value):
+    if isinstance(value, list) and len(value) > changeset_describe_list_limit:
+        return changeset_summarize_value(value)
+    if isinstance(value, list):
+        return "[%s]" % " ".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return json.dumps(changeset_summarize_value(value), sort_keys=True)
+    return str(value)
+
+# Print a plan of creates and changes, one line per object, followed by totals
+def print_changeset_plan(operation_list):
+    for operation in operation_list:
+        print("Plan: %s %s %s: %s" % (operation['operation'], changeset_object_labels[operation['type']].lower(), operation['name'], ", ".join(operation['description'])))
+    create_count = len([operation for operation in operation_list if operation['operation'] == 'create'])
+    print("Plan: %d to create, %d to modify, %d list members to remove" % \
+          (create_count, len(operation_list) - create_count, sum(operation['removes'] for operation in operation_list)))
+
+# Whether an object was changed successfully, or would be when only planning, according to a change set report
+def changeset_succeeded(report, object_type, object_id):
+    return any(entry['type'] == object_type and entry['id'] == object_id and entry['status'] != 'failed' for entry in report)
+
+# Whether all the objects of a change set report were changed successfully, or would be when only planning
+def changeset_report_succeeded(report):
+    return all(entry['status'] != 'failed' for entry in report)
+
+# Print a change set report, one line per object, followed by totals
+def print_changeset_report(report):
+    if len(report) == 0:
+        return
+    report = [entry for entry in report if entry['status'] != 'planned']
+    if len(report) == 0:
+        return
+    for entry in report:
+        operation = 'update' if entry['operation'] == 'modify' else 'creation'
+        if entry['status'] == 'ok':
+            print("%s %s %s succeeded: %s" % (changeset_object_labels[entry['type']], entry['name'], operation, ", ".join(sorted(entry['changes'].keys()))))
+        else:
+            print("%s %s %s failed: %s" % (changeset_object_labels[entry['type']], entry['name'], operation, entry['error']))
+    failed_count = len([entry for entry in report if entry['status'] != 'ok'])
+    print("Updated %d objects, %d failed" % (len(report) - failed_count, failed_count))
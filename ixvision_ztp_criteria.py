@@ -0,0 +1,567 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_criteria.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Merge values into dynamic filter criteria fields, keeping them as short as possible
+# 1. IPv4 address criteria (ipv4_src, ipv4_dst, ipv4_src_or_dst) are kept as sorted address ranges. Adding a prefix that is
+#    already covered is a no-op, adding a prefix drops the ones it contains, and removing a prefix out of a larger one splits it
+# 2. Once all values are merged, the ranges are split into the largest prefixes that fit, so that sibling prefixes are collapsed
+#    into their parent, producing the minimal set of CIDRs covering exactly the same addresses
+# 3. Values that are not IPv4 addresses or prefixes, and other list fields, are deduplicated with sets, keeping their order
+# 4. Prefixes that were already in the criteria keep their original spelling, so that an unchanged field stays unchanged
+# 5. Files with criteria values are read as a stream, without loading them whole: a JSON document, JSON documents one after another
+#    (newline-delimited JSON), or plain values one per line. Values are validated and normalized as they are read, and handed out
+#    in chunks of a limited size
+# 6. Criteria have a canonical form, with lists sorted and deduplicated and IPv4 lists collapsed, and a fingerprint of it. The fingerprint
+#    of the whole criteria written to a filter is kept as its keyword, so that whether the filter has some criteria can be told without reading them
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import re
+import json
+import socket
+import struct
+import hashlib
+
+# DEFINE VARs HERE
+criteria_ipv4_fields = ['ipv4_src', 'ipv4_dst', 'ipv4_src_or_dst']
+criteria_ipv4_address_pattern = re.compile(r'(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})\.(0|[1-9][0-9]{0,2})$')
+criteria_ipv4_unpack = struct.Struct('!I').unpack
+criteria_read_size = 65536              # Bytes to read from a criteria file at a time
+criteria_chunk_size_default = 10000     # Values to merge into filter criteria at a time
+criteria_fingerprint_prefix = 'ZTP-CRITERIA-'   # Filter keyword with a fingerprint of the criteria written by ZTP
+
+# DEFINE FUNCTIONS HERE
+
+# Parse an IPv4 address or prefix: a.b.c.d, a.b.c.d/len or a.b.c.d/m.m.m.m
+# Returns (network as an integer, prefix length) with host bits cleared, or None if the value is not one of these
+def parse_ipv4_prefix(value):
+    if not isinstance(value, str):
+        try:
+            value = str(value)
+        except Exception:
+            return None
+    address, slash, prefix = value.strip().partition('/')
+    if criteria_ipv4_address_pattern.match(address) is not None:
+        # Addresses without leading zeros, by far the most common, are converted by the socket library
+        try:
+            network = criteria_ipv4_unpack(socket.inet_aton(address))[0]
+        except socket.error:
+            return None
+    else:
+        octets = address.split('.')
+        if len(octets) != 4 or not all(octet.isdigit() and int(octet) <= 255 for octet in octets):
+            return None
+        network = (int(octets[0]) << 24) | (int(octets[1]) << 16) | (int(octets[2]) << 8) | int(octets[3])
+    if len(slash) == 0:
+        length = 32
+    elif prefix.isdigit() and int(prefix) <= 32:
+        length = int(prefix)
+    else:
+        mask = parse_ipv4_prefix(prefix)
+        if mask is None or mask[1] != 32:
+            return None
+        # Only contiguous netmasks can be written as a prefix length
+        length = bin(mask[0]).count('1')
+        if mask[0] != (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF:
+            return None
+    network &= (0xFFFFFFFF << (32 - length)) & 0xFFFFFFFF
+    return network, length
+
+def format_ipv4_prefix(network, length):
+    return "%d.%d.%d.%d/%d" % ((network >> 24) & 0xFF, (network >> 16) & 0xFF, (network >> 8) & 0xFF, network & 0xFF, length)
+
+# Merge overlapping and adjacent address ranges from a sorted list of (first, last) ranges
+def merge_ipv4_ranges(range_list):
+    merged_list = []
+    for first, last in range_list:
+        if len(merged_list) > 0 and first <= merged_list[-1][1] + 1:
+            if last > merged_list[-1][1]:
+                merged_list[-1] = (merged_list[-1][0], last)
+        else:
+            merged_list.append((first, last))
+    return merged_list
+
+# Set of IPv4 addresses kept as a sorted list of (first, last) address ranges that don't overlap or touch
+# Added and removed prefixes are collected and applied to the ranges in a single sorted pass before the next change of
+# operation, so that adding or removing many prefixes takes a sort rather than a pass over the ranges each
+class Ipv4PrefixSet(object):
+
+    def __init__(self):
+        self.ranges = []
+        self.pending = []               # Ranges added or removed since the ranges were last updated
+        self.pending_remove = False     # Whether pending ranges are to be removed
+
+    def _queue(self, network, length, remove):
+        if len(self.pending) > 0 and self.pending_remove != remove:
+            self._apply_pending()
+        self.pending_remove = remove
+        self.pending.append((network, network + (1 << (32 - length)) - 1))
+        # Pending ranges are applied once there are as many as there are ranges in the set, to keep memory to the size of the set
+        if len(self.pending) >= max(len(self.ranges), criteria_chunk_size_default):
+            self._apply_pending()
+
+    def _apply_pending(self):
+        if len(self.pending) == 0:
+            return
+        pending_list = merge_ipv4_ranges(sorted(self.pending))
+        self.pending = []
+        if not self.pending_remove:
+            self.ranges = merge_ipv4_ranges(sorted(self.ranges + pending_list))
+            return
+        # Cut the removed ranges out of the ones in the set, splitting those that contain them
+        range_list = []
+        index = 0
+        for first, last in self.ranges:
+            while index < len(pending_list) and pending_list[index][1] < first:
+                index += 1
+            remove_index = index
+            while remove_index < len(pending_list) and pending_list[remove_index][0] <= last:
+                if pending_list[remove_index][0] > first:
+                    range_list.append((first, pending_list[remove_index][0] - 1))
+                first = max(first, pending_list[remove_index][1] + 1)
+                remove_index += 1
+            if first <= last:
+                range_list.append((first, last))
+        self.ranges = range_list
+
+    # Add a prefix. Prefixes it covers, or that cover it, are merged with it
+    def add(self, network, length):
+        self._queue(network, length, False)
+
+    # Remove all addresses of a prefix. A shorter prefix covering it is split into the prefixes around it
+    def remove(self, network, length):
+        self._queue(network, length, True)
+
+    # Minimal list of (network, length) prefixes covering the set, in address order
+    # Each range is split into the largest aligned prefixes that fit in it, which also merges sibling prefixes into their parent
+    def prefixes(self):
+        self._apply_pending()
+        prefix_list = []
+        for first, last in self.ranges:
+            while first <= last:
+                size = first & -first if first > 0 else 1 << 32
+                while first + size - 1 > last:
+                    size >>= 1
+                prefix_list.append((first, 33 - size.bit_length()))
+                first += size
+        return prefix_list
+
+# IPv4 address list of a criteria field being merged into: a prefix set with the original spelling of its prefixes,
+# and values that aren't IPv4 addresses or prefixes, like address ranges, deduplicated in their original order
+# Spellings are only kept for prefixes that are still in the set: once there are many more of them than prefixes, the spellings of
+# prefixes that were collapsed into larger ones or removed are dropped, so that memory depends on the size of the resulting list
+class Ipv4ValueList(object):
+
+    def __init__(self, values=()):
+        self.prefix_set = Ipv4PrefixSet()
+        self.spellings = {}             # Original spelling of prefixes, by network and length packed in an integer to save memory
+        self.spelling_limit = criteria_chunk_size_default   # Spellings to collect before dropping the ones of prefixes no longer in the set
+        self.other_values = []
+        self.other_value_set = set()
+        self.add(values)
+
+    def add(self, values):
+        for value in values:
+            prefix = parse_ipv4_prefix(value)
+            if prefix is None:
+                if value not in self.other_value_set:
+                    self.other_value_set.add(value)
+                    self.other_values.append(value)
+                continue
+            self.spellings.setdefault((prefix[0] << 6) | prefix[1], value)
+            self.prefix_set.add(prefix[0], prefix[1])
+            if len(self.spellings) > self.spelling_limit:
+                self.drop_spellings()
+
+    # Drop spellings of prefixes that are no longer in the set, and let the ones left grow to twice as many before the next drop
+    def drop_spellings(self):
+        prefix_keys = set((network << 6) | length for network, length in self.prefix_set.prefixes())
+        self.spellings = dict((key, value) for key, value in self.spellings.items() if key in prefix_keys)
+        self.spelling_limit = max(criteria_chunk_size_default, 2 * len(self.spellings))
+
+    def remove(self, values):
+        for value in values:
+            prefix = parse_ipv4_prefix(value)
+            if prefix is None:
+                self.other_value_set.discard(value)
+            else:
+                self.prefix_set.remove(prefix[0], prefix[1])
+
+    # The list with duplicates removed and prefixes collapsed, other values after the prefixes
+    # Other values removed and added again are listed once, where they were first added
+    def values(self):
+        listed_values = set()
+        other_values = []
+        for value in self.other_values:
+            if value in self.other_value_set and value not in listed_values:
+                listed_values.add(value)
+                other_values.append(value)
+        self.other_values = other_values
+        new_values = [self.spellings.get((network << 6) | length) or format_ipv4_prefix(network, length) for network, length in self.prefix_set.prefixes()]
+        return new_values + self.other_values
+
+# Merge values into an IPv4 address list of a criteria field
+# Input
+# - Current list of addresses and prefixes
+# - Values to add
+# - Values to remove
+# Returns the new list with duplicates removed and prefixes collapsed. Values that aren't IPv4 addresses or prefixes are
+# deduplicated and kept after the prefixes, in their original order
+def merge_ipv4_values(current_values, append_values, remove_values):
+    value_list = Ipv4ValueList(current_values)
+    value_list.add(append_values)
+    value_list.remove(remove_values)
+    return value_list.values()
+
+# Merge values into a list that isn't an IPv4 address list: duplicates are dropped, order is kept
+def merge_list_values(current_values, append_values, remove_values):
+    remove_set = set(remove_values)
+    new_values = []
+    seen_values = set()
+    for value in list(current_values) + list(append_values):
+        if value not in seen_values and value not in remove_set:
+            seen_values.add(value)
+            new_values.append(value)
+    return new_values
+
+# Merger of values into a criteria field, like {"addr": [...]} of ipv4_src_or_dst, one set of values at a time
+# IPv4 address lists are held as prefix sets until the merged value is asked for, so that merging values in chunks
+# doesn't parse the lists merged so far again for each chunk
+class CriteriaFieldMerger(object):
+
+    def __init__(self, df_criterion, field_value):
+        self.df_criterion = df_criterion
+        self.field_value = dict(field_value)
+        self.entry_counts = {}          # Entries before the merge, by key for list values that were merged into
+        self.ipv4_lists = {}            # IPv4 address lists being merged into, by key
+
+    # Input
+    # - Dictionaries of values to add and remove, by key of the field
+    def merge(self, append_values, remove_values):
+        for key in self.field_value:
+            if not isinstance(self.field_value[key], list):
+                if key in append_values:
+                    self.field_value[key] = append_values[key]
+                continue
+            if key not in append_values and key not in remove_values:
+                continue
+            append_list = append_values.get(key, [])
+            if not isinstance(append_list, list):
+                append_list = [append_list]
+            remove_list = remove_values.get(key, [])
+            if not isinstance(remove_list, list):
+                remove_list = [remove_list]
+            self.entry_counts.setdefault(key, len(self.field_value[key]))
+            if self.df_criterion in criteria_ipv4_fields:
+                if key not in self.ipv4_lists:
+                    self.ipv4_lists[key] = Ipv4ValueList(self.field_value[key])
+                self.ipv4_lists[key].add(append_list)
+                self.ipv4_lists[key].remove(remove_list)
+            else:
+                self.field_value[key] = merge_list_values(self.field_value[key], append_list, remove_list)
+
+    # Returns the new value of the field, and a dictionary of (entries before, entries after) by key for list values
+    def value(self):
+        for key in self.ipv4_lists:
+            self.field_value[key] = self.ipv4_lists[key].values()
+        entry_counts = dict((key, (self.entry_counts[key], len(self.field_value[key]))) for key in self.entry_counts)
+        return dict(self.field_value), entry_counts
+
+# Merge values into a criteria field, like {"addr": [...]} of ipv4_src_or_dst
+# Input
+# - Criteria field name
+# - Current value of the field, a dictionary
+# - Dictionaries of values to add and remove, by key of the field
+# Returns the new value of the field, and a dictionary of (entries before, entries after) by key for list values
+def merge_criteria_field(df_criterion, field_value, append_values, remove_values):
+    merger = CriteriaFieldMerger(df_criterion, field_value)
+    merger.merge(append_values, remove_values)
+    return merger.value()
+
+# Normalize a criteria value as it is read. Returns None if the value isn't valid for the criteria field
+# IPv4 values have to be addresses, prefixes or address ranges (a.b.c.d-e.f.g.h). Prefixes with host bits set are rewritten without them
+def normalize_criteria_value(df_criterion, value):
+    if df_criterion not in criteria_ipv4_fields:
+        return value
+    if not isinstance(value, str):
+        try:
+            value = str(value)
+        except Exception:
+            return None
+    value = value.strip()
+    prefix = parse_ipv4_prefix(value)
+    if prefix is not None:
+        if '/' in value and parse_ipv4_prefix(value.split('/')[0])[0] != prefix[0]:
+            return format_ipv4_prefix(prefix[0], prefix[1])
+        return value
+    range_start, dash, range_end = value.partition('-')
+    if len(dash) > 0 and '/' not in value and parse_ipv4_prefix(range_start) is not None and parse_ipv4_prefix(range_end) is not None:
+        return value
+    return None
+
+# Incremental reader of JSON values from a file, holding only the part of the file being parsed
+class JsonStreamReader(object):
+
+    def __init__(self, f):
+        self.f = f
+        self.buffer = ''
+        self.offset = 0
+        self.consumed = 0               # Characters read before the buffer, to report error positions
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    # Read more of the file into the buffer. Returns False at the end of the file
+    def fill(self):
+        data = self.f.read(criteria_read_size)
+        if len(data) == 0:
+            self.eof = True
+            return False
+        self.consumed += self.offset
+        self.buffer = self.buffer[self.offset:] + data
+        self.offset = 0
+        return True
+
+    def error(self, message):
+        return ValueError("%s at character %d" % (message, self.consumed + self.offset))
+
+    # Next character after any white space, without consuming it. Empty at the end of the file
+    def peek(self):
+        while True:
+            while self.offset < len(self.buffer) and self.buffer[self.offset] in ' \t\r\n':
+                self.offset += 1
+            if self.offset < len(self.buffer) or not self.fill():
+                return self.buffer[self.offset:self.offset + 1]
+
+    def expect(self, chars):
+        char = self.peek()
+        if len(char) == 0 or char not in chars:
+            raise self.error("expected one of %s" % " ".join(chars))
+        self.offset += 1
+        return char
+
+    # Decode a complete JSON value, reading more of the file if it isn't all in the buffer yet
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.offset)
+            except ValueError:
+                if self.fill():
+                    continue
+                raise self.error("malformed JSON")
+            # A number at the end of the buffer, or followed by what can only be more of it, like 678 of 678.5, might continue in the next read
+            if self.buffer[self.offset] in '-0123456789' and (end == len(self.buffer) or self.buffer[end] in '0123456789.eE+-') and self.fill():
+                continue
+            self.offset = end
+            return value
+
+    # Rest of the current line as text
+    def line(self):
+        while self.buffer.find('\n', self.offset) < 0 and self.fill():
+            pass
+        end = self.buffer.find('\n', self.offset)
+        if end < 0:
+            end = len(self.buffer)
+        text = self.buffer[self.offset:end]
+        self.offset = min(end + 1, len(self.buffer))
+        return text
+
+    # Stream an object as (path, value, whether the value is a list member) events
+    # Objects are descended into, lists are streamed member by member
+    def stream_object(self, path):
+        self.expect('{')
+        if self.peek() == '}':
+            self.offset += 1
+            return
+        while True:
+            key = self.value()
+            if not isinstance(key, type(u'')) and not isinstance(key, str):
+                raise self.error("expected an object key")
+            self.expect(':')
+            char = self.peek()
+            if char == '{':
+                for event in self.stream_object(path + (key,)):
+                    yield event
+            elif char == '[':
+                for value in self.stream_list():
+                    yield (path + (key,), value, True)
+            else:
+                yield (path + (key,), self.value(), False)
+            if self.expect(',}') == '}':
+                return
+
+    def stream_list(self):
+        self.expect('[')
+        if self.peek() == ']':
+            self.offset += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',]') == ']':
+                return
+
+# Read criteria values from a file as a stream of (path, value, whether the value is a list member) events
+# The path is a tuple of object keys leading to the value. The file can have
+# - JSON objects, like {"addr": ["10.0.0.0/8", ...]}, one or many of them one after another
+# - JSON lists and values, or plain values, one per line, like 10.1.2.3. These are put under default_key
+# Lines starting with # are skipped. Raises ValueError if the file can't be parsed
+def iter_criteria_file(filename, default_key='addr'):
+    with open(filename) as f:
+        reader = JsonStreamReader(f)
+        while True:
+            char = reader.peek()
+            if len(char) == 0:
+                return
+            if char == '{':
+                for event in reader.stream_object(()):
+                    yield event
+                continue
+            if char == '#':
+                reader.line()
+                continue
+            if default_key is None:
+                raise reader.error("expected a JSON object")
+            if char == '[':
+                for value in reader.stream_list():
+                    yield ((default_key,), value, True)
+                continue
+            text = reader.line().strip()
+            try:
+                value = json.loads(text)
+            except ValueError:
+                value = text
+            yield ((default_key,), value, True)
+
+# Turn criteria values already in memory, like {"addr": [...]}, into the same events iter_criteria_file() produces
+def iter_criteria_dict(values, path=()):
+    for key in values:
+        if isinstance(values[key], dict):
+            for event in iter_criteria_dict(values[key], path + (key,)):
+                yield event
+        elif isinstance(values[key], list):
+            for value in values[key]:
+                yield (path + (key,), value, True)
+        else:
+            yield (path + (key,), values[key], False)
+
+# Group criteria values of a field, read with iter_criteria_file(), into chunks
+# Input
+# - Criteria field name, to validate and normalize values for
+# - Events from iter_criteria_file()
+# - Maximum number of values in a chunk
+# Yields (dictionary of values by key of the field, number of values, number of values skipped as not valid)
+# List members are collected into lists, other values replace the previous ones
+def iter_criteria_chunks(df_criterion, events, chunk_size=criteria_chunk_size_default):
+    chunk = {}
+    value_count = 0
+    invalid_count = 0
+    for path, value, in_list in events:
+        key = path[-1]
+        value = normalize_criteria_value(df_criterion, value) if in_list else value
+        if value is None:
+            invalid_count += 1
+            continue
+        if in_list:
+            chunk.setdefault(key, []).append(value)
+        else:
+            chunk[key] = value
+        value_count += 1
+        if value_count >= chunk_size:
+            yield chunk, value_count, invalid_count
+            chunk, value_count, invalid_count = {}, 0, 0
+    if value_count > 0 or invalid_count > 0:
+        yield chunk, value_count, invalid_count
+
+# Load filter criteria from a file, reading it as a stream
+# Address lists of IPv4 criteria fields are validated and collapsed as they are read, so that memory depends on
+# the size of the resulting criteria rather than the size of the file
+# Returns the criteria and the number of values skipped as not valid. Raises ValueError if the file can't be parsed
+def load_criteria_file(filename):
+    criteria = {}
+    invalid_count = 0
+    ipv4_lists = {}                     # IPv4 address lists being read, by path
+    for path, value, in_list in iter_criteria_file(filename, None):
+        parent = criteria
+        for key in path[:-1]:
+            if not isinstance(parent.get(key), dict):
+                parent[key] = {}
+            parent = parent[key]
+        if not in_list:
+            parent[path[-1]] = value
+            continue
+        if path[0] in criteria_ipv4_fields:
+            value = normalize_criteria_value(path[0], value)
+            if value is None:
+                invalid_count += 1
+                continue
+            if path not in ipv4_lists:
+                ipv4_lists[path] = Ipv4ValueList()
+            ipv4_lists[path].add([value])
+            parent[path[-1]] = []
+            continue
+        if not isinstance(parent.get(path[-1]), list):
+            parent[path[-1]] = []
+        parent[path[-1]].append(value)
+    for path in ipv4_lists:
+        parent = criteria
+        for key in path[:-1]:
+            parent = parent[key]
+        parent[path[-1]] = ipv4_lists[path].values()
+    return criteria, invalid_count
+
+# Canonical form of filter criteria, the same for any criteria that match the same traffic
+# Lists are deduplicated and sorted, IPv4 address lists are collapsed into the minimal set of prefixes, strings are stripped
+# and whole floats become integers
+def canonical_criteria(criteria, df_criterion=None):
+    if isinstance(criteria, dict):
+        return dict((key, canonical_criteria(value, df_criterion or key)) for key, value in criteria.items())
+    if isinstance(criteria, list):
+        value_list = []
+        ipv4_values = []
+        if df_criterion in criteria_ipv4_fields:
+            prefix_set = Ipv4PrefixSet()
+            for value in criteria:
+                prefix = parse_ipv4_prefix(value) if isinstance(value, str) or isinstance(value, type(u'')) else None
+                if prefix is None:
+                    value_list.append(canonical_criteria(value, df_criterion))
+                else:
+                    prefix_set.add(prefix[0], prefix[1])
+            # Prefixes of the set are unique and in address order already
+            ipv4_values = [format_ipv4_prefix(network, length) for network, length in prefix_set.prefixes()]
+        else:
+            value_list = [canonical_criteria(value, df_criterion) for value in criteria]
+        unique_values = dict((json.dumps(value, sort_keys=True), value) for value in value_list)
+        return ipv4_values + [unique_values[key] for key in sorted(unique_values.keys())]
+    if isinstance(criteria, float) and criteria.is_integer():
+        return int(criteria)
+    if isinstance(criteria, str) or isinstance(criteria, type(u'')):
+        return criteria.strip()
+    return criteria
+
+# Fingerprint of filter criteria, a hash of their canonical form
+# Filters are tagged with the fingerprint of all of their criteria as written, including fields kept from before. Criteria with the same
+# fingerprint are the same as those of the filter, while criteria that are only a part of the filter's have a different one
+def criteria_fingerprint(criteria):
+    canonical = json.dumps(canonical_criteria(criteria), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()[:16].upper()
+
+def criteria_fingerprint_keyword(criteria):
+    return criteria_fingerprint_prefix + criteria_fingerprint(criteria)
+
+# Whether two sets of criteria match the same traffic
+def criteria_match(criteria, other_criteria):
+    return canonical_criteria(criteria) == canonical_criteria(other_criteria)
+
+# Replace the criteria fingerprint among filter keywords with the one for new criteria
+def set_criteria_fingerprint_keyword(keywords, criteria):
+    keyword_list = [keyword for keyword in keywords or [] if not str(keyword).upper().startswith(criteria_fingerprint_prefix)]
+    return keyword_list + [criteria_fingerprint_keyword(criteria)]
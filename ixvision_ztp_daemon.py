@@ -0,0 +1,228 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_daemon.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Long-running ixvztp server and its thin client, talking over a Unix domain socket
+# 1. "ixvztp serve" keeps NPB sessions, inventories and cached information in memory between requests
+# 2. A client sends its command line and working directory as a single JSON line, and gets back output of the action
+#    as it is printed, followed by the exit code. The password from IXVZTP_PASSWORD is sent along, as it is not on the command line
+# 3. The client only needs the standard library, so that it starts without loading the action modules
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import sys
+import json
+import signal
+import socket
+import threading
+try:
+    import socketserver
+except ImportError:
+    import SocketServer as socketserver
+
+# DEFINE VARs HERE
+ztp_socket_path_default = os.path.join(os.path.expanduser('~'), '.ixvztp', 'ixvztp.sock')
+ztp_server_env = 'IXVZTP_SERVER'        # Environment variable with a socket path, to run all ixvztp commands as a client
+ztp_password_env = 'IXVZTP_PASSWORD'    # Environment variable with the NPB password, to keep it off the command line
+# Global ixvztp options that take a value, to tell the action apart from option values without loading the argument parser
+ztp_global_value_options = ['-u', '--username', '-p', '--password', '-d', '--hostname', '-r', '--port', '-I', '--inventory', '-j', '--jobs', \
+                            '--metrics-dir', '--log-file', '--log-payload-max', '--log-sample']
+
+# Request served by the current thread
+ztp_request_context = threading.local()
+
+# DEFINE FUNCTIONS HERE
+
+def get_ztp_request():
+    return getattr(ztp_request_context, 'request', None)
+
+def set_ztp_request(request):
+    ztp_request_context.request = request
+
+# Path of a file named on the command line. Relative paths are relative to the working directory of the client, when serving a request
+def ztp_path(path):
+    request = get_ztp_request()
+    if request is None or os.path.isabs(path):
+        return path
+    return os.path.join(request['cwd'], path)
+
+# NPB password: the one given on the command line, otherwise the one from the environment of the client when serving a request, or of this process
+def ztp_password(password=None):
+    if password is not None:
+        return password
+    request = get_ztp_request()
+    if request is not None:
+        return request.get('password')
+    return os.environ.get(ztp_password_env)
+
+# Standard output and error replacement that sends output of threads serving a request to the client
+class ZtpRequestOutput(object):
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, data):
+        request = get_ztp_request()
+        if request is None:
+            self.stream.write(data)
+        else:
+            request['send']({'output': data})
+
+    def flush(self):
+        self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+class ZtpServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+class ZtpRequestHandler(socketserver.StreamRequestHandler):
+
+    def handle(self):
+        send_lock = threading.Lock()
+
+        def send(message):
+            with send_lock:
+                try:
+                    self.wfile.write((json.dumps(message) + '\n').encode('utf-8'))
+                    self.wfile.flush()
+                except Exception:
+                    pass                # Client has gone away, the action still runs to the end
+
+        try:
+            request = json.loads(self.rfile.readline().decode('utf-8'))
+            argv = [str(arg) for arg in request['argv']]
+            cwd = str(request.get('cwd', '/'))
+            password = str(request['password']) if request.get('password') is not None else None
+        except Exception:
+            send({'output': "Error: malformed request\n"})
+            send({'exit_code': 2})
+            return
+
+        set_ztp_request({'cwd': cwd, 'password': password, 'send': send})
+        try:
+            exit_code = self.server.run_command(argv)
+        except SystemExit as e:
+            exit_code = e.code
+        except Exception as e:
+            send({'output': "Error: %s\n" % e})
+            exit_code = 1
+        finally:
+            set_ztp_request(None)
+        if exit_code is None:
+            exit_code = 0
+        elif not isinstance(exit_code, int):
+            send({'output': "%s\n" % exit_code})
+            exit_code = 1
+        send({'exit_code': exit_code})
+
+# Serve ixvztp requests until interrupted
+# Input
+# - Path of the Unix domain socket to listen on
+# - Function to run a command, taking ixvztp command line arguments. Returns or exits with the exit code
+def serve_ztp_requests(socket_path, run_command):
+    socket_dir = os.path.dirname(socket_path)
+    if len(socket_dir) > 0 and not os.path.isdir(socket_dir):
+        os.makedirs(socket_dir, 0o700)
+    if os.path.exists(socket_path):
+        # Remove a socket left by a previous server, unless it is still running
+        probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            probe.connect(socket_path)
+            probe.close()
+            print("Error: another ixvztp server is already listening on %s" % socket_path)
+            return False
+        except socket.error:
+            os.remove(socket_path)
+
+    # Sessions to NPBs are kept by the server, so only the current user may connect
+    old_umask = os.umask(0o077)
+    try:
+        server = ZtpServer(socket_path, ZtpRequestHandler)
+    finally:
+        os.umask(old_umask)
+    server.run_command = run_command
+    sys.stdout = ZtpRequestOutput(sys.stdout)
+    sys.stderr = ZtpRequestOutput(sys.stderr)
+    # Stop the same way on SIGTERM as on Ctrl-C, so that the socket is removed and metrics and the log are saved
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    print("Serving ixvztp requests on %s" % socket_path)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.remove(socket_path)
+    return True
+
+# Action of an ixvztp command line: the first argument that is neither a global option nor the value of one
+def ztp_argv_action(argv):
+    i = 0
+    while i < len(argv):
+        if argv[i] in ztp_global_value_options:
+            i += 2
+        elif argv[i].startswith('-'):
+            i += 1
+        else:
+            return argv[i]
+    return None
+
+# Find out if the command line asks to run as a client: with --server [socket] before the action, or with the IXVZTP_SERVER variable set
+# Returns the socket path, or None, and the command line without the --server option
+def split_ztp_client_argv(argv):
+    socket_path = os.environ.get(ztp_server_env)
+    client_argv = list(argv)
+    for i in range(len(argv)):
+        if argv[i] == '--server':
+            socket_path = ztp_socket_path_default
+            if i + 1 < len(argv) and os.path.isabs(argv[i + 1]):
+                socket_path = argv[i + 1]
+                del client_argv[i + 1]
+            del client_argv[i]
+            break
+        elif argv[i].startswith('--server='):
+            socket_path = argv[i][len('--server='):]
+            del client_argv[i]
+            break
+    if ztp_argv_action(client_argv) == 'serve':
+        return None, argv
+    return socket_path, client_argv
+
+# Run a command on an ixvztp server, printing its output as it comes
+# Returns the exit code of the command
+def run_ztp_client(socket_path, argv):
+    client = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        client.connect(socket_path)
+    except socket.error as e:
+        print("Error: can't connect to ixvztp server on %s: %s" % (socket_path, e))
+        return 2
+    client_file = client.makefile('rwb')
+    request = {'argv': argv, 'cwd': os.getcwd()}
+    if os.environ.get(ztp_password_env) is not None:
+        request['password'] = os.environ.get(ztp_password_env)
+    client_file.write((json.dumps(request) + '\n').encode('utf-8'))
+    client_file.flush()
+    exit_code = 1
+    for line in client_file:
+        message = json.loads(line.decode('utf-8'))
+        if 'output' in message:
+            sys.stdout.write(message['output'])
+            sys.stdout.flush()
+        if 'exit_code' in message:
+            exit_code = message['exit_code']
+            break
+    client_file.close()
+    client.close()
+    return exit_code
@@ -7,12 +7,19 @@
 #
 # Description: A module to create/update a dynamic filter between network and tool port groups 
 # 1. Starting point is an Ixia Vision NPB with network and tool port groups formed
-# 2. Each run of this script would configure a single dynamic filter using supplied name and filter criteria
+# 2. Each run of this script would configure a single dynamic filter using supplied name and filter criteria, or all dynamic filters listed in a manifest
 #  - Search for an existing DF with the same name. If found with the matching type, continue by referencing that DF
 #  - If not found, create a new DF
 # 3. Update the DF criteria with provided rules
 # 4. Search for network port group with a specified name and, if found, connect it to the input of the DF
 # 5. Search for tool port group with a specified name and, if found, connect it to the output of the DF
+# 6. All DFs and port groups are looked up in a single listing pass, and all DFs are created or updated at the same time, with a table of results
+# 7. Only attributes of the DF that differ from the requested ones are written, so running the same command again makes no changes
+# 8. A fingerprint of the whole criteria written to a DF is kept as its keyword, by both forming and updating DFs. When the requested criteria
+#    have the same fingerprint, the DF has exactly those criteria and they are not read. When the DF kept other criteria fields, the
+#    fingerprint covers those too and doesn't match, so the criteria are read and compared
+# 9. Criteria updates read their values as a stream and merge them into the criteria in chunks, so large address feeds don't need to fit in memory.
+#    The merged criteria are written to the DF once, and nothing is written if the values can't be read
 #
 # COPYRIGHT 2018 - 2019 Keysight Technologies.
 #
@@ -21,14 +28,24 @@
 #
 ###############################################################################
 
+import copy
+import json
+
 from ksvisionlib import *
 
 from ixvision_ztp_ntolib import *
+from ixvision_ztp_changeset import *
+from ixvision_ztp_criteria import *
 
 # DEFINE VARs HERE
 # NOTE - Priority-based filtering mode is not supported, but we don't check if the system is in such mode
 df_modes_supported = {'all': 'PASS_ALL', 'none': 'DISABLE', 'pbc': 'PASS_BY_CRITERIA', 'dbc': 'DENY_BY_CRITERIA', 'pbcu': 'PBC_UNMATCHED', 'dbcm': 'DBC_MATCHED'}
 
+# Manifest example, a list of filters to form. Criteria are given inline or as a name of a criteria file:
+# [{"name": "AllTraffic", "input": "TAPs", "output": "PROBES", "mode": "all"},
+#  {"name": "Blocklist", "input": "SPANs", "output": "PROBES", "mode": "pbc", "criteria": "blocklist.json"},
+#  {"name": "Web", "input": "tap", "output": "probe", "mode": "pbc", "criteria": {"layer4_dst_port": {"port": 80}}, "tag_mode": true}]
+
 # DEFINE FUNCTIONS HERE
 
 # Check if DF mode used requires a criteria
@@ -38,7 +55,11 @@ def df_criteria_required(df_mode):
 ## Search for port groups and return a list if IDs
 def search_port_group_id_list(nto, params):
     pg_id_list = []
-    pg_list = nto.searchPortGroups(params)
+    if list(params.keys()) == ['name']:
+        # Name lookups are served from the inventory
+        pg_list = get_nto_inventory(nto).search_port_groups(params['name'])
+    else:
+        pg_list = nto.searchPortGroups(params)
     for pg in pg_list:
         pg_id_list.append(pg['id'])
     return pg_id_list
@@ -46,149 +67,306 @@ def search_port_group_id_list(nto, params):
 ## Remove empty port groups from a list if port group IDs
 def remove_empty_port_groups_from_id_list(nto, pg_id_list):
     non_empty_pg_id_list = []
+    inventory = get_nto_inventory(nto)
     for pg_id in pg_id_list:
-        pg_port_list = nto.getPortGroupProperty(str(pg_id), 'port_list')
+        pg = inventory.get_port_group(pg_id)
+        if pg is not None:
+            pg_port_list = pg['port_list']
+        else:
+            pg_port_list = nto.getPortGroupProperty(str(pg_id), 'port_list')
         if isinstance(pg_port_list, list) and len(pg_port_list) > 0:
             non_empty_pg_id_list.append(pg_id)
     return non_empty_pg_id_list
 
+# Parse a dynamic filter manifest: a list of filters, or an object with such a list under "filters"
+# Criteria can be given inline, or as a name of a file to load them from, which is left to the caller
+# Returns a list of filters with name, input, output, mode, criteria and tag mode, and None, or None and an error message
+def parse_filter_manifest(manifest):
+    if isinstance(manifest, dict):
+        manifest = manifest.get('filters')
+    if not isinstance(manifest, list) or len(manifest) == 0:
+        return None, "a non-empty list of filters is expected"
+    df_list = []
+    for df_spec in manifest:
+        if not isinstance(df_spec, dict) or 'name' not in df_spec or 'input' not in df_spec or 'output' not in df_spec or 'mode' not in df_spec:
+            return None, "each filter needs a name, input, output and mode: %s" % json.dumps(df_spec)
+        if df_spec['mode'] not in df_modes_supported:
+            return None, "filter %s mode %s is not one of %s" % (df_spec['name'], df_spec['mode'], ", ".join(df_modes_supported.keys()))
+        criteria = df_spec.get('criteria')
+        if df_criteria_required(df_spec['mode']) and (criteria is None or isinstance(criteria, dict) and len(criteria) == 0):
+            return None, "filter %s needs criteria for mode %s" % (df_spec['name'], df_spec['mode'])
+        if criteria is not None and not isinstance(criteria, dict) and not isinstance(criteria, type(u'')) and not isinstance(criteria, str):
+            return None, "filter %s criteria have to be an object or a file name" % df_spec['name']
+        if df_spec['name'] in [df['name'] for df in df_list]:
+            return None, "filter %s is listed more than once" % df_spec['name']
+        df_list.append({'name': df_spec['name'], 'input': df_spec['input'], 'output': df_spec['output'], 'mode': df_spec['mode'], \
+                        'criteria': criteria, 'tag_mode': bool(df_spec.get('tag_mode', False))})
+    return df_list, None
+
+# Read the criteria of a set of existing filters, with a single request where the NPB allows it
+# Returns a dictionary of criteria by filter ID. Filters that couldn't be read are left out
+def get_filters_criteria(nto, df_id_list):
+    try:
+        df_list = nto_get_all_objects_properties(nto, 'filters', 'id,criteria')
+    except Exception:
+        df_list = None
+    if isinstance(df_list, list):
+        return dict((df['id'], df['criteria']) for df in df_list if 'id' in df and 'criteria' in df and df['id'] in df_id_list)
+    df_criteria_list = {}
+    for df_id, df_criteria in run_in_parallel(lambda df_id: nto.getFilterProperty(str(df_id), 'criteria'), df_id_list, bulk_fetch_concurrency):
+        if isinstance(df_criteria, dict):
+            df_criteria_list[df_id] = df_criteria
+    return df_criteria_list
+
+# Print results of forming filters, one row per filter
+def print_filter_results(df_plan_list):
+    name_width = max([len('Filter')] + [len(str(df_plan['name'])) for df_plan in df_plan_list])
+    print("%s  %-8s  %-9s  %s" % ('Filter'.ljust(name_width), 'Action', 'Result', 'Details'))
+    for df_plan in df_plan_list:
+        print("%s  %-8s  %-9s  %s" % (str(df_plan['name']).ljust(name_width), df_plan['action'], df_plan['result'], df_plan['details']))
+    failed_count = len([df_plan for df_plan in df_plan_list if df_plan['result'] in ['failed', 'skipped']])
+    print("Formed %d filters, %d failed or skipped" % (len(df_plan_list) - failed_count, failed_count))
+
 ## Filter create/update
 
 # Input 
 # - Connection to an NPB
-# - Dynamic filter name
-# - Network port group name
-# - Tool port group name
-# - DF mode - use keys from df_modes_supported global dict
+# - List of filters to form, each with
+#   - Dynamic filter name
+#   - Network port group name, or tag of input ports in tag mode
+#   - Tool port group name, or tag of output ports in tag mode
+#   - DF mode - use keys from df_modes_supported global dict
+#   - Criteria, required for pbc and dbc modes
+#   - Whether to connect ports with tags instead of port groups
+# All filters and port groups are looked up in the inventory, loaded once, and all filters are written at the same time
+# Returns False if any of the filters failed or was skipped
 
-def form_dynamic_filter(host_ip, port, username, password, df_name, df_input, df_output, df_mode, df_criteria = {}, use_tag_mode = False):
+def form_dynamic_filters(host_ip, port, username, password, df_list):
     
-    df_params = {}
-    df_mode_value = 'DISABLE'                           # Default DF mode value for a new filter to use, if not overridden
+    nto = nto_connect(host_ip, port, username, password)
+    inventory = get_nto_inventory(nto)
 
-    if isinstance(df_modes_supported, dict) and df_mode in df_modes_supported.keys():
-        df_mode_value = df_modes_supported[df_mode]
-        
-    if df_criteria_required(df_mode) and (isinstance(df_criteria, dict) and len(df_criteria) == 0 or not isinstance(df_criteria, dict)):
-        print("Non-empty criteria are required for filter mode %s" % (df_mode))
-        return
-                
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_ztp_filter_debug.log")
-
-    # Search for existing DF, create a new one if not found
-    df_list = nto.searchFilters({'name': df_name})
-    ztp_df = None
-    ztp_df_source_port_group_id_list = []
-    ztp_df_dest_port_group_id_list = []
-    if len(df_list) == 0:
-        # No existing filter with such name, will create a new one
-        df_params.update({'name': df_name, 'keywords': ['ZTP'], 'mode': df_mode_value})
-        if isinstance(df_criteria, dict) and len(df_criteria) > 0:
-            df_params.update({'criteria': df_criteria})
-        new_df = nto.createFilter(df_params, True) # the last parameter is for allowTemporayDataLoss
-        if new_df is not None and len(new_df) > 0:
-            print("No existing DF found, created a new one with id %s" % (str(new_df['id'])))
-            ztp_df = new_df
+    df_plan_list = []                   # Filters to form, with their existing details and requested attributes
+    for df_spec in df_list:
+        df_name = df_spec['name']
+        df_mode = df_spec['mode']
+        df_criteria = df_spec.get('criteria') or {}
+        df_plan = {'name': df_name, 'filter': None, 'params': {}, 'action': '-', 'result': 'skipped', 'details': ''}
+        df_plan_list.append(df_plan)
+
+        df_mode_value = 'DISABLE'                           # Default DF mode value for a new filter to use, if not overridden
+        if isinstance(df_modes_supported, dict) and df_mode in df_modes_supported.keys():
+            df_mode_value = df_modes_supported[df_mode]
+            
+        if df_criteria_required(df_mode) and (isinstance(df_criteria, dict) and len(df_criteria) == 0 or not isinstance(df_criteria, dict)):
+            print("Non-empty criteria are required for filter mode %s" % (df_mode))
+            df_plan['details'] = "criteria are required for mode %s" % df_mode
+            continue
+
+        # Find what the DF has to be connected to
+        if not df_spec.get('tag_mode'):
+            # Search for network and tool port groups matching given names. 
+            # Make sure they are not empty before connecting to filters, since ports can't be added later to an empty but connected port group
+            df_plan['source_key'], df_plan['dest_key'] = 'source_port_group_list', 'dest_port_group_list'
+            df_plan['source_id_list'] = remove_empty_port_groups_from_id_list(nto, search_port_group_id_list(nto, {'name': df_spec['input']}))
+            df_plan['dest_id_list'] = remove_empty_port_groups_from_id_list(nto, search_port_group_id_list(nto, {'name': df_spec['output']}))
         else:
-            print("No existing DF found, failed to created a new one!")
-            return
-    elif len(df_list) == 1:
+            # Connect input and output ports using tags
+            df_plan['source_key'], df_plan['dest_key'] = 'source_port_list', 'dest_port_list'
+            df_plan['source_id_list'] = search_df_tag_ports(nto, [df_spec['input']], 'input') or []
+            df_plan['dest_id_list'] = search_df_tag_ports(nto, [df_spec['output']], 'output') or []
+
+        # Search for existing DF, a new one will be created if not found
+        df_found_list = inventory.search_filters(df_name)
+        if len(df_found_list) > 1:
+            # This should never happen, but just in case, provide details to look into
+            print("Found more than one DF named %s, can't continue:" % (df_name)),
+            for df_details in df_found_list:
+                print (" %s," % (df_details['default_name'])),
+            print("")
+            df_plan['details'] = "more than one filter with this name"
+            continue
+        if len(df_found_list) == 1:
+            df_plan['filter'] = df_found_list[0]
+        df_plan['params'] = {'mode': df_mode_value, 'criteria': df_criteria}
+        df_plan['result'] = None
+
+    # Criteria of existing filters aren't a part of the inventory, they are read for all of them at once
+    # Filters with a fingerprint keyword of the requested criteria have exactly these criteria, and their criteria aren't read
+    df_id_list = [df_plan['filter']['id'] for df_plan in df_plan_list if df_plan['filter'] is not None and df_plan['result'] is None and len(df_plan['params']['criteria']) > 0 \
+                  and criteria_fingerprint_keyword(df_plan['params']['criteria']) not in df_plan['filter'].get('keywords', [])]
+    df_criteria_list = get_filters_criteria(nto, df_id_list) if len(df_id_list) > 0 else {}
+
+    changeset = NpbChangeSet(nto)
+    for df_plan in df_plan_list:
+        if df_plan['result'] is not None:
+            continue
+        df_params = {'mode': df_plan['params']['mode']}
+        df_criteria = df_plan['params']['criteria']
+        source_key, dest_key = df_plan['source_key'], df_plan['dest_key']
+        if df_plan['filter'] is None:
+            # No existing filter with such name, will create a new one, connected from the start
+            df_plan['action'] = 'create'
+            df_params.update({'name': df_plan['name'], 'keywords': ['ZTP']})
+            if isinstance(df_criteria, dict) and len(df_criteria) > 0:
+                df_params.update({'criteria': df_criteria, 'keywords': ['ZTP', criteria_fingerprint_keyword(df_criteria)]})
+            if len(df_plan['source_id_list']) > 0:
+                df_params[source_key] = df_plan['source_id_list']
+            if len(df_plan['dest_id_list']) > 0:
+                df_params[dest_key] = df_plan['dest_id_list']
+            changeset.add_create('filters', df_params)
+            continue
+
         # An existing DF found
-        df = df_list[0]
-        df_details = nto.getFilter(str(df['id'])) # TODO handle 404 not found situation
-        ztp_df = df
-        ztp_df_source_port_group_id_list = df_details['source_port_group_list']
-        ztp_df_dest_port_group_id_list = df_details['dest_port_group_list']
-        print("Found an existing DF %s in %s mode" % (df_details['default_name'], df_details['mode']))
-        df_needs_updating = False
+        df_details = dict(df_plan['filter'])
+        df_plan['action'] = 'modify'
+        if len(df_plan_list) == 1:
+            print("Found an existing DF %s in %s mode" % (df_details['default_name'], df_details['mode']))
         # TODO update keywords with ZTP
-        if df_mode_value != df_details['mode']:
-            print("Updating DF %s to a new mode %s" % (df_details['default_name'], df_mode_value))
-            df_params.update({'mode': df_mode_value})
-            df_needs_updating = True
-        if isinstance(df_criteria, dict) and len(df_criteria) > 0:
-            df_criteria.update(df_details['criteria'])
-            if df_criteria != df_details['criteria']:
-                print("Updating DF %s criteria" % (df_details['default_name']))
-                df_params.update({'criteria': df_criteria})
-                df_needs_updating = True
-        if df_needs_updating:
-            nto.modifyFilter(str(df['id']), df_params)
-        # TODO handle errors
-    else:
-        # This should never happen, but just in case, provide details to look into
-        print("Found more than one DF named %s, can't continue:" % (df_name)),
-        for df in df_list:
-            df_details = nto.getFilter(str(df['id']))
-            if df_details is not None:
-                print (" %s," % (df_details['default_name'])),
-        print("")
-        return
-        
-    # TODO update DF criteria
-    
-    if not use_tag_mode:
-        # Search for network and tool port groups matching given names. 
-        # Make sure they are not empty before connecting to filters, since ports can't be added later to an empty but connected port group
-            
-        ztp_df_source_port_group_id_list.extend(remove_empty_port_groups_from_id_list(nto, search_port_group_id_list(nto, {'name': df_input})))
-        ztp_df_dest_port_group_id_list.extend  (remove_empty_port_groups_from_id_list(nto, search_port_group_id_list(nto, {'name': df_output})))
-    
-        # TODO update DF connections only if there is an actual change in list of PGs connected to it
-        df_params.update({'source_port_group_list': ztp_df_source_port_group_id_list, 'dest_port_group_list': ztp_df_dest_port_group_id_list})
-        nto.modifyFilter(str(ztp_df['id']), df_params)
-    else:
-        # Connect input ports using tags
-        df_connect_via_tags(nto, str(ztp_df['id']), [df_input], 'input')
-        # Connect output ports using tags
-        df_connect_via_tags(nto, str(ztp_df['id']), [df_output], 'output')
+        if isinstance(df_criteria, dict) and len(df_criteria) > 0 and df_details['id'] in df_id_list:
+            if df_details['id'] not in df_criteria_list:
+                df_plan['result'] = 'failed'
+                df_plan['details'] = "can't read current criteria"
+                continue
+            # Requested criteria fields replace the current ones, other fields in use are kept
+            # The fingerprint is of the criteria written, with the kept fields, the same as dfupdate writes
+            df_details['criteria'] = df_criteria_list[df_details['id']]
+            df_criteria = dict(df_details['criteria'])
+            df_criteria.update(df_plan['params']['criteria'])
+            df_params.update({'criteria': df_criteria, 'keywords': set_criteria_fingerprint_keyword(df_details['keywords'], df_criteria)})
+        # New connections are added to the existing ones
+        df_params[source_key] = list(df_details[source_key]) + [i for i in df_plan['source_id_list'] if i not in df_details[source_key]]
+        df_params[dest_key] = list(df_details[dest_key]) + [i for i in df_plan['dest_id_list'] if i not in df_details[dest_key]]
+        # Only the attributes that differ from the current ones are written, if any
+        changeset.add_filter(df_details['id'], df_params, df_details)
+        if changeset.get('filters', df_details['id']) is None:
+            df_plan['result'] = 'unchanged'
+            if len(df_plan_list) == 1:
+                print("No changes to DF %s are needed" % df_plan['name'])
+
+    # All filters are created and modified at the same time
+    report = changeset.apply() if len(changeset) > 0 else []
+    for df_plan in df_plan_list:
+        if df_plan['result'] is not None:
+            continue
+        if df_plan['filter'] is None:
+            df_report = [entry for entry in report if entry['operation'] == 'create' and entry['name'] == df_plan['name']]
+        else:
+            df_report = [entry for entry in report if entry['operation'] == 'modify' and entry['id'] == df_plan['filter']['id']]
+        if len(df_report) == 0:
+            continue
+        entry = df_report[0]
+        df_plan['result'] = entry['status']
+        if entry['status'] == 'failed':
+            df_plan['details'] = entry['error']
+        elif entry['operation'] == 'create':
+            df_plan['details'] = "id %s" % str(entry['id'])
+        else:
+            df_plan['details'] = ", ".join(sorted(entry['changes'].keys()))
+        if len(df_plan_list) > 1 or entry['status'] == 'planned':
+            continue
+        if entry['operation'] == 'create' and entry['status'] == 'ok':
+            print("No existing DF found, created a new one with id %s" % (str(entry['id'])))
+        elif entry['operation'] == 'create':
+            print("No existing DF found, failed to created a new one! (%s)" % entry['error'])
+        elif entry['status'] == 'ok':
+            print("Updated DF %s %s" % (entry['name'], ", ".join(sorted(entry['changes'].keys()))))
+        else:
+            print("Updating DF %s failed: %s" % (entry['name'], entry['error']))
+
+    # A single filter is reported as it is formed, many are summarized in a table
+    if len(df_plan_list) > 1 and not get_plan_only():
+        print_filter_results(df_plan_list)
+    return not any(df_plan['result'] in ['failed', 'skipped'] for df_plan in df_plan_list)
 
-def update_dynamic_filter(host_ip, port, username, password, df_name, df_criteria_field, df_append_values, df_remove_values):
+# Input
+# - Connection to an NPB
+# - Dynamic filter name
+# - Criteria field to update - use keys from df_criteria_fields_supported global dict
+# - Values to append and values to remove: dictionaries like {"addr": [...]}, or events from iter_criteria_file() to stream them from a file
+# - Number of values to merge into the criteria at a time, with a progress report after each chunk
+# Returns False if the filter could not be updated
+def update_dynamic_filter(host_ip, port, username, password, df_name, df_criteria_field, df_append_values, df_remove_values, chunk_size = criteria_chunk_size_default):
     df_criterion = None
     if isinstance(df_criteria_fields_supported, dict) and df_criteria_field in df_criteria_fields_supported.keys():
         df_criterion = df_criteria_fields_supported[df_criteria_field]
     else:
         print("Error: unsupported filter criteria %s" % df_criteria_field)
-        return
+        return False
         
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_ztp_filter_debug.log")
+    nto = nto_connect(host_ip, port, username, password)
 
     # Search for the DF
-    df_list = nto.searchFilters({'name': df_name})
+    df_list = get_nto_inventory(nto).search_filters(df_name)
     if len(df_list) == 0:
         # No existing filter with such name
         print("Error: can't find a dynamic filter with name %s" % df_name)
-        return
+        return False
     elif len(df_list) == 1:
         # An existing DF found
         df = df_list[0]
-        df_criteria = nto.getFilterProperty(str(df['id']), 'criteria') # TODO handle 404 not found situation
+        try:
+            df_current_criteria = nto.getFilterProperty(str(df['id']), 'criteria')
+        except Exception as e:
+            if nto_error_status(e) != 404:
+                raise
+            # The filter was deleted after the inventory was read
+            print("Error: can't find a dynamic filter with name %s" % df_name)
+            return False
+        df_criteria = copy.deepcopy(df_current_criteria)
         if df_criterion not in df_criteria.keys():
-            print("Criteria field %s is not in use by filter %s" % (df_criterion, df_name))
-            return
+            print("Error: criteria field %s is not in use by filter %s" % (df_criterion, df_name))
+            return False
         
-        for key in df_criteria[df_criterion]:
-            if key in df_append_values.keys():
-                if isinstance(df_criteria[df_criterion][key], list):
-                    df_criteria[df_criterion][key].extend(df_append_values[key])
-                else:
-                    df_criteria[df_criterion][key] = df_append_values[key]
-            if key in df_remove_values.keys():
-                if isinstance(df_criteria[df_criterion][key], list):
-                    for value in df_remove_values[key]:
-                        if value in df_criteria[df_criterion][key]:
-                            df_criteria[df_criterion][key].remove(value)
+        # Values are merged into the criteria in chunks of a limited size as they are read, appends first, then removes
+        # Values are merged as sets, with IPv4 prefixes deduplicated and collapsed into the minimal covering set, so that memory
+        # depends on the size of the resulting criteria rather than the number of values read
+        merger = CriteriaFieldMerger(df_criterion, df_criteria[df_criterion])
+        value_count, invalid_count = 0, 0
+        try:
+            for operation, df_values in [('append', df_append_values), ('remove', df_remove_values)]:
+                if isinstance(df_values, dict):
+                    df_values = iter_criteria_dict(df_values)
+                for chunk, chunk_value_count, chunk_invalid_count in iter_criteria_chunks(df_criterion, df_values, chunk_size):
+                    if operation == 'append':
+                        merger.merge(chunk, {})
+                    else:
+                        merger.merge({}, chunk)
+                    value_count += chunk_value_count
+                    invalid_count += chunk_invalid_count
+                    print("Filter %s %s: merged %d values" % (df_name, df_criterion, value_count))
+        except ValueError as e:
+            # Nothing is written to the filter unless all the values could be read
+            print("Error: can't parse filter values after %d values, filter %s is not updated: %s" % (value_count, df_name, e))
+            return False
+        df_criteria[df_criterion], entry_counts = merger.value()
+        if invalid_count > 0:
+            print("Skipped %d values that are not valid for %s criteria field" % (invalid_count, df_criterion))
+
+        for key in sorted(entry_counts.keys()):
+            print("Filter %s %s %s: %d entries before, %d after" % (df_name, df_criterion, key, entry_counts[key][0], entry_counts[key][1]))
                     
-        nto.modifyFilter(str(df['id']), {'criteria': df_criteria})
-        # TODO validate the update was successful
-        print("Updated filter %s with new values for %s criteria field" % (df_name, df_criterion))
+        # The criteria are written once, only if they have changed, and read back to validate the update was successful
+        changeset = NpbChangeSet(nto)
+        changeset.add_filter(df['id'], {'criteria': df_criteria, 'keywords': set_criteria_fingerprint_keyword(df['keywords'], df_criteria)}, \
+                             {'criteria': df_current_criteria, 'keywords': df['keywords']})
+        if 'criteria' not in (changeset.get('filters', df['id']) or {}):
+            print("Filter %s already has these values for %s criteria field" % (df_name, df_criterion))
+            return
+        report = changeset.apply()
+        if get_plan_only():
+            return
+        if changeset_succeeded(report, 'filters', df['id']):
+            print("Updated filter %s with new values for %s criteria field" % (df_name, df_criterion))
+        else:
+            print("Updating filter %s failed" % df_name)
+            print_changeset_report(report)
+            return False
         
     else:
         # This should never happen, but just in case, provide details to look into
         print("Found more than one DF named %s, can't continue:" % (df_name)),
-        for df in df_list:
-            df_details = nto.getFilter(str(df['id']))
-            if df_details is not None:
-                print (" %s," % (df_details['default_name'])),
+        for df_details in df_list:
+            print (" %s," % (df_details['default_name'])),
         print("")
-        return
+        return False
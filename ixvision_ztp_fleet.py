@@ -0,0 +1,154 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_fleet.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Run an ixvztp action against many NPBs in parallel
+# 1. Read a list of NPBs from an inventory file
+# 2. Start a separate ixvztp process for each NPB, running the same action with the same parameters, but no more than a set number at a time
+#    The password is passed in the environment of the process, so that it can't be seen on its command line
+# 3. Print output of each process prefixed with the NPB name as it comes
+# 4. Once all the processes are done, print a per-NPB summary with success or failure and duration. An action that fails on an NPB
+#    exits with a non-zero code
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import sys
+import json
+import time
+import threading
+import subprocess
+
+from ixvision_ztp_ntolib import *
+from ixvision_ztp_daemon import *
+
+# DEFINE VARs HERE
+fleet_concurrency_default = 4
+# Global ixvztp options that take a value, used to find where the action and its parameters start on the command line
+fleet_global_options_with_value = ['-u', '--username', '-p', '--password', '-d', '--hostname', '-r', '--port', '-I', '--inventory', '-j', '--jobs', '--metrics-dir', '--log-file', '--log-payload-max', '--log-sample']
+
+fleet_print_lock = threading.Lock()
+
+# DEFINE FUNCTIONS HERE
+
+# Load a list of NPBs from an inventory file
+# Two formats are supported:
+# - JSON list of hostnames, or dictionaries with 'hostname' and optional 'port', 'username' and 'password' to override the command line values
+# - Plain text with one hostname per line, optionally followed by a port. Empty lines and lines starting with # are ignored
+# Returns a list of dictionaries, or None if the file can't be read or parsed
+def load_fleet_inventory(filename):
+    try:
+        with open(filename) as f:
+            content = f.read()
+    except Exception:
+        print("Error: can't read from %s" % filename)
+        return None
+
+    host_list = []
+    try:
+        inventory = json.loads(content)
+    except ValueError:
+        for line in content.splitlines():
+            line = line.strip()
+            if len(line) == 0 or line.startswith('#'):
+                continue
+            fields = line.split()
+            host = {'hostname': fields[0]}
+            if len(fields) > 1:
+                host['port'] = fields[1]
+            host_list.append(host)
+        return host_list
+
+    if not isinstance(inventory, list):
+        print("Error: inventory in %s must be a list of hosts" % filename)
+        return None
+    for host in inventory:
+        if not isinstance(host, dict):
+            host = {'hostname': str(host)}
+        if 'hostname' not in host:
+            print("Error: inventory entry %s has no hostname" % json.dumps(host))
+            return None
+        host_list.append(host)
+    return host_list
+
+# Split ixvztp command line arguments at the action name
+# Returns a list of arguments starting with the action, to pass on to the process for each NPB
+def split_action_argv(argv, action):
+    expects_value = False
+    for i in range(len(argv)):
+        if expects_value:
+            expects_value = False
+            continue
+        if argv[i] == action:
+            return argv[i:]
+        expects_value = argv[i] in fleet_global_options_with_value
+    return [action]
+
+# Run an ixvztp action against a single NPB in a separate process, printing its output prefixed with the NPB name
+# Returns the process exit code and duration in seconds
+def run_fleet_host(launcher, host, username, password, port, global_argv, action_argv):
+    host_argv = [sys.executable, launcher, \
+                 '-u', str(host.get('username', username)), \
+                 '-d', str(host['hostname']), '-r', str(host.get('port', port))] + global_argv + action_argv
+    host_env = dict(os.environ)
+    host_env['PYTHONUNBUFFERED'] = '1'
+    host_env[ztp_password_env] = str(host.get('password', password))
+
+    start_time = time.time()
+    process = subprocess.Popen(host_argv, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, env=host_env)
+    for line in iter(process.stdout.readline, b''):
+        if not isinstance(line, str):
+            line = line.decode('utf-8', 'replace')
+        with fleet_print_lock:
+            print("[%s] %s" % (host['hostname'], line.rstrip()))
+    process.stdout.close()
+    return_code = process.wait()
+    return return_code, time.time() - start_time
+
+# Run an ixvztp action against all NPBs from an inventory, no more than max_hosts at a time
+# Input
+# - Path to ixvztp launcher to start for each NPB
+# - List of NPBs as returned by load_fleet_inventory()
+# - Default username, password and port, for NPBs that don't override them in the inventory
+# - Action and its parameters as a list of command line arguments
+# - Maximum number of NPBs to work with at the same time
+# - Other global options to pass on, as a list of command line arguments
+# Returns True if the action succeeded on all the NPBs
+def run_fleet(launcher, host_list, username, password, port, action_argv, max_hosts=fleet_concurrency_default, global_argv=[]):
+    host_results = {}
+    fleet_start_time = time.time()
+
+    def run_host(host_index):
+        return run_fleet_host(launcher, host_list[host_index], username, password, port, global_argv, action_argv)
+
+    for host_index, result in run_in_parallel(run_host, list(range(len(host_list))), max_hosts):
+        host_results[host_index] = result
+        if isinstance(result, Exception):
+            with fleet_print_lock:
+                print("[%s] Error: %s" % (host_list[host_index]['hostname'], result))
+
+    # Summary, in inventory order
+    name_width = max([len(str(host['hostname'])) for host in host_list] + [len('Host')])
+    failed_count = 0
+    print('')
+    print("%s  %-8s  %s" % ('Host'.ljust(name_width), 'Result', 'Duration'))
+    for host_index in range(len(host_list)):
+        result = host_results[host_index]
+        if isinstance(result, Exception):
+            status, duration = 'FAILED', 0
+        else:
+            return_code, duration = result
+            status = 'OK' if return_code == 0 else 'FAILED'
+        if status != 'OK':
+            failed_count += 1
+        print("%s  %-8s  %.1fs" % (str(host_list[host_index]['hostname']).ljust(name_width), status, duration))
+    print("%d of %d hosts succeeded in %.1fs" % (len(host_list) - failed_count, len(host_list), time.time() - fleet_start_time))
+    return failed_count == 0
@@ -0,0 +1,154 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_governor.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Adaptive control of REST calls in flight to an NPB
+# 1. All calls to the same NPB share a governor, which lets a limited number of them run at the same time
+# 2. The limit grows by about one call per round of calls that complete in time, and is cut by a factor when latency grows well
+#    above the lowest seen, or the NPB signals it is overloaded (additive increase, multiplicative decrease)
+# 3. Overload is HTTP 429, 502, 503 or 504, or a connection that fails or times out. GET calls are repeated after overload, and
+#    any call rejected with 429, after a random delay that grows with each attempt. Writes are not repeated after other errors,
+#    as they might have been carried out: repeating a PUT that timed out could undo a change made by someone else in between
+# 4. After several overload signals in a row the circuit breaker opens: calls wait for the NPB to recover, and then a single
+#    probe call is let through to check it has. Only the probe closes the breaker, or opens it again: calls that were already in
+#    flight when it opened say nothing about whether the NPB has recovered. If the breaker keeps opening, calls fail without
+#    being sent while it is open
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import time
+import random
+import threading
+
+from ixvision_ztp_log import *
+
+# DEFINE VARs HERE
+governor_initial_limit = 4              # Calls in flight to an NPB to start with
+governor_min_limit = 1
+governor_overload_decrease = 0.5        # Factor to cut the limit by when the NPB signals overload
+governor_latency_decrease = 0.8         # Factor to cut the limit by when latency grows
+governor_latency_factor = 4.0           # Latency this many times above the lowest seen is a sign of congestion
+governor_latency_floor = 0.5            # Calls faster than this, in seconds, are never a sign of congestion
+governor_overload_status = [429, 502, 503, 504]
+governor_retry_methods = ['GET']        # Calls that are safe to repeat after any overload, as they don't change anything
+governor_breaker_threshold = 5          # Overload signals in a row that open the circuit breaker
+governor_breaker_cooldown = 2.0         # Seconds the breaker stays open for, doubled each time it opens again before a call succeeds
+governor_breaker_cooldown_max = 60.0
+governor_breaker_max_trips = 5          # Times in a row the breaker opens before calls fail instead of waiting for it to close
+governor_retries = 3                    # Times to repeat a call after overload
+governor_retry_delay = 0.2              # Longest delay before the first repeat, in seconds, doubled with each attempt
+governor_retry_delay_max = 5.0
+governor_wait_step = 1.0                # Seconds to wait for at a time, so that waiting threads can be interrupted
+
+# Governors by NPB address and port
+npb_call_governors = {}
+npb_call_governors_lock = threading.Lock()
+
+# DEFINE FUNCTIONS HERE
+
+class NpbCallGovernor(object):
+
+    def __init__(self, host, max_limit):
+        self.host = host
+        self.max_limit = max(governor_min_limit, max_limit)
+        self.limit = float(min(governor_initial_limit, self.max_limit))
+        self.in_flight = 0
+        self.condition = threading.Condition()
+        self.min_latency = None         # Lowest latency of a successful call so far
+        self.last_decrease = 0.0        # Time of the last cut of the limit, to cut it once per round of calls
+        self.overload_count = 0         # Overload signals in a row
+        self.breaker_trips = 0          # Times the breaker opened in a row
+        self.breaker_open_until = 0.0
+        self.probing = False            # Whether a probe call is in flight while the breaker is half-open
+
+    # Wait for a call to be allowed. Raises an exception if the breaker is open and has opened too many times in a row
+    # Returns whether the call is the probe of a half-open breaker, to pass to release() once it completes
+    def acquire(self):
+        with self.condition:
+            while True:
+                now = time.time()
+                if now < self.breaker_open_until:
+                    if self.breaker_trips >= governor_breaker_max_trips:
+                        raise Exception({'status_code': 503, 'content': "NPB %s is overloaded, calls are paused for %.1f more seconds" % \
+                                         (self.host, self.breaker_open_until - now)})
+                    self.condition.wait(min(governor_wait_step, self.breaker_open_until - now))
+                elif self.breaker_trips > 0:
+                    # Half-open: a single probe call checks whether the NPB has recovered
+                    if not self.probing:
+                        self.probing = True
+                        self.in_flight += 1
+                        return True
+                    self.condition.wait(governor_wait_step)
+                elif self.in_flight < int(self.limit):
+                    self.in_flight += 1
+                    return False
+                else:
+                    self.condition.wait(governor_wait_step)
+
+    # Account for a completed call and adjust the limit
+    # Input
+    # - Seconds the call took
+    # - Whether the NPB signalled overload. Other errors, like 404, say nothing about the load and count as completed calls
+    # - Whether the call was the probe of a half-open breaker, as returned by acquire()
+    def release(self, latency, overloaded, probe=False):
+        with self.condition:
+            self.in_flight -= 1
+            now = time.time()
+            if overloaded:
+                self.overload_count += 1
+                if now - self.last_decrease > (self.min_latency or 0):
+                    self.limit = max(governor_min_limit, self.limit * governor_overload_decrease)
+                    self.last_decrease = now
+                # The probe opens the breaker again, other calls open it only while it is closed
+                if probe or self.breaker_trips == 0 and self.overload_count >= governor_breaker_threshold:
+                    self.breaker_trips += 1
+                    cooldown = min(governor_breaker_cooldown_max, governor_breaker_cooldown * 2 ** (self.breaker_trips - 1))
+                    self.breaker_open_until = now + cooldown
+                    self.overload_count = 0
+                    self.limit = float(governor_min_limit)
+                    print("Warning: NPB %s is overloaded, pausing calls to it for %.0f seconds" % (self.host, cooldown))
+                    ztp_log('warning', 'circuit_open', npb=self.host, seconds=cooldown, trips=self.breaker_trips)
+            else:
+                self.overload_count = 0
+                if probe:
+                    self.breaker_trips = 0
+                    ztp_log('info', 'circuit_closed', npb=self.host)
+                if self.min_latency is None or latency < self.min_latency:
+                    self.min_latency = latency
+                if latency > max(governor_latency_floor, self.min_latency * governor_latency_factor):
+                    if now - self.last_decrease > latency:
+                        self.limit = max(governor_min_limit, self.limit * governor_latency_decrease)
+                        self.last_decrease = now
+                        ztp_log('info', 'concurrency_decreased', npb=self.host, limit=round(self.limit, 2), seconds=round(latency, 6))
+                else:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+            if probe:
+                self.probing = False
+            self.condition.notify_all()
+
+# Get the governor of calls to an NPB, creating it on first use
+def get_npb_call_governor(host, port, max_limit):
+    with npb_call_governors_lock:
+        governor = npb_call_governors.get((host, str(port)))
+        if governor is None:
+            governor = NpbCallGovernor(host, max_limit)
+            npb_call_governors[(host, str(port))] = governor
+        return governor
+
+# Seconds to wait before repeating a call for the given attempt, chosen at random up to a limit that doubles with each attempt
+# If the NPB asked to retry after some time, with a Retry-After header, at least that long
+def governor_retry_delay_for(attempt, retry_after=None):
+    delay = random.uniform(0, min(governor_retry_delay_max, governor_retry_delay * 2 ** attempt))
+    try:
+        delay = max(delay, min(governor_breaker_cooldown_max, float(retry_after)))
+    except (TypeError, ValueError):
+        pass
+    return delay
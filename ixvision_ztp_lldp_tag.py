@@ -7,6 +7,7 @@
 #
 # Description: Tag ports with keywords matched with LLDP info
 # Since this script doesn't change any operational parameters of an NPB, it could be run as often as needed to keep the port tags updated
+# In watch mode it keeps running, polls LLDP neighbors on an interval and updates tags only on ports whose neighbors have changed
 # 1. Starting point is an Ixia Vision NPB with all required ports enabled and receiving LLDP info from neighbors
 # 2. Input parameters to this script enumerate which keywords to look in LLDP Port Description field
 # 3. Connect to an NPB and collect LLDP Neighbors info
@@ -23,6 +24,15 @@
 
 from ksvisionlib import *
 
+from ixvision_ztp_ntolib import *
+from ixvision_ztp_changeset import *
+
+import time
+import hashlib
+
+# DEFINE VARs HERE
+lldp_watch_interval_default = 30        # Seconds between polls of LLDP neighbors in watch mode
+
 # DEFINE FUNCTIONS HERE
 
 # Input 
@@ -38,11 +48,118 @@ from ksvisionlib import *
 # |_Keywords[Names]
 # |_NeighborList[PortNum,NeighborPortDescription]
 
-# TODO remove keywords from ports that no longer have matching LLDP neighbors
+# Matcher of a set of tags against text in a single pass, no matter how many tags there are (Aho-Corasick automaton)
+# All the tags found in the text are reported, including ones that overlap or are a part of another tag
+class TagMatcher(object):
+
+    def __init__(self, tags):
+        self.transitions = [{}]         # Transitions from each state by character
+        self.fallbacks = [0]            # State to continue from when there is no transition for a character
+        self.matches = [[]]             # Tags that end in each state
+        for tag in tags:
+            if len(tag) == 0:
+                continue
+            state = 0
+            for char in tag:
+                if char not in self.transitions[state]:
+                    self.transitions.append({})
+                    self.fallbacks.append(0)
+                    self.matches.append([])
+                    self.transitions[state][char] = len(self.transitions) - 1
+                state = self.transitions[state][char]
+            if tag not in self.matches[state]:
+                self.matches[state].append(tag)
+
+        # Breadth-first, so that fallbacks of shorter prefixes are known before longer ones
+        # States right after the start fall back to it
+        state_queue = list(self.transitions[0].values())
+        for state in state_queue:
+            for char, next_state in self.transitions[state].items():
+                fallback = self.fallbacks[state]
+                while fallback > 0 and char not in self.transitions[fallback]:
+                    fallback = self.fallbacks[fallback]
+                self.fallbacks[next_state] = self.transitions[fallback].get(char, 0)
+                self.matches[next_state] = self.matches[next_state] + self.matches[self.fallbacks[next_state]]
+                state_queue.append(next_state)
+
+    # Returns a list of tags found in the text
+    def match(self, text):
+        found_tags = []
+        state = 0
+        for char in text:
+            while state > 0 and char not in self.transitions[state]:
+                state = self.fallbacks[state]
+            state = self.transitions[state].get(char, 0)
+            for tag in self.matches[state]:
+                if tag not in found_tags:
+                    found_tags.append(tag)
+        return found_tags
+
+# Keywords of a port after adding tags, or None if the port already has all of them. NPB keywords are always in upper case
+def merge_port_keywords(port_keywords, tags):
+    keyword_list = list(port_keywords or [])
+    existing_keywords = set(keyword.upper() for keyword in keyword_list)
+    for tag in tags:
+        if tag.upper() not in existing_keywords:
+            keyword_list.append(tag.upper())
+            existing_keywords.add(tag.upper())
+    if len(keyword_list) == len(port_keywords or []):
+        return None
+    return keyword_list
+
+# Keywords of a port with only the tags that currently match its neighbors, out of all the tags being watched, or None if there is nothing to change
+# Keywords that are not among the watched tags are kept as they are
+def retag_port_keywords(port_keywords, tags, matched_tags):
+    watched_keywords = set(tag.upper() for tag in tags)
+    matched_keywords = set(tag.upper() for tag in matched_tags)
+    keyword_list = [keyword for keyword in (port_keywords or []) if keyword.upper() not in watched_keywords or keyword.upper() in matched_keywords]
+    keyword_list = merge_port_keywords(keyword_list, matched_tags) or keyword_list
+    if keyword_list == list(port_keywords or []):
+        return None
+    return keyword_list
+
+# Fingerprint of a set of LLDP neighbors of a port, to find out if it has changed since the last poll
+def neighbor_fingerprint(neighbors):
+    neighbor_keys = sorted("%s\t%s\t%s" % (n.get('system_name'), n.get('port_id'), n.get('port_description')) for n in neighbors)
+    return hashlib.sha1('\n'.join(neighbor_keys).encode('utf-8')).hexdigest()
+
+# Tags matching descriptions of LLDP neighbors of a port
+def match_neighbor_tags(matcher, port_name, neighbors):
+    port_tags = []
+    for neighbor in neighbors:
+        matched_tags = matcher.match(neighbor['port_description'])
+        if len(matched_tags) > 0:
+            print("Matched port %s with neighbor %s:%s description %s" % (port_name, neighbor['system_name'], neighbor['port_id'], neighbor['port_description']))
+            port_tags += [tag for tag in matched_tags if tag not in port_tags]
+    return port_tags
+
+# Write new keywords to ports as a change set, which also keeps the inventory up to date
+# Input
+# - NTO object as a connection to an NPB
+# - Dictionary of port keyword lists by port ID
+# Returns the number of ports updated, and a list of IDs of ports that failed to update
+def update_ports_keywords(nto, port_keyword_changes):
+    changeset = NpbChangeSet(nto)
+    for port_id in port_keyword_changes.keys():
+        changeset.add_port(port_id, {'keywords': port_keyword_changes[port_id]})
 
+    updated_count = 0
+    failed_port_id_list = []
+    for entry in changeset.apply():
+        if entry['status'] == 'planned':
+            continue
+        if entry['status'] != 'ok':
+            print("Failed to update keywords of port %s: %s" % (entry['name'], entry['error']))
+            failed_port_id_list.append(entry['id'])
+            continue
+        print("Tagged port %s with keywords %s" % (entry['name'], ", ".join(port_keyword_changes[entry['id']]) if len(port_keyword_changes[entry['id']]) > 0 else '(none)'))
+        updated_count += 1
+    return updated_count, failed_port_id_list
+
+# Returns False if any of the matched ports could not be tagged
 def tag_ports(host_ip, port, username, password, tags):
 
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_lldp_tag_debug.log")
+    nto = nto_connect(host_ip, port, username, password)
 
     neighbor_list = {}
 
@@ -50,15 +167,113 @@ def tag_ports(host_ip, port, username, password, tags):
     if len(neighbor_list) == 0:
         return
 
+    # Collect tags for each port from all of its neighbors first, to update each port once
+    matcher = TagMatcher(tags)
+    inventory = get_nto_inventory(nto)
+    port_tags = {}
+    missing_count = 0
     for port_name in neighbor_list.keys():
-        port = nto.getPortProperties(port_name,'id,keywords')
-        for neighbor in neighbor_list[port_name]:
-            for tag in tags:
-                if tag in neighbor['port_description']:
-                    print("Matched port %s with neighbor %s:%s description %s" % (port_name, neighbor['system_name'], neighbor['port_id'], neighbor['port_description']))
-                    port_keywords = port['keywords']
-                    if port_keywords is None:
-                        port_keywords = [tag]
-                    else:
-                        port_keywords = port_keywords + [tag]
-                    nto.modifyPort(str(port['id']), {'keywords': port_keywords})
+        port = inventory.get_port(port_name)
+        if port is None:
+            print("Failed to retrieve details for port %s, skipping..." % (port_name))
+            missing_count += 1
+            continue
+        matched_tags = match_neighbor_tags(matcher, port_name, neighbor_list[port_name])
+        if len(matched_tags) > 0:
+            port_tags[port['id']] = matched_tags
+
+    port_keyword_changes = {}
+    for port_id in port_tags.keys():
+        port_keywords = merge_port_keywords(inventory.get_port(port_id)['keywords'], port_tags[port_id])
+        if port_keywords is not None:
+            port_keyword_changes[port_id] = port_keywords
+
+    updated_count, failed_port_id_list = update_ports_keywords(nto, port_keyword_changes)
+    print("Updated keywords of %d ports, %d matched ports already had all of their tags" % (updated_count, len(port_tags) - len(port_keyword_changes)))
+    return missing_count + len(failed_port_id_list) == 0
+
+# Keep port tags in line with LLDP neighbors: poll neighbors on an interval, and update tags of ports whose neighbors have changed
+# Unlike tag_ports(), tags that no longer match any neighbor of a port are removed from it
+# Ports are tracked by ID, and their keywords are read again before they are retagged, so that keywords other tools added
+# while watching are kept. A port is only considered up to date with its neighbors once its keywords were written, so that
+# a failed write is tried again on the next poll
+# Input
+# - NPB address, port and credentials
+# - Tags to look for in LLDP neighbor port descriptions
+# - Seconds between polls
+# - Number of polls to stop after, 0 to keep polling until interrupted
+# Returns False if any of the ports could not be retagged during any of the polls
+def watch_port_tags(host_ip, port, username, password, tags, interval=lldp_watch_interval_default, poll_count=0):
+
+    nto = nto_connect(host_ip, port, username, password)
+    matcher = TagMatcher(tags)
+    inventory = get_nto_inventory(nto)
+    watched_keywords = set(tag.upper() for tag in tags)
+    fingerprints = {}               # Neighbor fingerprints by port ID, as of the last successful retag
+    missing_fingerprints = {}       # Neighbor fingerprints by name of ports that couldn't be found, to report each change once
+
+    # Ports tagged before watching started are checked on the first poll, even if they have no neighbors
+    for keyword in watched_keywords:
+        for port_details in inventory.search_ports(keywords=[keyword]):
+            fingerprints[port_details['id']] = None
+
+    print("Watching LLDP neighbors every %ds, press Ctrl-C to stop" % interval)
+    poll = 0
+    failed_count = 0
+    try:
+        while poll_count == 0 or poll < poll_count:
+            poll += 1
+            poll_start_time = time.time()
+            neighbor_list = nto.getAllNeighbors() or {}
+
+            # Neighbors are reported by port name. Ports renamed since the inventory was loaded are looked up on the NPB
+            unknown_port_names = [port_name for port_name in neighbor_list.keys() if inventory.get_port(port_name) is None]
+            if len(unknown_port_names) > 0:
+                for port_details in get_ports_properties(nto, unknown_port_names, 'keywords').values():
+                    inventory.update_port(port_details['id'], {'name': port_details['name'], 'default_name': port_details['default_name']})
+            neighbors_by_port_id = {}
+            for port_name in neighbor_list.keys():
+                port_details = inventory.get_port(port_name)
+                if port_details is None:
+                    fingerprint = neighbor_fingerprint(neighbor_list[port_name])
+                    if missing_fingerprints.get(port_name) != fingerprint:
+                        missing_fingerprints[port_name] = fingerprint
+                        print("Failed to retrieve details for port %s, skipping..." % (port_name))
+                        failed_count += 1
+                    continue
+                neighbors_by_port_id.setdefault(port_details['id'], []).extend(neighbor_list[port_name])
+
+            # Ports with new, changed or gone neighbors, or whose last retag failed
+            changed_fingerprints = {}
+            for port_id in set(fingerprints.keys()) | set(neighbors_by_port_id.keys()):
+                fingerprint = neighbor_fingerprint(neighbors_by_port_id.get(port_id, []))
+                if fingerprints.get(port_id, '') != fingerprint:
+                    changed_fingerprints[port_id] = fingerprint
+
+            if len(changed_fingerprints) > 0:
+                # Current keywords of the changed ports, in a single request
+                current_ports = get_ports_properties(nto, sorted(changed_fingerprints.keys()), 'keywords')
+                port_keyword_changes = {}
+                for port_id in sorted(changed_fingerprints.keys()):
+                    if port_id not in current_ports:
+                        print("Failed to retrieve details for port ID %s, skipping..." % (port_id))
+                        failed_count += 1
+                        continue
+                    port_details = current_ports[port_id]
+                    inventory.update_port(port_id, {'name': port_details['name'], 'default_name': port_details['default_name'], 'keywords': port_details.get('keywords') or []})
+                    matched_tags = match_neighbor_tags(matcher, port_details['name'], neighbors_by_port_id.get(port_id, []))
+                    port_keywords = retag_port_keywords(port_details.get('keywords'), tags, matched_tags)
+                    if port_keywords is not None:
+                        port_keyword_changes[port_id] = port_keywords
+                updated_count, failed_port_id_list = update_ports_keywords(nto, port_keyword_changes)
+                failed_count += len(failed_port_id_list)
+                for port_id in changed_fingerprints.keys():
+                    if port_id in current_ports and port_id not in failed_port_id_list:
+                        fingerprints[port_id] = changed_fingerprints[port_id]
+                print("Poll %d: neighbors changed on %d ports, updated keywords of %d ports" % (poll, len(changed_fingerprints), updated_count))
+
+            if poll_count == 0 or poll < poll_count:
+                time.sleep(max(0, interval - (time.time() - poll_start_time)))
+    except KeyboardInterrupt:
+        print("Stopped watching LLDP neighbors after %d polls" % poll)
+    return failed_count == 0
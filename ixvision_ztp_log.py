@@ -0,0 +1,159 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_log.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Structured log of ixvztp activity, written in the background
+# 1. Log records are JSON objects, one per line, with a timestamp, level, event name and event-specific fields
+# 2. Records are put on a queue and written to the file by a background thread, so that logging never waits for disk I/O.
+#    If the queue is full, records are dropped and counted instead
+# 3. The log file is rotated once it reaches a set size, keeping a few previous files
+# 4. Request and response bodies are logged only at the debug level, truncated to a set size, and optionally only for every Nth call
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import json
+import time
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
+# DEFINE VARs HERE
+ztp_log_dir = os.path.join(os.path.expanduser('~'), '.ixvztp', 'logs')
+ztp_log_levels = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+ztp_log_options = {'level': 'info', \
+                   'filename': None, \
+                   'max_bytes': 10 * 1024 * 1024,   # Size to rotate the log file at
+                   'backup_count': 3,               # Number of rotated files to keep
+                   'payload_max': 1024,             # Characters of request and response bodies to keep at the debug level
+                   'payload_sample': 1}             # Log bodies of every Nth call only
+ztp_log_queue_size = 10000
+
+ztp_log_queue = queue.Queue(ztp_log_queue_size)
+ztp_log_state = {'thread': None, 'dropped': 0, 'payload_calls': 0}
+ztp_log_lock = threading.Lock()
+
+# DEFINE FUNCTIONS HERE
+
+def ztp_log_filename(host_ip):
+    return os.path.join(ztp_log_dir, "ixvztp_%s.jsonl" % host_ip)
+
+# Set up logging before the first record
+# Input
+# - Lowest level of records to write: debug, info, warning or error
+# - Log file path
+# - Size in bytes to rotate the file at, and number of rotated files to keep
+# - Characters of request and response bodies to keep, and how often to log them, at the debug level
+def configure_ztp_log(level, filename, max_bytes=None, backup_count=None, payload_max=None, payload_sample=None):
+    ztp_log_options['level'] = level
+    ztp_log_options['filename'] = filename
+    for option, value in [('max_bytes', max_bytes), ('backup_count', backup_count), ('payload_max', payload_max), ('payload_sample', payload_sample)]:
+        if value is not None:
+            ztp_log_options[option] = value
+
+# Whether records of a level would be written
+def ztp_log_enabled(level):
+    return ztp_log_options['filename'] is not None and ztp_log_levels[level] >= ztp_log_levels[ztp_log_options['level']]
+
+# Whether to log bodies of the current call, at the debug level and for every Nth call
+def ztp_log_payload_enabled():
+    if not ztp_log_enabled('debug'):
+        return False
+    with ztp_log_lock:
+        ztp_log_state['payload_calls'] += 1
+        return (ztp_log_state['payload_calls'] - 1) % max(1, ztp_log_options['payload_sample']) == 0
+
+# Request or response body, truncated to the configured size
+def ztp_log_payload(payload):
+    if payload is None:
+        return None
+    if not isinstance(payload, str):
+        try:
+            payload = payload.decode('utf-8', 'replace')
+        except AttributeError:
+            payload = json.dumps(payload)
+    if len(payload) > ztp_log_options['payload_max']:
+        return "%s...(%d more characters)" % (payload[:ztp_log_options['payload_max']], len(payload) - ztp_log_options['payload_max'])
+    return payload
+
+# Log an event, without waiting for it to be written
+# Input
+# - Level: debug, info, warning or error
+# - Event name
+# - Any event fields as keyword arguments
+def ztp_log(level, event, **fields):
+    if not ztp_log_enabled(level):
+        return
+    record = {'ts': round(time.time(), 6), 'level': level, 'event': event, 'pid': os.getpid()}
+    record.update(fields)
+    with ztp_log_lock:
+        if ztp_log_state['thread'] is None:
+            ztp_log_state['thread'] = threading.Thread(target=ztp_log_writer)
+            ztp_log_state['thread'].daemon = True
+            ztp_log_state['thread'].start()
+    try:
+        ztp_log_queue.put_nowait(record)
+    except queue.Full:
+        with ztp_log_lock:
+            ztp_log_state['dropped'] += 1
+
+def rotate_ztp_log_file(filename):
+    for i in range(ztp_log_options['backup_count'] - 1, 0, -1):
+        if os.path.exists("%s.%d" % (filename, i)):
+            os.rename("%s.%d" % (filename, i), "%s.%d" % (filename, i + 1))
+    if ztp_log_options['backup_count'] > 0:
+        os.rename(filename, "%s.1" % filename)
+    else:
+        os.remove(filename)
+
+# Background thread writing queued records to the log file, until it gets None
+def ztp_log_writer():
+    filename = ztp_log_options['filename']
+    log_file = None
+    while True:
+        record = ztp_log_queue.get()
+        try:
+            if record is None:
+                return
+            if log_file is None:
+                log_dir = os.path.dirname(filename)
+                if len(log_dir) > 0 and not os.path.isdir(log_dir):
+                    os.makedirs(log_dir, 0o700)
+                # Bodies of requests and responses might be logged, so only the current user can read the log
+                log_file = os.fdopen(os.open(filename, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o600), 'a')
+            log_file.write(json.dumps(record, default=str) + '\n')
+            if log_file.tell() >= ztp_log_options['max_bytes']:
+                log_file.close()
+                log_file = None
+                rotate_ztp_log_file(filename)
+            elif ztp_log_queue.empty():
+                # Records come in bursts, flush once a burst is written
+                log_file.flush()
+        except Exception:
+            # Logging must never break the action, so the log is given up on
+            log_file = None
+            ztp_log_options['filename'] = None
+        finally:
+            if record is None and log_file is not None:
+                log_file.close()
+
+# Write out queued records, to be called before exit
+def flush_ztp_log():
+    if ztp_log_state['thread'] is None:
+        return
+    if ztp_log_state['dropped'] > 0:
+        ztp_log_queue.put({'ts': round(time.time(), 6), 'level': 'warning', 'event': 'log_records_dropped', \
+                           'pid': os.getpid(), 'count': ztp_log_state['dropped']})
+    ztp_log_queue.put(None)
+    ztp_log_state['thread'].join()
+    ztp_log_state['thread'] = None
@@ -0,0 +1,180 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_metrics.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Instrumentation of REST calls to NPBs
+# 1. Every call is counted and timed by NPB, ixvztp action, HTTP method and endpoint. Object IDs in URLs are replaced with {id}
+# 2. Latency goes into a histogram, along with bytes sent and received, errors and retries
+# 3. At exit, metrics are written as JSON and in Prometheus text format, and optionally summarized by endpoints with the most time spent
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import json
+import time
+import threading
+
+# DEFINE VARs HERE
+ztp_metrics_dir = os.path.join(os.path.expanduser('~'), '.ixvztp', 'metrics')
+# Upper bounds of latency histogram buckets, in seconds. Calls slower than the last one go into the +Inf bucket
+metrics_latency_buckets = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30]
+metrics_summary_top = 10
+
+# Metrics by (NPB, action, method, endpoint)
+rest_metrics = {}
+rest_metrics_lock = threading.Lock()
+# Action the current thread works on behalf of
+metrics_context = threading.local()
+
+# DEFINE FUNCTIONS HERE
+
+# Label REST calls made by the current thread with an action
+def set_metrics_action(action):
+    metrics_context.action = action
+
+def get_metrics_action():
+    return getattr(metrics_context, 'action', '')
+
+# Endpoint of a URL, with the query string removed and object IDs replaced with {id}
+def metrics_endpoint(url):
+    path = url.split('?', 1)[0]
+    return '/'.join('{id}' if segment.isdigit() else segment for segment in path.split('/'))
+
+def get_rest_metric(host, method, url):
+    metric_key = (str(host), get_metrics_action(), method, metrics_endpoint(url))
+    metric = rest_metrics.get(metric_key)
+    if metric is None:
+        metric = {'calls': 0, 'errors': 0, 'retries': 0, 'seconds': 0.0, 'bytes_sent': 0, 'bytes_received': 0, \
+                  'buckets': [0] * (len(metrics_latency_buckets) + 1)}
+        rest_metrics[metric_key] = metric
+    return metric
+
+# Record a completed REST call
+# Input
+# - NPB address
+# - HTTP method and URL
+# - HTTP status code of the response
+# - Call duration in seconds
+# - Request and response body sizes in bytes
+def record_rest_call(host, method, url, status, duration, bytes_sent, bytes_received):
+    bucket = 0
+    while bucket < len(metrics_latency_buckets) and duration > metrics_latency_buckets[bucket]:
+        bucket += 1
+    with rest_metrics_lock:
+        metric = get_rest_metric(host, method, url)
+        metric['calls'] += 1
+        metric['seconds'] += duration
+        metric['bytes_sent'] += bytes_sent
+        metric['bytes_received'] += bytes_received
+        metric['buckets'][bucket] += 1
+        if status >= 400:
+            metric['errors'] += 1
+
+# Record that a REST call had to be repeated
+def record_rest_retry(host, method, url):
+    with rest_metrics_lock:
+        get_rest_metric(host, method, url)['retries'] += 1
+
+# Snapshot of all metrics as a list of dictionaries, one per NPB, action, method and endpoint
+def get_rest_metrics():
+    with rest_metrics_lock:
+        metric_list = []
+        for (host, action, method, endpoint), metric in rest_metrics.items():
+            metric_entry = {'npb': host, 'action': action, 'method': method, 'endpoint': endpoint}
+            metric_entry.update(metric)
+            metric_entry['buckets'] = list(metric['buckets'])
+            metric_list.append(metric_entry)
+    return sorted(metric_list, key=lambda m: (m['npb'], m['action'], m['endpoint'], m['method']))
+
+# Metrics of the calls made since an earlier snapshot of get_rest_metrics(), leaving out metrics without new calls
+def diff_rest_metrics(metric_list, earlier_metric_list):
+    earlier_metrics = dict(((m['npb'], m['action'], m['method'], m['endpoint']), m) for m in earlier_metric_list)
+    diff_list = []
+    for metric in metric_list:
+        earlier_metric = earlier_metrics.get((metric['npb'], metric['action'], metric['method'], metric['endpoint']))
+        if earlier_metric is not None:
+            metric = dict(metric)
+            for key in ['calls', 'errors', 'retries', 'seconds', 'bytes_sent', 'bytes_received']:
+                metric[key] -= earlier_metric[key]
+            metric['buckets'] = [count - earlier_count for count, earlier_count in zip(metric['buckets'], earlier_metric['buckets'])]
+        if metric['calls'] > 0 or metric['retries'] > 0:
+            diff_list.append(metric)
+    return diff_list
+
+# Estimated latency percentile of a metric, as an upper bound of the histogram bucket it falls into
+def metric_latency_percentile(metric, percentile):
+    threshold = metric['calls'] * percentile / 100.0
+    call_count = 0
+    for bucket in range(len(metrics_latency_buckets)):
+        call_count += metric['buckets'][bucket]
+        if call_count >= threshold:
+            return metrics_latency_buckets[bucket]
+    return float('inf')
+
+def format_prometheus_labels(metric, extra_labels=''):
+    labels = ','.join('%s="%s"' % (name, str(metric[name]).replace('\\', '\\\\').replace('"', '\\"')) \
+                      for name in ['npb', 'action', 'method', 'endpoint'])
+    return '{%s%s}' % (labels, extra_labels)
+
+# Metrics in Prometheus text exposition format
+def format_prometheus_metrics(metric_list):
+    lines = ['# HELP ixvztp_rest_request_duration_seconds Latency of REST calls to NPBs', \
+             '# TYPE ixvztp_rest_request_duration_seconds histogram']
+    for metric in metric_list:
+        call_count = 0
+        for bucket in range(len(metrics_latency_buckets)):
+            call_count += metric['buckets'][bucket]
+            lines.append('ixvztp_rest_request_duration_seconds_bucket%s %d' % (format_prometheus_labels(metric, ',le="%g"' % metrics_latency_buckets[bucket]), call_count))
+        lines.append('ixvztp_rest_request_duration_seconds_bucket%s %d' % (format_prometheus_labels(metric, ',le="+Inf"'), metric['calls']))
+        lines.append('ixvztp_rest_request_duration_seconds_sum%s %f' % (format_prometheus_labels(metric), metric['seconds']))
+        lines.append('ixvztp_rest_request_duration_seconds_count%s %d' % (format_prometheus_labels(metric), metric['calls']))
+    for name, field, description in [('ixvztp_rest_request_errors_total', 'errors', 'REST calls answered with an error status'), \
+                                     ('ixvztp_rest_retries_total', 'retries', 'REST calls repeated after a failure'), \
+                                     ('ixvztp_rest_sent_bytes_total', 'bytes_sent', 'Bytes of REST request bodies sent'), \
+                                     ('ixvztp_rest_received_bytes_total', 'bytes_received', 'Bytes of REST response bodies received')]:
+        lines.append('# HELP %s %s' % (name, description))
+        lines.append('# TYPE %s counter' % name)
+        for metric in metric_list:
+            lines.append('%s%s %d' % (name, format_prometheus_labels(metric), metric[field]))
+    return '\n'.join(lines) + '\n'
+
+# Write metrics as JSON and in Prometheus text format into a directory, with file names based on the NPB address and port
+def save_rest_metrics(metrics_dir, host_ip, port):
+    metric_list = get_rest_metrics()
+    if len(metric_list) == 0:
+        return
+    try:
+        if not os.path.isdir(metrics_dir):
+            os.makedirs(metrics_dir, 0o700)
+        filename = os.path.join(metrics_dir, "ixvztp_%s_%s" % (host_ip, port))
+        with open(filename + '.json', 'w') as f:
+            json.dump({'timestamp': time.time(), 'latency_buckets': metrics_latency_buckets, 'metrics': metric_list}, f, indent=2)
+        # Prometheus textfile collectors might read the file at any moment, so it is replaced atomically
+        with open(filename + '.prom.tmp', 'w') as f:
+            f.write(format_prometheus_metrics(metric_list))
+        os.rename(filename + '.prom.tmp', filename + '.prom')
+    except Exception as e:
+        print("Warning: can't save REST call metrics: %s" % e)
+
+# Print endpoints with the most time spent, of all metrics or of a list of them
+def print_rest_metrics_summary(top=metrics_summary_top, metric_list=None):
+    if metric_list is None:
+        metric_list = get_rest_metrics()
+    if len(metric_list) == 0:
+        return
+    print('')
+    print("REST calls: %d in %.1fs, %d errors, %d retries, %d bytes sent, %d bytes received" % \
+          (sum(m['calls'] for m in metric_list), sum(m['seconds'] for m in metric_list), sum(m['errors'] for m in metric_list), \
+           sum(m['retries'] for m in metric_list), sum(m['bytes_sent'] for m in metric_list), sum(m['bytes_received'] for m in metric_list)))
+    print("%8s  %6s  %8s  %8s  %-10s  %s" % ('Total', 'Calls', 'Avg', 'p95 <=', 'Action', 'Endpoint'))
+    for metric in sorted(metric_list, key=lambda m: m['seconds'], reverse=True)[:top]:
+        print("%7.2fs  %6d  %6.0fms  %6.0fms  %-10s  %s %s" % (metric['seconds'], metric['calls'], 1000 * metric['seconds'] / max(metric['calls'], 1), \
+              1000 * metric_latency_percentile(metric, 95), metric['action'], metric['method'], metric['endpoint']))
@@ -16,41 +16,247 @@
 
 from ksvisionlib import *
 
+from ixvision_ztp_session import *
+from ixvision_ztp_metrics import *
+from ixvision_ztp_daemon import *
+
+import json
+import time
+import hashlib
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+
 # DEFINE VARs HERE
 port_modes_supported = {'net': 'NETWORK', 'tool': 'TOOL'}
 df_connection_modes_supported = {'input': 'NETWORK', 'output': 'TOOL'}
 df_criteria_fields_supported = {'ip': 'ipv4_src_or_dst', 'ip-src': 'ipv4_src', 'ip-dst': 'ipv4_dst'}
+# Pairs of port attributes that can't be sent in the same request: the first one has to be written before the second
+port_attribute_sequenced_pairs = [('media_type', 'forward_error_correction_settings'), ('media_type', 'enabled')]
+# Order to write port attributes one at a time in, if the NPB rejects a combined request. Attributes in the same tuple always go together
+port_attribute_write_order = [('media_type', 'link_settings'), ('mode',), ('forward_error_correction_settings',), ('enabled',)]
+# Number of ports to fetch properties for at the same time, if the NPB can't return them for all ports in one request
+bulk_fetch_concurrency = 8
+# NPB connections open in this process, by NPB address, port, username and a hash of the password
+nto_sessions = {}
+nto_sessions_lock = threading.Lock()
+nto_session_locks = {}                  # Locks held while logging in, by session key
+# Properties of NPB objects kept in the per-session inventory
+inventory_port_properties = 'id,name,default_name,enabled,mode,keywords,port_group_id,source_filter_list,dest_filter_list'
+inventory_port_group_properties = 'id,name,default_name,mode,type,keywords,port_list'
+inventory_filter_properties = 'id,name,default_name,mode,keywords,source_port_list,dest_port_list,source_port_group_list,dest_port_group_list'
+
+# Whether changes to NPB objects are only planned and printed, instead of applied, by actions run in the current thread
+ztp_plan_context = threading.local()
 
 # DEFINE FUNCTIONS HERE
 
-# Connect an existing dynamic filter to a set of ports via keyword search
+def get_plan_only():
+    return getattr(ztp_plan_context, 'plan_only', False)
+
+def set_plan_only(plan_only):
+    ztp_plan_context.plan_only = plan_only
+
+# Key of an NPB connection. The password is a part of it, so that a connection is only reused with the password it was opened with
+def nto_session_key(host_ip, port, username, password):
+    return (host_ip, str(port), username, hashlib.sha256(password.encode('utf-8') if not isinstance(password, bytes) else password).hexdigest())
+
+# Connect to an NPB, reusing an existing connection to the same NPB with the same credentials if there is one in this process
+# This way actions that run one after another in the same process share a session, along with its inventory and cached information
+# Logging in holds a lock of its session key only, so that a slow or unreachable NPB doesn't hold up connections to others
+def nto_connect(host_ip, port, username, password):
+    session_key = nto_session_key(host_ip, port, username, password)
+    with nto_sessions_lock:
+        session_lock = nto_session_locks.setdefault(session_key, threading.Lock())
+    with session_lock:
+        with nto_sessions_lock:
+            nto = nto_sessions.get(session_key)
+        if nto is None:
+            nto = NtoSession(host=host_ip, username=username, password=password, port=port)
+            with nto_sessions_lock:
+                nto_sessions[session_key] = nto
+        return nto
+
+# Forget the inventory and system information kept with a session once they are older than max_age seconds,
+# so that a long-running process picks up changes made to the NPB by others
+def expire_nto_session_caches(host_ip, port, username, password, max_age):
+    with nto_sessions_lock:
+        nto = nto_sessions.get(nto_session_key(host_ip, port, username, password))
+    if nto is None:
+        return
+    inventory = getattr(nto, 'ztp_inventory', None)
+    if inventory is not None and time.time() - inventory.created >= max_age:
+        nto.ztp_inventory = None
+    if time.time() - getattr(nto, 'ztp_system_cache_loaded', 0) >= max_age:
+        nto.ztp_system_cache = None
+
+# Run a function over a list of items using a bounded pool of worker threads
+# Yields (item, result) pairs in the order the items finish, so that the caller can report progress
+# and keep its own bookkeeping in a single thread. An exception raised by the function is yielded as the result
+# Input
+# - Function to call with each item as the only argument
+# - List of items
+# - Maximum number of items to process at the same time
+def run_in_parallel(func, item_list, max_workers):
+    work_queue = queue.Queue()
+    result_queue = queue.Queue()
+    for item in item_list:
+        work_queue.put(item)
+    # Workers count REST calls against the same action as the caller, send output to the same client when serving a request,
+    # and only plan changes if the caller does
+    action = get_metrics_action()
+    request = get_ztp_request()
+    plan_only = get_plan_only()
+
+    def worker():
+        set_metrics_action(action)
+        set_ztp_request(request)
+        set_plan_only(plan_only)
+        while True:
+            try:
+                item = work_queue.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                result = func(item)
+            except Exception as e:
+                result = e
+            result_queue.put((item, result))
+
+    worker_list = []
+    for i in range(max(1, min(max_workers, len(item_list)))):
+        worker_thread = threading.Thread(target=worker)
+        worker_thread.daemon = True
+        worker_thread.start()
+        worker_list.append(worker_thread)
+
+    for i in range(len(item_list)):
+        yield result_queue.get()
+
+    for worker_thread in worker_list:
+        worker_thread.join()
+
+# Retrieve properties of all objects of a type in a single request, using a projection on the collection URL
+# Input
+# - NTO object as a connection to an NPB
+# - Object type as used in Web API URLs: ports, port_groups or filters
+# - Comma-separated list of properties to retrieve
+# Returns a list of object details, or None if the NPB returned something else or left any of the properties out,
+# as NPBs that don't support projections may ignore them and list objects with their IDs only
+def nto_get_all_objects_properties(nto, object_type, properties):
+    object_list = nto._callServer('GET', '/api/%s?properties=%s' % (object_type, properties), None)
+    if not isinstance(object_list, list):
+        return None
+    property_list = properties.split(',')
+    for object_details in object_list:
+        if not isinstance(object_details, dict) or len([key for key in property_list if key not in object_details]) > 0:
+            return None
+    return object_list
+
+# HTTP status of an error raised by an NPB call, None if the error is not an HTTP error
+def nto_error_status(error):
+    if len(getattr(error, 'args', ())) > 0 and isinstance(error.args[0], dict):
+        return error.args[0].get('status_code')
+    return None
+
+# Retrieve a statistics snapshot for a set of ports with a single request
+# Input
+# - NTO object as a connection to an NPB
+# - List of port IDs
+# - List of statistics names to retrieve
+# Returns a list of snapshots, one per port, with port ID, default_name, stats_time in milliseconds and the statistics
+def nto_get_ports_stats(nto, port_id_list, stat_names):
+    stats = nto._callServer('POST', '/api/stats', json.dumps({'stat_name': stat_names, 'port': port_id_list}))
+    if isinstance(stats, dict):
+        return stats.get('stats_snapshot') or []
+    return []
+
+# Retrieve properties for a set of ports using as few requests as possible
+# All ports are listed in one request with the properties needed. If the NPB doesn't support that, or the listing
+# is missing any of the properties, they are fetched port by port, bulk_fetch_concurrency ports at a time
+# Input
+# - NTO object as a connection to an NPB
+# - List of port IDs or names to retrieve properties for
+# - Comma-separated list of properties to retrieve. Port id, name and default_name are always included
+# Returns a dictionary of port details keyed by port ID or name, as requested. Ports that couldn't be retrieved are left out
+def get_ports_properties(nto, port_key_list, properties):
+    property_list = properties.split(',')
+    for key in ['default_name', 'name', 'id']:
+        if key not in property_list:
+            property_list.insert(0, key)
+    properties = ','.join(property_list)
+
+    port_details_list = {}
+    if len(port_key_list) == 0:
+        return port_details_list
+
+    try:
+        all_port_list = nto_get_all_objects_properties(nto, 'ports', properties)
+    except Exception:
+        all_port_list = None
+    if isinstance(all_port_list, list):
+        port_key_set = set(port_key_list)
+        for port_details in all_port_list:
+            for key in ['id', 'name', 'default_name']:
+                if port_details.get(key) in port_key_set:
+                    port_details_list[port_details[key]] = port_details
+        return port_details_list
+
+    def get_port_properties(port_key):
+        return nto.getPortProperties(str(port_key), properties)
+
+    for port_key, port_details in run_in_parallel(get_port_properties, port_key_list, bulk_fetch_concurrency):
+        if isinstance(port_details, dict):
+            port_details_list[port_key] = port_details
+    return port_details_list
+
+# Search for ports and retrieve properties for all of them, as a bulk alternative to calling getPortProperties for each search result
+# Returns a list of port details in the search result order
+def search_ports_properties(nto, search_terms, properties):
+    port_list = nto.searchPorts(search_terms)
+    port_details_list = get_ports_properties(nto, [port['id'] for port in port_list], properties)
+    return [port_details_list[port['id']] for port in port_list if port['id'] in port_details_list]
+
+# Search for ports to connect to a dynamic filter via keywords
 # Input 
 # - NTO object as a connection to an NPB
-# - Dynamic filter ID
 # - Ports keywords to search for
 # - Direction of the connection - input or output
-def df_connect_via_tags(nto, df_id, tags, connection_mode):
+# Returns a list of matching port IDs, or None if the connection mode is not supported
+def search_df_tag_ports(nto, tags, connection_mode):
     # Check the connection mode is supported
     if connection_mode not in df_connection_modes_supported.keys():
         print("Error: connection mode %s is not supported" % connection_mode)
-        return
+        return None
     
     # Search for ports to be connected - can't be a part of port group. Must already be in the required mode
-    port_list = nto.searchPorts({'enabled': True, 'port_group_id': None, 'mode': df_connection_modes_supported[connection_mode]})
+    inventory = get_nto_inventory(nto)
+    port_list = inventory.search_ports(keywords=tags, mode=df_connection_modes_supported[connection_mode], enabled=True, ungrouped=True)
     matching_port_id_list = []
     for port in port_list:
-        port_details = nto.getPortProperties(str(port['id']), 'id,keywords,mode')
-        if port_details is not None:
-            for keyword in tags:
-                if keyword in port_details['keywords'] and port['id'] not in matching_port_id_list:
-                    matching_port_id_list.append(port['id'])
-                    print("Found port %s with ID %d, matching mode and keyword %s" % (port['name'], port['id'], keyword))
+        for keyword in tags:
+            if keyword in port['keywords'] and port['id'] not in matching_port_id_list:
+                matching_port_id_list.append(port['id'])
+                print("Found port %s with ID %d, matching mode and keyword %s" % (port['name'], port['id'], keyword))
                 
     if len(matching_port_id_list) == 0:
         print("No matching ports found with keywords %s" % " ".join(tags))
-        return
     else:
         print("Found %d matching ports" % (len(matching_port_id_list)))
+    return matching_port_id_list
+
+# Connect an existing dynamic filter to a set of ports via keyword search
+# Input 
+# - NTO object as a connection to an NPB
+# - Dynamic filter ID
+# - Ports keywords to search for
+# - Direction of the connection - input or output
+def df_connect_via_tags(nto, df_id, tags, connection_mode):
+    matching_port_id_list = search_df_tag_ports(nto, tags, connection_mode)
+    if matching_port_id_list is None or len(matching_port_id_list) == 0:
+        return
 
     # Retrieve a list of existing ports connected to the DF
     if connection_mode == 'input':
@@ -58,7 +264,18 @@ def df_connect_via_tags(nto, df_id, tags, connection_mode):
     else:
         df_property = 'dest_port_list'
         
-    connect_list = nto.getFilterProperty(df_id, df_property) # TODO handle 404 not found situation
+    inventory = get_nto_inventory(nto)
+    df = inventory.get_filter(int(df_id))
+    if df is not None:
+        connect_list = list(df[df_property])
+    else:
+        try:
+            connect_list = nto.getFilterProperty(df_id, df_property)
+        except Exception as e:
+            if nto_error_status(e) != 404:
+                raise
+            print("Error: can't find a dynamic filter with ID %s" % df_id)
+            return
     connect_count_current = len(connect_list)
     for port_id in matching_port_id_list:
         if port_id not in connect_list:
@@ -68,6 +285,259 @@ def df_connect_via_tags(nto, df_id, tags, connection_mode):
     if len(connect_list) != connect_count_current:
         print("Updating %s filter connections with port IDs: %s" % (connection_mode, " ".join(str(i) for i in matching_port_id_list)))
         nto.modifyFilter(df_id, {df_property: connect_list})
+        inventory.update_filter(int(df_id), {df_property: connect_list})
     else:
         print("No changes to %s filter connections are needed" % connection_mode)
-    
\ No newline at end of file
+    
+# Add port attribute changes to a pending change set, skipping the ones that are already in effect
+# Attributes the port doesn't have are skipped as well. Dictionary values, like FEC settings, are compared by the keys being set
+# Input
+# - Pending changes for a port, a dictionary of attributes to update
+# - Current port details
+# - Dictionary of attributes to change
+def stage_port_changes(pending_changes, port_details, changes):
+    for key in changes:
+        if key not in port_details:
+            continue
+        value = changes[key]
+        current_value = port_details[key]
+        if isinstance(value, dict) and isinstance(current_value, dict):
+            if all(key_value in current_value.items() for key_value in value.items()):
+                continue
+        elif value == current_value:
+            continue
+        pending_changes[key] = value
+    return pending_changes
+
+# Split pending port changes into the smallest number of requests that respect port_attribute_sequenced_pairs
+def split_port_changes(pending_changes):
+    change_list = []
+    remaining_changes = dict(pending_changes)
+    while len(remaining_changes) > 0:
+        blocked_keys = [after for before, after in port_attribute_sequenced_pairs if before in remaining_changes and after in remaining_changes]
+        changes = dict((key, remaining_changes[key]) for key in remaining_changes if key not in blocked_keys)
+        for key in changes:
+            del remaining_changes[key]
+        change_list.append(changes)
+    return change_list
+
+# Write pending port changes, merged into as few modifyPort requests as possible
+# If the NPB rejects a combined request, its attributes are written one group at a time following port_attribute_write_order
+# Returns the number of modifyPort requests issued
+def apply_port_changes(nto, port_id, pending_changes):
+    write_count = 0
+    for changes in split_port_changes(pending_changes):
+        write_count += 1
+        try:
+            nto.modifyPort(str(port_id), changes)
+            continue
+        except Exception:
+            if len(changes) == 1:
+                raise
+        ordered_key_groups = list(port_attribute_write_order)
+        ordered_key_groups.append(tuple(key for key in changes if not any(key in key_group for key_group in port_attribute_write_order)))
+        for key_group in ordered_key_groups:
+            group_changes = dict((key, changes[key]) for key in key_group if key in changes)
+            if len(group_changes) > 0:
+                nto.modifyPort(str(port_id), group_changes)
+                write_count += 1
+    return write_count
+
+# In-process inventory of NPB ports, port groups and filters
+# Each collection is loaded with a single listing request the first time it is needed, and indexed so that lookups
+# by ID, name, keyword, mode or port group membership don't need any REST calls. Actions update the inventory in place
+# after their own writes, so that it stays valid for the rest of the session. Use get_nto_inventory() to get the
+# inventory shared by everything that works with the same NTO object
+class NpbInventory(object):
+
+    def __init__(self, nto):
+        self.nto = nto
+        self.created = time.time()
+        self.lock = threading.RLock()
+        self.ports = None
+        self.port_groups = None
+        self.filters = None
+
+    # List all objects of a type with a projection, falling back to a search for IDs followed by per-object retrieval
+    def _load_objects(self, object_type, properties, search_objects, get_object):
+        try:
+            object_list = nto_get_all_objects_properties(self.nto, object_type, properties)
+        except Exception:
+            object_list = None
+        if not isinstance(object_list, list):
+            object_list = []
+            for object_id, object_details in run_in_parallel(get_object, [obj['id'] for obj in search_objects({})], bulk_fetch_concurrency):
+                if isinstance(object_details, dict):
+                    object_list.append(object_details)
+        return dict((obj['id'], obj) for obj in object_list)
+
+    ## Ports
+
+    def _index_port(self, port):
+        for name in set([port.get('name'), port.get('default_name')]):
+            if name is not None:
+                self.port_ids_by_name[name] = port['id']
+        for keyword in port.get('keywords') or []:
+            self.port_ids_by_keyword.setdefault(keyword, set()).add(port['id'])
+        self.port_ids_by_mode.setdefault(port.get('mode'), set()).add(port['id'])
+        self.port_ids_by_group.setdefault(port.get('port_group_id'), set()).add(port['id'])
+
+    def _unindex_port(self, port):
+        for name in [port.get('name'), port.get('default_name')]:
+            if self.port_ids_by_name.get(name) == port['id']:
+                del self.port_ids_by_name[name]
+        for keyword in port.get('keywords') or []:
+            self.port_ids_by_keyword.get(keyword, set()).discard(port['id'])
+        self.port_ids_by_mode.get(port.get('mode'), set()).discard(port['id'])
+        self.port_ids_by_group.get(port.get('port_group_id'), set()).discard(port['id'])
+
+    def load_ports(self):
+        with self.lock:
+            if self.ports is None:
+                def get_port(port_id):
+                    return self.nto.getPortProperties(str(port_id), inventory_port_properties)
+                self.ports = self._load_objects('ports', inventory_port_properties, self.nto.searchPorts, get_port)
+                self.port_ids_by_name = {}
+                self.port_ids_by_keyword = {}
+                self.port_ids_by_mode = {}
+                self.port_ids_by_group = {}
+                for port in self.ports.values():
+                    self._index_port(port)
+        return self.ports
+
+    # Look up a port by ID or name
+    def get_port(self, port_key):
+        self.load_ports()
+        if port_key in self.ports:
+            return self.ports[port_key]
+        if port_key in self.port_ids_by_name:
+            return self.ports[self.port_ids_by_name[port_key]]
+        return None
+
+    # Search for ports, the same way searchPorts would
+    # Input
+    # - List of keywords, a port must have at least one of them. None to skip keyword matching
+    # - Port mode, None for any
+    # - Enabled state, None for any
+    # - True to only return ports that are not members of any port group
+    # - True to only return ports without any filter connections
+    # Returns a list of port details, sorted by port ID
+    def search_ports(self, keywords=None, mode=None, enabled=None, ungrouped=False, unconnected=False):
+        with self.lock:
+            self.load_ports()
+            if keywords is not None:
+                port_id_set = set()
+                for keyword in keywords:
+                    port_id_set.update(self.port_ids_by_keyword.get(keyword, set()))
+            else:
+                port_id_set = set(self.ports.keys())
+            if mode is not None:
+                port_id_set.intersection_update(self.port_ids_by_mode.get(mode, set()))
+            if ungrouped:
+                port_id_set.intersection_update(self.port_ids_by_group.get(None, set()))
+            port_list = []
+            for port_id in sorted(port_id_set):
+                port = self.ports[port_id]
+                if enabled is not None and port.get('enabled') != enabled:
+                    continue
+                if unconnected and (len(port.get('source_filter_list') or []) > 0 or len(port.get('dest_filter_list') or []) > 0):
+                    continue
+                port_list.append(port)
+            return port_list
+
+    # Update inventory after a port was modified
+    def update_port(self, port_id, changes):
+        with self.lock:
+            if self.ports is None or port_id not in self.ports:
+                return
+            port = self.ports[port_id]
+            self._unindex_port(port)
+            port.update(changes)
+            self._index_port(port)
+
+    ## Port groups
+
+    def load_port_groups(self):
+        with self.lock:
+            if self.port_groups is None:
+                def get_port_group(pg_id):
+                    return self.nto.getPortGroup(str(pg_id))
+                self.port_groups = self._load_objects('port_groups', inventory_port_group_properties, self.nto.searchPortGroups, get_port_group)
+        return self.port_groups
+
+    def get_port_group(self, pg_id):
+        return self.load_port_groups().get(pg_id)
+
+    # Look up port groups by name, returns a list in case there is more than one with the same name
+    def search_port_groups(self, name):
+        with self.lock:
+            return [pg for pg in self.load_port_groups().values() if pg.get('name') == name or pg.get('default_name') == name]
+
+    # Add a port group created during the session
+    def add_port_group(self, pg_details):
+        with self.lock:
+            self.load_port_groups()[pg_details['id']] = pg_details
+
+    # Update inventory after a port group was modified, including group membership of its ports
+    def update_port_group(self, pg_id, changes):
+        with self.lock:
+            if self.port_groups is None or pg_id not in self.port_groups:
+                return
+            pg = self.port_groups[pg_id]
+            if 'port_list' in changes and self.ports is not None:
+                for port_id in pg.get('port_list') or []:
+                    if port_id not in changes['port_list']:
+                        self.update_port(port_id, {'port_group_id': None})
+                for port_id in changes['port_list']:
+                    self.update_port(port_id, {'port_group_id': pg_id})
+            pg.update(changes)
+
+    ## Filters
+
+    def load_filters(self):
+        with self.lock:
+            if self.filters is None:
+                def get_filter(df_id):
+                    return self.nto.getFilter(str(df_id))
+                self.filters = self._load_objects('filters', inventory_filter_properties, self.nto.searchFilters, get_filter)
+        return self.filters
+
+    def get_filter(self, df_id):
+        return self.load_filters().get(df_id)
+
+    # Look up filters by name, returns a list in case there is more than one with the same name
+    def search_filters(self, name):
+        with self.lock:
+            return [df for df in self.load_filters().values() if df.get('name') == name or df.get('default_name') == name]
+
+    # Add a filter created during the session
+    def add_filter(self, df_details):
+        with self.lock:
+            self.load_filters()[df_details['id']] = df_details
+
+    # Update inventory after a filter was modified, including filter connections of its ports
+    def update_filter(self, df_id, changes):
+        with self.lock:
+            if self.filters is None or df_id not in self.filters:
+                return
+            df = self.filters[df_id]
+            if self.ports is not None:
+                for df_property, port_property in [('source_port_list', 'dest_filter_list'), ('dest_port_list', 'source_filter_list')]:
+                    if df_property not in changes:
+                        continue
+                    for port_id in set(df.get(df_property) or []).symmetric_difference(changes[df_property]):
+                        if port_id not in self.ports:
+                            continue
+                        port_filter_list = [i for i in self.ports[port_id].get(port_property) or [] if i != df_id]
+                        if port_id in changes[df_property]:
+                            port_filter_list.append(df_id)
+                        self.ports[port_id][port_property] = port_filter_list
+            df.update(changes)
+
+# Get the inventory shared by everything working with the same NTO object, creating it on first use
+def get_nto_inventory(nto):
+    inventory = getattr(nto, 'ztp_inventory', None)
+    if inventory is None:
+        inventory = NpbInventory(nto)
+        nto.ztp_inventory = inventory
+    return inventory
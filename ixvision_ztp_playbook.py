@@ -0,0 +1,181 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_playbook.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Run a multi-step ZTP policy against an NPB in a single process
+# 1. A playbook is a JSON file with an ordered list of steps. Each step is an ixvztp action with its parameters, written the same way as on the command line
+# 2. All the steps run against one NPB session, sharing its inventory and cached system information
+# 3. Steps listed together under "parallel" don't depend on each other and run at the same time. Output of each step is printed once it is done
+# 4. Execution stops after the first step that fails
+#
+# Playbook example:
+# {"steps": [
+#     "portup",
+#     "lldptag -t TAP,SPAN,probe",
+#     {"parallel": ["pgform -t tap -n TAPs -m net", "pgform -t span -n SPANs -m net", "pgform -t probe -n PROBES -m lb"]},
+#     "dfform -n AllTraffic -i TAPs -o PROBES -m all",
+#     "dfform -n AllTraffic -i SPANs -o PROBES -m all"
+# ]}
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import sys
+import json
+import time
+import shlex
+import threading
+
+from ixvision_ztp_ntolib import *
+
+# DEFINE VARs HERE
+playbook_actions_supported = ['sysinfo', 'portup', 'lldptag', 'portmode', 'pgform', 'dfform', 'dfupdate']
+playbook_parallel_steps_default = 4
+
+# DEFINE FUNCTIONS HERE
+
+# Standard output replacement that holds output of selected threads until they are done, so that output of parallel steps doesn't mix
+class PlaybookStepOutput(object):
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = {}
+
+    # Start holding output of the current thread
+    def capture(self):
+        self.buffers[threading.current_thread()] = []
+
+    # Stop holding output of the current thread, returns the output held so far
+    def release(self):
+        return ''.join(self.buffers.pop(threading.current_thread(), []))
+
+    def write(self, data):
+        buffer = self.buffers.get(threading.current_thread())
+        if buffer is None:
+            self.stream.write(data)
+        else:
+            buffer.append(data)
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+# Parse a single playbook step into a list of command line arguments. Returns None if the step isn't valid
+def parse_playbook_step(step):
+    if isinstance(step, list):
+        step_argv = [str(arg) for arg in step]
+    elif isinstance(step, str) or (sys.version_info[0] < 3 and isinstance(step, unicode)):
+        step_argv = shlex.split(str(step))
+    else:
+        return None
+    if len(step_argv) == 0 or step_argv[0] not in playbook_actions_supported:
+        return None
+    return step_argv
+
+# Load a playbook from a JSON file
+# The file has either a list of steps, or a dictionary with the list under "steps". A step is an action with parameters as
+# a string or a list of command line arguments, or a dictionary with a list of such steps under "parallel"
+# Returns a list of stages, each stage is a list of steps to run in parallel, or None if the playbook can't be used
+def load_playbook(filename):
+    try:
+        with open(filename) as f:
+            playbook = json.load(f)
+    except Exception as e:
+        print("Error: can't read playbook from %s: %s" % (filename, e))
+        return None
+
+    if isinstance(playbook, dict):
+        playbook = playbook.get('steps')
+    if not isinstance(playbook, list) or len(playbook) == 0:
+        print("Error: playbook %s has no steps" % filename)
+        return None
+
+    stage_list = []
+    for step in playbook:
+        if isinstance(step, dict) and isinstance(step.get('parallel'), list):
+            stage = [parse_playbook_step(parallel_step) for parallel_step in step['parallel']]
+        else:
+            stage = [parse_playbook_step(step)]
+        if len(stage) == 0 or None in stage:
+            print("Error: playbook step %s is not valid, supported actions are: %s" % (json.dumps(step), " | ".join(playbook_actions_supported)))
+            return None
+        stage_list.append(stage)
+    return stage_list
+
+# Run a single step, returns whether it succeeded and how long it took
+def run_playbook_step(step_argv, run_step):
+    start_time = time.time()
+    try:
+        succeeded = run_step(step_argv) is not False
+    except SystemExit as e:
+        succeeded = e.code is None or e.code == 0
+    except Exception as e:
+        print("Error: step failed: %s" % e)
+        succeeded = False
+    return succeeded, time.time() - start_time
+
+# Run playbook steps, stage by stage
+# Input
+# - List of stages as returned by load_playbook()
+# - Function to run a step, taking a list of command line arguments. The step fails if the function raises an exception,
+#   exits with a non-zero code or returns False
+# - Maximum number of parallel steps to run at the same time
+# Returns True if all the steps succeeded
+def run_playbook(stage_list, run_step, max_parallel_steps=playbook_parallel_steps_default):
+    step_results = []
+    playbook_start_time = time.time()
+    for stage in stage_list:
+        stage_succeeded = True
+        if len(stage) == 1:
+            print('')
+            print("Playbook step: %s" % " ".join(stage[0]))
+            succeeded, duration = run_playbook_step(stage[0], run_step)
+            step_results.append((" ".join(stage[0]), succeeded, duration))
+            stage_succeeded = succeeded
+        else:
+            print('')
+            print("Playbook steps in parallel: %s" % ", ".join(" ".join(step_argv) for step_argv in stage))
+            step_output = PlaybookStepOutput(sys.stdout)
+
+            def run_captured_step(step_index):
+                step_output.capture()
+                try:
+                    succeeded, duration = run_playbook_step(stage[step_index], run_step)
+                finally:
+                    output = step_output.release()
+                return succeeded, duration, output
+
+            sys.stdout = step_output
+            try:
+                for step_index, result in run_in_parallel(run_captured_step, list(range(len(stage))), max_parallel_steps):
+                    print('')
+                    print("Playbook step: %s" % " ".join(stage[step_index]))
+                    if isinstance(result, Exception):
+                        print("Error: step failed: %s" % result)
+                        succeeded, duration = False, 0
+                    else:
+                        succeeded, duration, output = result
+                        sys.stdout.write(output)
+                    step_results.append((" ".join(stage[step_index]), succeeded, duration))
+                    stage_succeeded = stage_succeeded and succeeded
+            finally:
+                sys.stdout = step_output.stream
+        if not stage_succeeded:
+            print("Stopping the playbook after a failed step")
+            break
+
+    print('')
+    step_count = sum(len(stage) for stage in stage_list)
+    failed_count = 0
+    for step_label, succeeded, duration in step_results:
+        if not succeeded:
+            failed_count += 1
+        print("%-8s  %6.1fs  %s" % ('OK' if succeeded else 'FAILED', duration, step_label))
+    print("%d of %d steps succeeded in %.1fs" % (len(step_results) - failed_count, step_count, time.time() - playbook_start_time))
+    return failed_count == 0 and len(step_results) == step_count
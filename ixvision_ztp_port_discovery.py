@@ -19,9 +19,240 @@
 
 from ksvisionlib import *
 
-def discover_ports(host_ip, port, username, password, keyword=''):
+from ixvision_ztp_ntolib import *
 
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_ztp_debug.log")
+# DEFINE VARs HERE
+# Maximum number of ports to configure at the same time within a discovery phase
+port_config_concurrency_default = 8
+# Port properties port discovery works with, retrieved for all ports in scope at once
+discovery_port_properties = 'id,default_name,enabled,mode,media_type,link_settings,link_status,forward_error_correction_settings,lldp_receive_enabled,keywords,misc'
+# Time in seconds to wait at most for a link to come up after a port was enabled, per media type
+link_settle_timeouts = {'QSFP28': 15, 'QSFP_PLUS_40G': 12, 'SFP_PLUS_10G': 10, 'SFP_1G': 12}
+link_settle_timeout_default = 10
+# Once links came up on ports of the same discovery phase and media type, ports that are still down are only waited for this many times
+# the slowest time-to-link seen among them, but not less than the minimum, as links of the same kind that are going to come up do so
+# in about the same time. Links of other phases and media types, like fast 100G ones or slow 1G auto-negotiation, don't cut the wait
+link_settle_factor = 2.0
+link_settle_min = 3.0
+# Link status polling starts with a short interval that backs off up to the maximum
+link_poll_interval_start = 0.5
+link_poll_interval_max = 4
+link_poll_backoff = 1.5
+
+# Port discovery phases, tried in order on ports that are still down. Each phase is defined by:
+# - name: short name to report the phase with
+# - description: what the phase does, printed when the phase starts
+# - media_types: list of port media types the phase applies to
+# - match: optional dictionary of port attributes a port must have to take part in the phase
+# - exclude_board_types: optional list of board types the phase doesn't apply to
+# - settings: port attributes to configure for the phase. Ports are enabled if 'enabled' is set to True
+# - timeout: optional time in seconds to wait for links to come up. Defaults to link_settle_timeouts for the resulting media type
+# An alternative list of phases can be loaded from a JSON file with portup -P/--phases
+port_discovery_phases = [
+    {'name': '100G RS-FEC', 'description': '100G port discovery for QSFP28+ media type, with Forward Error Correction set to ON',
+     'media_types': ['QSFP28'],
+     'settings': {'mode': 'NETWORK', 'forward_error_correction_settings': {'enabled': True, 'fec_type': 'RS_FEC'}, 'enabled': True}},
+    {'name': '100G no FEC', 'description': '100G port discovery for QSFP28+ media type, now trying with Forward Error Correction set to OFF',
+     'media_types': ['QSFP28'],
+     'settings': {'mode': 'NETWORK', 'forward_error_correction_settings': {'enabled': False}, 'enabled': True}},
+    {'name': '40G', 'description': '40G port discovery for QSFP+ media type',
+     'media_types': ['QSFP_PLUS_40G'],
+     'settings': {'mode': 'NETWORK', 'enabled': True}},
+    {'name': '10G', 'description': '10G port discovery for SFP+ media type',
+     'media_types': ['SFP_PLUS_10G', 'SFP_1G'],
+     'settings': {'media_type': 'SFP_PLUS_10G', 'link_settings': '10G_FULL', 'mode': 'NETWORK', 'enabled': True}},
+    {'name': '1G/Auto', 'description': '1G/Auto port discovery for SFP+ media type',
+     'media_types': ['SFP_PLUS_10G'], 'match': {'enabled': True},
+     'exclude_board_types': ['EPIPHONE_100_MAIN'], # 1G is not supported on E100
+     'settings': {'media_type': 'SFP_1G', 'link_settings': 'AUTO', 'mode': 'NETWORK', 'enabled': True}},
+]
+
+# DEFINE FUNCTIONS HERE
+
+# Time in seconds to wait for links to come up: the timeout until any link comes up, then a few times the slowest time-to-link seen
+# Input
+# - Times-to-link of ports of the same phase and media type that came up so far
+# - Time in seconds to wait at most
+def link_settle_time(link_time_list, timeout):
+    if len(link_time_list) == 0:
+        return timeout
+    return min(timeout, max(link_settle_min, max(link_time_list) * link_settle_factor))
+
+# Wait for links to come up on ports enabled during a discovery phase
+# Only the ports passed in are polled, and each one is dropped from polling as soon as its link is up.
+# Polling stops once all the ports are up, or when the time to wait runs out. The time to wait for a port is cut short once
+# links of other ports of the same media type come up during this phase, to a few times the slowest time-to-link among them
+# Input
+# - NTO object as a connection to an NPB
+# - NPB address to report port status with
+# - Dictionary of discovered ports to update with the latest port details, status and time-to-link
+# - List of port IDs to poll
+# - Time in seconds to wait at most for the links to come up
+def settle_port_links(nto, host_ip, discoveredPortList, port_id_list, timeout):
+    if len(port_id_list) == 0:
+        return
+
+    print('Waiting for port status change to propagate...')
+    settle_start = time.time()
+    poll_interval = link_poll_interval_start
+    unresolved_port_id_list = list(port_id_list)
+    link_times = {}                     # Times-to-link of ports polled here, by media type
+    while len(unresolved_port_id_list) > 0:
+        port_deadlines = {}
+        for port_id in unresolved_port_id_list:
+            media_type = discoveredPortList[port_id]['details'].get('media_type')
+            port_deadlines[port_id] = settle_start + link_settle_time(link_times.get(media_type, []), timeout)
+        time.sleep(max(0, min(poll_interval, min(port_deadlines.values()) - time.time())))
+        poll_time = time.time()
+        still_down_port_id_list = []
+        port_details_list = get_ports_properties(nto, unresolved_port_id_list, discovery_port_properties)
+        for port_id in unresolved_port_id_list:
+            timed_out = poll_time >= port_deadlines[port_id]
+            if port_id not in port_details_list:
+                # Failed to retrieve the port status, try again on the next poll
+                if not timed_out:
+                    still_down_port_id_list.append(port_id)
+                continue
+            ntoPortDetails = port_details_list[port_id]
+            # Update the list with the latest config and status
+            discoveredPortList[port_id]['details'] = ntoPortDetails
+            if ntoPortDetails['link_status']['link_up']:
+                discoveredPortList[port_id]['ZTPSucceeded'] = True
+                discoveredPortList[port_id]['link_time'] = round(time.time() - settle_start, 1)
+                link_times.setdefault(ntoPortDetails.get('media_type'), []).append(discoveredPortList[port_id]['link_time'])
+                print("Collected port %s:%s status: UP in %.1fs" % (host_ip, ntoPortDetails['default_name'], discoveredPortList[port_id]['link_time']))
+            elif timed_out:
+                discoveredPortList[port_id]['ZTPSucceeded'] = False
+                print("Collected port %s:%s status: DOWN" % (host_ip, ntoPortDetails['default_name']))
+            else:
+                still_down_port_id_list.append(port_id)
+        unresolved_port_id_list = still_down_port_id_list
+        poll_interval = min(poll_interval * link_poll_backoff, link_poll_interval_max)
+
+# Describe port attribute changes for reporting
+def describe_port_changes(changes):
+    description_list = []
+    if 'media_type' in changes:
+        description_list.append("media %s" % changes['media_type'])
+    if 'link_settings' in changes:
+        description_list.append("link %s" % changes['link_settings'])
+    if 'mode' in changes:
+        description_list.append("mode %s" % changes['mode'])
+    if 'forward_error_correction_settings' in changes:
+        description_list.append("FEC %s" % ('ON' if changes['forward_error_correction_settings']['enabled'] else 'OFF'))
+    if 'enabled' in changes:
+        description_list.append('ENABLED' if changes['enabled'] else 'DISABLED')
+    return ", ".join(description_list)
+
+# Configure a discovered port with settings for a discovery phase
+# Only the settings that differ from the current port details are written, merged into a single modifyPort where the NPB allows it.
+# Returns a list of messages to report and whether the port was enabled, as expected by configure_ports_in_parallel()
+def configure_discovered_port(nto, host_ip, port_id, port, port_settings):
+    messages = []
+    pending_changes = stage_port_changes({}, port['details'], port_settings)
+    if len(pending_changes) > 0:
+        apply_port_changes(nto, port_id, pending_changes)
+        get_nto_inventory(nto).update_port(port_id, pending_changes)
+        messages.append("Configured port %s:%s with %s" % (host_ip, port['details']['default_name'], describe_port_changes(pending_changes)))
+    return messages, 'enabled' in port['details'] and port_settings.get('enabled', False)
+
+# Configure a list of ports for a discovery phase using a bounded pool of workers
+# Each port goes through its configuration sequence independently from the others.
+# Messages for a port are printed together once it is done, so the output stays readable when ports finish out of order
+# Input
+# - List of port IDs to configure
+# - Function to configure a port by ID, returning a list of messages to report and whether the port was enabled
+# - Maximum number of ports to configure at the same time
+# Returns a list of port IDs that were enabled, and a list of port IDs that failed to configure
+def configure_ports_in_parallel(port_id_list, configure_port, concurrency):
+    enabled_port_id_list = []
+    failed_port_id_list = []
+    for port_id, result in run_in_parallel(configure_port, port_id_list, concurrency):
+        if isinstance(result, Exception):
+            print("Failed to configure port ID %s: %s" % (port_id, result))
+            failed_port_id_list.append(port_id)
+            continue
+        messages, enabled = result
+        for message in messages:
+            print(message)
+        if enabled:
+            enabled_port_id_list.append(port_id)
+    return enabled_port_id_list, failed_port_id_list
+
+# Check a list of port discovery phases loaded from a file
+# Returns an error message, or None if the phases are valid
+def validate_port_discovery_phases(phase_list):
+    if not isinstance(phase_list, list) or len(phase_list) == 0:
+        return "a non-empty list of phases is required"
+    for phase in phase_list:
+        if not isinstance(phase, dict):
+            return "each phase must be a dictionary"
+        for key in ['name', 'media_types', 'settings']:
+            if key not in phase:
+                return "phase %s is missing %s" % (phase.get('name', ''), key)
+        if not isinstance(phase['media_types'], list) or not isinstance(phase['settings'], dict):
+            return "phase %s must have a list of media_types and a dictionary of settings" % (phase['name'])
+    return None
+
+# Index discovered ports by media type, to find candidates for discovery phases without going through all the ports
+def index_ports_by_media_type(discoveredPortList):
+    media_type_index = {}
+    for port_id in discoveredPortList:
+        media_type_index.setdefault(discoveredPortList[port_id]['details']['media_type'], []).append(port_id)
+    return media_type_index
+
+# Select ports that are still down and match the media types and conditions of a discovery phase
+def select_phase_candidates(discoveredPortList, media_type_index, phase):
+    candidate_port_id_list = []
+    for media_type in phase['media_types']:
+        for port_id in media_type_index.get(media_type, []):
+            portDetails = discoveredPortList[port_id]['details']
+            if portDetails['link_status']['link_up']:
+                continue
+            if 'misc' in portDetails and portDetails['misc'].get('board_type') in phase.get('exclude_board_types', []):
+                continue
+            if all(portDetails.get(key) == value for key, value in phase.get('match', {}).items()):
+                candidate_port_id_list.append(port_id)
+    return candidate_port_id_list
+
+# Time to wait at most for links to come up after a discovery phase, the one set for the phase, the one given for all phases,
+# or the one for the media type
+def port_discovery_phase_timeout(phase, link_timeout=None):
+    if 'timeout' in phase:
+        return phase['timeout']
+    if link_timeout is not None:
+        return link_timeout
+    media_type = phase['settings'].get('media_type', phase['media_types'][0])
+    return link_settle_timeouts.get(media_type, link_settle_timeout_default)
+
+# Run a single discovery phase: configure and enable candidate ports, then wait for their links to come up
+# Phases without candidate ports are skipped without touching the NPB
+# Returns True if the phase had any ports to work with
+def run_port_discovery_phase(nto, host_ip, discoveredPortList, media_type_index, phase, concurrency, link_timeout=None):
+    candidate_port_id_list = select_phase_candidates(discoveredPortList, media_type_index, phase)
+    if len(candidate_port_id_list) == 0:
+        print("Skipping %s port discovery, no candidate ports" % (phase['name']))
+        return False
+
+    print('')
+    print("Initiating %s" % (phase.get('description', phase['name'] + ' port discovery')))
+    print('')
+
+    def configure_port(port_id):
+        return configure_discovered_port(nto, host_ip, port_id, discoveredPortList[port_id], phase['settings'])
+
+    phase_port_id_list, failed_port_id_list = configure_ports_in_parallel(candidate_port_id_list, configure_port, concurrency)
+    for port_id in failed_port_id_list:
+        discoveredPortList[port_id]['ConfigFailed'] = True
+
+    # Wait for the ports enabled in this phase to come up
+    settle_port_links(nto, host_ip, discoveredPortList, phase_port_id_list, port_discovery_phase_timeout(phase, link_timeout))
+    return True
+
+# Returns False if any of the ports failed to configure and didn't come up in any of the phases. Ports without a link are not a failure
+def discover_ports(host_ip, port, username, password, keyword='', concurrency=port_config_concurrency_default, phase_list=None, link_timeout=None):
+
+    nto = nto_connect(host_ip, port, username, password)
 
     discoveredPortList = {}
 
@@ -31,9 +262,8 @@ def discover_ports(host_ip, port, username, password, keyword=''):
         # Limit ZTP scope by a keyword if provided
         searchTerms = {"keywords":[keyword],'enabled':False}
         
-    for ntoPort in nto.searchPorts(searchTerms):
-        ntoPortDetails = nto.getPort(str(ntoPort['id']))
-        discoveredPortList[ntoPort['id']] = {'name': ntoPortDetails['default_name'], 'type': 'port', 'ZTPSucceeded': False, 'details': ntoPortDetails}
+    for ntoPortDetails in search_ports_properties(nto, searchTerms, discovery_port_properties):
+        discoveredPortList[ntoPortDetails['id']] = {'name': ntoPortDetails['default_name'], 'type': 'port', 'ZTPSucceeded': False, 'details': ntoPortDetails}
         
     if len(discoveredPortList) == 0:
         return
@@ -44,244 +274,14 @@ def discover_ports(host_ip, port, username, password, keyword=''):
 
     # TODO Disconnect all the filters from the ports in scope
     
-    # Start with 100G and FEC ON
-    print('')
-    print("Initiating 100G port discovery for QSFP28+ media type, with Forward Error Correction set to ON")
-    print('')
-    enabled_some_ports = False
-    media_type = 'QSFP28'
-    fec_type = 'RS_FEC'
-    for port_id in discoveredPortList:
-        port = discoveredPortList[port_id]
-        if port['details']['media_type'] == media_type:
-            if port['details']['mode'] == 'NETWORK' and port['details']['forward_error_correction_settings']['enabled']:
-                # Enable such ports
-                if 'enabled' in port['details']:
-                    nto.modifyPort(str(port_id), {'enabled': True})
-                    print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                    enabled_some_ports = True
-            else:
-                if port['details']['mode'] != 'NETWORK':
-                    # Convert such ports to NETWORK
-                    nto.modifyPort(str(port_id), {'mode': 'NETWORK'})
-                    print("Converted port %s:%s to NETWORK" % (host_ip, port['details']['default_name']))
-                if not port['details']['forward_error_correction_settings']['enabled']:
-                    # Enable FEC
-                    nto.modifyPort(str(port_id), {'forward_error_correction_settings': {'enabled': True, 'fec_type': fec_type}})
-                    print("Enabled FEC on %s:%s" % (host_ip, port['details']['default_name']))
-                # Validate new settings took effect
-                portDetails = nto.getPort(str(port_id))
-                if portDetails['mode'] == 'NETWORK' and portDetails['forward_error_correction_settings']['enabled']:
-                    # Enable the port
-                    if 'enabled' in port['details']:
-                        nto.modifyPort(str(port_id), {'enabled': True})
-                        print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                        enabled_some_ports = True
-                    
-    # Pause the thread to give the ports a chance to come up
-    if enabled_some_ports:
-        print('Paused for port status change to propagate...')
-        time.sleep(10)
-    
-        # Collect link status for ports in scope
-        for port_id in discoveredPortList:
-            port = discoveredPortList[port_id]
-            ntoPortDetails = nto.getPort(str(port_id))
-            print("Collected port %s:%s status:" % (host_ip, ntoPortDetails['default_name'])),
-            if ntoPortDetails['link_status']['link_up']:
-                print('UP')
-                discoveredPortList[port_id] = {'ZTPSucceeded': True}
-            else:
-                print('DOWN')
-                discoveredPortList[port_id] = {'ZTPSucceeded': False}
-            # Update the list with the latest config and status
-            discoveredPortList[port_id]['details'] = ntoPortDetails
-
-    # Stay on 100G, try FEC OFF for ports that didn't come up
-    print('')
-    print("Continuing 100G port discovery for QSFP28+ media type, now trying with Forward Error Correction set to OFF")
-    print('')
-    enabled_some_ports = False
-    media_type = 'QSFP28'
-    for port_id in discoveredPortList:
-        port = discoveredPortList[port_id]
-        if port['details']['media_type'] == media_type and not port['details']['link_status']['link_up']:
-            if port['details']['mode'] == 'NETWORK' and not port['details']['forward_error_correction_settings']['enabled']:
-                # Enable such ports
-                if 'enabled' in port['details']:
-                    nto.modifyPort(str(port_id), {'enabled': True})
-                    print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                    enabled_some_ports = True
-            else:
-                if port['details']['mode'] != 'NETWORK':
-                    # Convert such ports to NETWORK
-                    nto.modifyPort(str(port_id), {'mode': 'NETWORK'})
-                    print("Converted port %s:%s to NETWORK" % (host_ip, port['details']['default_name']))
-                if port['details']['forward_error_correction_settings']['enabled']:
-                    # Disable FEC
-                    nto.modifyPort(str(port_id), {'forward_error_correction_settings': {'enabled': False}})
-                    print("Disabled FEC on %s:%s" % (host_ip, port['details']['default_name']))
-                # Validate new settings took effect
-                portDetails = nto.getPort(str(port_id))
-                if portDetails['mode'] == 'NETWORK' and not portDetails['forward_error_correction_settings']['enabled']:
-                    # Enable the port
-                    if 'enabled' in port['details']:
-                        nto.modifyPort(str(port_id), {'enabled': True})
-                        print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                        enabled_some_ports = True
-                    
-    # Pause the thread to give the ports a chance to come up
-    if enabled_some_ports:
-        print('Paused for port status change to propagate...')
-        time.sleep(10)
-    
-        # Collect link status for ports in scope
-        for port_id in discoveredPortList:
-            port = discoveredPortList[port_id]
-            ntoPortDetails = nto.getPort(str(port_id))
-            print("Collected port %s:%s status:" % (host_ip, ntoPortDetails['default_name'])),
-            if ntoPortDetails['link_status']['link_up']:
-                print('UP')
-                discoveredPortList[port_id] = {'ZTPSucceeded': True}
-            else:
-                print('DOWN')
-                discoveredPortList[port_id] = {'ZTPSucceeded': False}
-            # Update the list with the latest config and status
-            discoveredPortList[port_id]['details'] = ntoPortDetails
-
-    # Now try 40G
-    print('')
-    print("Initiating 40G port discovery for QSFP+ media type")
-    print('')
-    enabled_some_ports = False
-    media_type = 'QSFP_PLUS_40G'
-    for port_id in discoveredPortList:
-        port = discoveredPortList[port_id]
-        if port['details']['media_type'] == media_type and not port['details']['link_status']['link_up']:
-            if port['details']['mode'] == 'NETWORK':
-                # Enable such ports
-                if 'enabled' in port['details']:
-                    nto.modifyPort(str(port_id), {'enabled': True})
-                    print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                    enabled_some_ports = True
-            else:
-                if port['details']['mode'] != 'NETWORK':
-                    # Convert such ports to NETWORK
-                    nto.modifyPort(str(port_id), {'mode': 'NETWORK'})
-                    print("Converted port %s:%s to NETWORK" % (host_ip, port['details']['default_name']))
-                # Validate new settings took effect
-                portDetails = nto.getPort(str(port_id))
-                if portDetails['mode'] == 'NETWORK':
-                    # Enable the port
-                    if 'enabled' in port['details']:
-                        nto.modifyPort(str(port_id), {'enabled': True})
-                        print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                        enabled_some_ports = True
-                    
-    # Pause the thread to give the ports a chance to come up
-    if enabled_some_ports:
-        print('Paused for port status change to propagate...')
-        time.sleep(10)
-    
-        # Collect link status for ports in scope
-        for port_id in discoveredPortList:
-            port = discoveredPortList[port_id]
-            ntoPortDetails = nto.getPort(str(port_id))
-            print("Collected port %s:%s status:" % (host_ip, ntoPortDetails['default_name'])),
-            if ntoPortDetails['link_status']['link_up']:
-                print('UP')
-                discoveredPortList[port_id] = {'ZTPSucceeded': True}
-            else:
-                print('DOWN')
-                discoveredPortList[port_id] = {'ZTPSucceeded': False}
-            # Update the list with the latest config and status
-            discoveredPortList[port_id]['details'] = ntoPortDetails
-
-    # Proceed to 10G
-    print('')
-    print("Initiating 10G port discovery for SFP+ media type")
-    print('')
-    enabled_some_ports = False
-    media_type = 'SFP_PLUS_10G'
-    link_settings = '10G_FULL'
-    for port_id in discoveredPortList:
-        port = discoveredPortList[port_id]
-        if port['details']['media_type'] == media_type and port['details']['mode'] == 'NETWORK':
-            # Enable such ports
-            if 'enabled' in port['details']:
-                nto.modifyPort(str(port_id), {'enabled': True})
-                print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                enabled_some_ports = True
-        else:
-            if port['details']['media_type'] == 'SFP_1G':
-                # Convert such ports to 10G
-                nto.modifyPort(str(port_id), {'media_type': media_type,'link_settings': link_settings})
-                print("Converted port %s:%s to 10G" % (host_ip, port['details']['default_name']))
-            if port['details']['mode'] != 'NETWORK':
-                # Convert such ports to NETWORK
-                nto.modifyPort(str(port_id), {'mode': 'NETWORK'})
-                print("Converted port %s:%s to NETWORK" % (host_ip, port['details']['default_name']))
-            # Validate new settings took effect
-            portDetails = nto.getPort(str(port_id))
-            if portDetails['media_type'] == media_type and portDetails['mode'] == 'NETWORK':
-                # Enable the port
-                if 'enabled' in port['details']:
-                    nto.modifyPort(str(port_id), {'enabled': True})
-                    print("Enabled port %s:%s" % (host_ip, port['details']['default_name']))
-                    enabled_some_ports = True
-                    
-    # Pause the thread to give the ports a chance to come up
-    if enabled_some_ports:
-        print('Paused for port status change to propagate...')
-        time.sleep(10)
-    
-        # Collect link status for ports in scope
-        for port_id in discoveredPortList:
-            port = discoveredPortList[port_id]
-            ntoPortDetails = nto.getPort(str(port_id))
-            print("Collected port %s:%s status:" % (host_ip, ntoPortDetails['default_name'])),
-            if ntoPortDetails['link_status']['link_up']:
-                print('UP')
-                discoveredPortList[port_id] = {'ZTPSucceeded': True}
-            else:
-                print('DOWN')
-                discoveredPortList[port_id] = {'ZTPSucceeded': False}
-            # Update the list with the latest config and status
-            discoveredPortList[port_id]['details'] = ntoPortDetails
-
-    # Now go through the ports that are still down and change the media to 1G/AUTO
-    print('')
-    print("Initiating 1G/Auto port discovery for SFP+ media type")
-    print('')
-    enabled_some_ports = False
-    for port_id in discoveredPortList:
-        port = discoveredPortList[port_id]
-        portDetails = port['details']
-        if not portDetails['link_status']['link_up'] and portDetails['enabled'] and portDetails['media_type'] == 'SFP_PLUS_10G' \
-            and portDetails['misc']['board_type'] != "EPIPHONE_100_MAIN": # 1G is not supported on E100
-            nto.modifyPort(str(port_id), {'media_type': 'SFP_1G','link_settings': 'AUTO','mode': 'NETWORK'})
-            print("Converted port %s:%s to 1G/Auto, NETWORK" % (host_ip, port['details']['default_name']))
-            enabled_some_ports = True
-        
-    # Pause the thread to give the ports a chance to come up
-    if enabled_some_ports:
-        print('Paused for port status change to propagate...')
-        time.sleep(10)
-    
-        # Collect link status for ports in scope
-        # TODO DRY
-        for port_id in discoveredPortList:
-            port = discoveredPortList[port_id]
-            ntoPortDetails = nto.getPort(str(port_id))
-            print("Collected port %s:%s status:" % (host_ip, ntoPortDetails['default_name'])),
-            if ntoPortDetails['link_status']['link_up']:
-                print('UP')
-                discoveredPortList[port_id] = {'ZTPSucceeded': True}
-            else:
-                print('DOWN')
-                discoveredPortList[port_id] = {'ZTPSucceeded': False}
-            # Update the list with the latest config and status
-            discoveredPortList[port_id]['details'] = ntoPortDetails
+    # Cycle through discovery phases, only touching ports with media types each phase applies to
+    if phase_list is None:
+        phase_list = port_discovery_phases
+    media_type_index = index_ports_by_media_type(discoveredPortList)
+    for phase in phase_list:
+        if run_port_discovery_phase(nto, host_ip, discoveredPortList, media_type_index, phase, concurrency, link_timeout):
+            # Media type might have been changed by the phase
+            media_type_index = index_ports_by_media_type(discoveredPortList)
 
     # Enable LLDP TX on all enabled ports in scope
     # For all ports where ZTP failed by this point, set them as network, 10G and disable
@@ -294,12 +294,25 @@ def discover_ports(host_ip, port, username, password, keyword=''):
         if port['ZTPSucceeded']:
             if 'lldp_receive_enabled' in portDetails: # check if this port has LLDP support before enabling it
                 nto.modifyPort(str(port_id), {'lldp_receive_enabled': True, 'keywords': ['ZTP']})
+                get_nto_inventory(nto).update_port(port_id, {'enabled': True, 'mode': portDetails['mode'], 'keywords': ['ZTP']})
                 print("Enabled LLDP on port %s:%s" % (host_ip, port['details']['default_name']))
             else:
                 print("Port %s:%s doesn't have LLDP RX capabilities" % (host_ip, port['details']['default_name']))
         else:
             nto.modifyPort(str(port_id), {'enabled': False, 'mode': 'NETWORK'})
+            get_nto_inventory(nto).update_port(port_id, {'enabled': False, 'mode': 'NETWORK'})
             print("Converted port %s:%s to NETWORK and DISABLED" % (host_ip, port['details']['default_name']))
 
 
 
+
+    link_time_list = [discoveredPortList[port_id]['link_time'] for port_id in discoveredPortList if 'link_time' in discoveredPortList[port_id]]
+    if len(link_time_list) > 0:
+        print("Discovered %d of %d ports UP, time-to-link min/max %.1fs/%.1fs" % (len(link_time_list), len(discoveredPortList), min(link_time_list), max(link_time_list)))
+    else:
+        print("Discovered 0 of %d ports UP" % (len(discoveredPortList)))
+
+    failed_count = len([port_id for port_id in discoveredPortList if discoveredPortList[port_id].get('ConfigFailed') and not discoveredPortList[port_id]['ZTPSucceeded']])
+    if failed_count > 0:
+        print("Failed to configure %d ports" % failed_count)
+    return failed_count == 0
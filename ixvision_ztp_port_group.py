@@ -5,13 +5,16 @@
 # File: ixvision_ztp_port_group.py
 # Author: Alex Bortok (https://github.com/bortok)
 #
-# Description: Form a port group based on keywords the ports are tagged with
+# Description: Form port groups based on keywords the ports are tagged with
 # 1. Starting point is an Ixia Vision NPB with ports tagged by certain keywords that indicate what is connected to them
-# 2. Each run of this script would configure a single port group using the supplied name and group type:
-#  - Search for an existing port group with the same name. If found with the matching type, continue by referencing that group. If the type doesn't match, stop. 
+# 2. Each run of this script would configure a single port group using the supplied name and group type, or all port groups listed in a manifest:
+#  - Search for an existing port group with the same name. If found with the matching type, continue by referencing that group. If the type doesn't match, skip it.
 #  - If not found, create a new group
+# 3. Ports are classified for all the groups in a single pass over the inventory. A port matching keywords of more than one group goes to the first of them
 # 4. Search for enabled ports with matching keywords that are not yet members of any group and don't have any connections to/from them. Add all such ports to the group, change port mode if nessesary
+#    New groups are created with their members, existing groups get their new members and keywords in one update, and all groups are written in parallel
 # 5. For all exising port group members, check keywords and if any have no match, remove them from the port group and set to a default configuration (Network Port, no connections)
+# 6. Only the port groups and ports that need a change are written, so running the same manifest again makes no changes
 #
 # COPYRIGHT 2018 - 2019 Keysight Technologies.
 #
@@ -20,19 +23,52 @@
 #
 ###############################################################################
 
+import json
+
 from ksvisionlib import *
 
+from ixvision_ztp_ntolib import *
+from ixvision_ztp_cache import *
+from ixvision_ztp_changeset import *
+
 # DEFINE VARs HERE
 pg_modes_supported = {'net': 'INTERCONNECT', 'lb': 'LOAD_BALANCE'}
 
+# Manifest example, a list of port groups to form:
+# [{"name": "TAPs", "mode": "net", "tags": ["tap"]},
+#  {"name": "SPANs", "mode": "net", "tags": "span,mirror"},
+#  {"name": "PROBES", "mode": "lb", "tags": ["probe"]}]
 
 # DEFINE FUNCTIONS HERE
 
+# Parse a port group manifest: a list of port groups, or an object with such a list under "port_groups"
+# Returns a list of port groups with name, mode and upper case tags, and None, or None and an error message
+def parse_port_group_manifest(manifest):
+    if isinstance(manifest, dict):
+        manifest = manifest.get('port_groups')
+    if not isinstance(manifest, list) or len(manifest) == 0:
+        return None, "a non-empty list of port groups is expected"
+    pg_list = []
+    for pg_spec in manifest:
+        if not isinstance(pg_spec, dict) or 'name' not in pg_spec or 'mode' not in pg_spec or 'tags' not in pg_spec:
+            return None, "each port group needs a name, mode and tags: %s" % json.dumps(pg_spec)
+        if pg_spec['mode'] not in pg_modes_supported:
+            return None, "port group %s mode %s is not one of %s" % (pg_spec['name'], pg_spec['mode'], ", ".join(pg_modes_supported.keys()))
+        tags = pg_spec['tags']
+        if not isinstance(tags, list):
+            tags = str(tags).split(',')
+        if pg_spec['name'] in [pg['name'] for pg in pg_list]:
+            return None, "port group %s is listed more than once" % pg_spec['name']
+        pg_list.append({'name': pg_spec['name'], 'mode': pg_spec['mode'], 'tags': [str(tag).upper() for tag in tags]})
+    return pg_list, None
+
 # Input 
 # - Connection to an NPB
-# - Keywords to use for matching ports
-# - Port group name
-# - Port group type: "net" for network (interconnect), "lb" for load balanced tool group
+# - List of port groups to form, each with
+#   - Port group name
+#   - Port group type: "net" for network (interconnect), "lb" for load balanced tool group
+#   - Keywords to use for matching ports
+# Returns False if any of the port groups or their ports could not be formed
 
 # Model to operate
 # NPB
@@ -40,49 +76,39 @@ pg_modes_supported = {'net': 'INTERCONNECT', 'lb': 'LOAD_BALANCE'}
 # |_Type
 # |_Keywords[Names]
 
-def form_port_groups(host_ip, port, username, password, tags, pg_name, pg_mode_key):
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_ztp_port_group_debug.log")
+def form_port_groups(host_ip, port, username, password, pg_list):
+    nto = nto_connect(host_ip, port, username, password)
     
     # Check s/w version to use proper API syntax (ixia_nto.py doesn't support API versioning)
-    nto_system_properties = nto.getSystem()
-    nto_major_version = int(nto_system_properties['software_version'][0])
+    nto_major_version = nto_major_software_version(nto, host_ip, port)
     
     if nto_major_version == 4:
         pg_type_key = 'port_group_type'
     else:
         pg_type_key = 'type'
 
-    if pg_mode_key == 'lb' or pg_mode_key == 'LB':
-        pg_params = {'mode': 'TOOL', pg_type_key: 'LOAD_BALANCE'}
-    else:   # Inside this function we will default to Network Port Group mode
-        pg_params = {'mode': 'NETWORK', pg_type_key: 'INTERCONNECT'}
-        
-
-    port_group_list = nto.searchPortGroups({'name': pg_name})
-    ztp_port_group = None
-    ztp_port_group_port_list = []
-    if len(port_group_list) == 0:
-        # No existing group with such name, create new one
-        pg_params.update({'name': pg_name, 'keywords': ['ZTP'] + tags})
-        new_port_group = nto.createPortGroup(pg_params)
-        if new_port_group is not None and len(new_port_group) > 0:
-            print("No group found, created a new one with id %s" % (str(new_port_group['id'])))
-            ztp_port_group = new_port_group
-        else:
-            print("No group found, failed to created a new one!")
-            return
-    elif len(port_group_list) == 1:
-        # An existing port group found
-        port_group = port_group_list[0]
-        port_group_details = nto.getPortGroup(str(port_group['id']))
-        if port_group_details is not None:
+    inventory = get_nto_inventory(nto)
+    succeeded = True                    # Whether all the requested port groups were formed
+    pg_plan_list = []                   # Port groups to form, with their existing details and the ports to add
+    for pg_spec in pg_list:
+        pg_name = pg_spec['name']
+        tags = pg_spec['tags']
+        if pg_spec['mode'] == 'lb' or pg_spec['mode'] == 'LB':
+            pg_params = {'mode': 'TOOL', pg_type_key: 'LOAD_BALANCE'}
+        else:   # Inside this function we will default to Network Port Group mode
+            pg_params = {'mode': 'NETWORK', pg_type_key: 'INTERCONNECT'}
+        pg_plan = {'name': pg_name, 'tags': tags, 'params': pg_params, 'port_group': None, 'port_list': [], 'new_port_list': [], 'removed_port_list': [], 'changes': {}}
+
+        port_group_list = inventory.search_port_groups(pg_name)
+        if len(port_group_list) == 1:
+            # An existing port group found
+            port_group_details = port_group_list[0]
             # WARNING! All NTO API versions returns 'type' attribute key on GET, but not on CREATE/UPDATE
             print("Found existing port group %s of %s type and %s mode" % (port_group_details['default_name'], port_group_details['type'], port_group_details['mode'])),
             if port_group_details['type'] == pg_params[pg_type_key] and port_group_details['mode'] == pg_params['mode']:
                 # PG types match, will update the existing group
                 print("-- type and mode match, will update")
-                ztp_port_group = port_group
-                ztp_port_group_port_list = port_group_details['port_list']
+                pg_plan['port_group'] = port_group_details
                 # Update keywords
                 updated_keywords = []
                 updated_keywords.extend(port_group_details['keywords'])
@@ -90,54 +116,113 @@ def form_port_groups(host_ip, port, username, password, tags, pg_name, pg_mode_k
                     if keyword not in updated_keywords:
                         updated_keywords.append(keyword)
                 if len(updated_keywords) > len(port_group_details['keywords']):
-                    nto.modifyPortGroup(str(port_group['id']),{'keywords': updated_keywords})
+                    pg_plan['changes']['keywords'] = updated_keywords
+                # Members that no longer have any of the group keywords, from this run or the previous ones, are removed from the group
+                member_keywords = [keyword for keyword in updated_keywords if keyword != 'ZTP']
+                for port_id in port_group_details['port_list']:
+                    member_port = inventory.get_port(port_id)
+                    if member_port is not None and not any(keyword in member_port['keywords'] for keyword in member_keywords):
+                        print("Port %s has none of keywords %s, removing it from port group %s" % (member_port['name'], ", ".join(member_keywords), pg_name))
+                        pg_plan['removed_port_list'].append(port_id)
+                    else:
+                        pg_plan['port_list'].append(port_id)
             else:
-                # Mismatch, return
+                # Mismatch, skip
                 print("-- type or mode mismatch with requested %s, %s, skipping..." % (pg_params[pg_type_key], pg_params['mode']))
-                return
-        else:
-            print("Failed to retrieve details for port %s, skipping..." % (port_group['name']))
-    else:
-        # This should never happen, but just in case, provide details to look into
-        print("Found more than one port group named %s, can't continue:" % (pg_name)),
-        for port_group in port_group_list:
-            port_group_details = nto.getPortGroup(str(port_group['id']))
-            if port_group_details is not None:
+                succeeded = False
+                continue
+        elif len(port_group_list) > 1:
+            # This should never happen, but just in case, provide details to look into
+            print("Found more than one port group named %s, can't continue:" % (pg_name)),
+            for port_group_details in port_group_list:
                 print (" %s," % (port_group_details['default_name'])),
-        print("")
-        return
+            print("")
+            succeeded = False
+            continue
+        pg_plan_list.append(pg_plan)
 
-    # Now search for ports to be added to the port group
-    port_list = nto.searchPorts({'enabled': True, 'port_group_id': None, 'dest_filter_list': [], 'source_filter_list': []})
-    matching_port_id_list = []
+    # Now search for ports to be added to the port groups, classifying all the candidates in one pass
+    port_list = inventory.search_ports(keywords=sorted(set(tag for pg_plan in pg_plan_list for tag in pg_plan['tags'])), enabled=True, ungrouped=True, unconnected=True)
+    converted_port_plans = {}
+    changeset = NpbChangeSet(nto)
     for port in port_list:
-        port_details = nto.getPortProperties(str(port['id']), 'id,keywords,mode')
-        if port_details is not None:
-            for keyword in tags:
-                if keyword in port_details['keywords'] and port['id'] not in matching_port_id_list:
-                        print("Found port %s with matching keyword %s" % (port['name'], keyword))
-                        # Check and update port mode, if needed
-                        if port_details['mode'] == pg_params['mode']:
-                                matching_port_id_list.append(port['id'])
-                        else:
-                            print("Convering port %s into %s mode" % (port['name'], pg_params['mode']))
-                            nto.modifyPort(str(port['id']), {'mode': pg_params['mode']})
-                            # Check if the modification was successful and only add the port to the list of matching ports if yes
-                            port_details = nto.getPortProperties(str(port['id']), 'id,keywords,mode')
-                            if port_details is not None and port_details['mode'] == pg_params['mode']:
-                                matching_port_id_list.append(port['id'])
-                            else:
-                                # Note, if the same port has several keywords that match, there will be several attempts to change the mode
-                                print("Changing port mode failed, skipping...")
-                
-    if len(matching_port_id_list) == 0:
-        print("No matching ports found")
-        return
-    else:
-        print("Found %d matching ports" % (len(matching_port_id_list)))
-        
-        
-    nto.modifyPortGroup(str(ztp_port_group['id']), {'port_list': matching_port_id_list + ztp_port_group_port_list})
-    print("Added %d ports to port group %s" % (len(matching_port_id_list), pg_name))
+        matching_pg_plans = [pg_plan for pg_plan in pg_plan_list if any(keyword in port['keywords'] for keyword in pg_plan['tags'])]
+        if len(matching_pg_plans) == 0:
+            continue
+        pg_plan = matching_pg_plans[0]
+        keyword = [keyword for keyword in pg_plan['tags'] if keyword in port['keywords']][0]
+        if len(pg_list) == 1:
+            print("Found port %s with matching keyword %s" % (port['name'], keyword))
+        else:
+            print("Found port %s with matching keyword %s for port group %s" % (port['name'], keyword, pg_plan['name']))
+        if len(matching_pg_plans) > 1:
+            print("Port %s also matches port groups %s, adding it to %s only" % (port['name'], ", ".join(p['name'] for p in matching_pg_plans[1:]), pg_plan['name']))
+        # Check and update port mode, if needed
+        if port['mode'] == pg_plan['params']['mode']:
+            pg_plan['new_port_list'].append(port['id'])
+        else:
+            print("Convering port %s into %s mode" % (port['name'], pg_plan['params']['mode']))
+            changeset.add_port(port['id'], {'mode': pg_plan['params']['mode']})
+            converted_port_plans[port['id']] = pg_plan
+
+    # Check if the mode conversions were successful and only add the ports to the list of matching ports if yes
+    if len(changeset) > 0:
+        for entry in changeset.apply():
+            if entry['status'] != 'failed':
+                converted_port_plans[entry['id']]['new_port_list'].append(entry['id'])
+            else:
+                print("Changing port %s mode failed, skipping... (%s)" % (entry['name'], entry['error']))
+                succeeded = False
+
+    for pg_plan in pg_plan_list:
+        pg_plan['new_port_list'].sort()
+        if len(pg_plan['new_port_list']) == 0:
+            print("No matching ports found for port group %s" % pg_plan['name'])
+        else:
+            print("Found %d matching ports for port group %s" % (len(pg_plan['new_port_list']), pg_plan['name']))
 
+        if pg_plan['port_group'] is None:
+            # New port groups are created together with their members
+            pg_params = dict(pg_plan['params'])
+            pg_params.update({'name': pg_plan['name'], 'keywords': ['ZTP'] + pg_plan['tags']})
+            if len(pg_plan['new_port_list']) > 0:
+                pg_params['port_list'] = pg_plan['new_port_list']
+            # WARNING! All NTO API versions returns 'type' attribute key on GET, but not on CREATE/UPDATE
+            changeset.add_create('port_groups', pg_params, {'type': pg_plan['params'][pg_type_key], 'port_list': pg_plan['new_port_list']})
+        else:
+            # Existing port groups get their new members, removed members and keywords in a single update each
+            pg_plan['changes']['port_list'] = pg_plan['port_list'] + pg_plan['new_port_list']
+            changeset.add_port_group(pg_plan['port_group']['id'], pg_plan['changes'])
+
+    # All port groups are written at the same time, and only if there is an actual change
+    report = changeset.apply()
+    reset_port_list = []
+    for pg_plan in pg_plan_list:
+        if pg_plan['port_group'] is None:
+            pg_report = [entry for entry in report if entry['type'] == 'port_groups' and entry['operation'] == 'create' and entry['name'] == pg_plan['name']]
+        else:
+            pg_report = [entry for entry in report if entry['type'] == 'port_groups' and entry['id'] == pg_plan['port_group']['id']]
+        if len(pg_report) == 0:
+            continue
+        entry = pg_report[0]
+        if entry['status'] == 'failed':
+            print_changeset_report(pg_report)
+            succeeded = False
+            continue
+        if entry['status'] == 'planned':
+            reset_port_list.extend(pg_plan['removed_port_list'])
+            continue
+        if entry['operation'] == 'create' and entry['status'] == 'ok':
+            print("No group %s found, created a new one with id %s" % (pg_plan['name'], str(entry['id'])))
+        if len(pg_plan['new_port_list']) > 0:
+            print("Added %d ports to port group %s" % (len(pg_plan['new_port_list']), pg_plan['name']))
+        if len(pg_plan['removed_port_list']) > 0:
+            print("Removed %d ports from port group %s" % (len(pg_plan['removed_port_list']), pg_plan['name']))
+            reset_port_list.extend(pg_plan['removed_port_list'])
 
+    # Ports removed from the groups go back to a default configuration: Network Port, no connections
+    for port_id in reset_port_list:
+        changeset.add_port(port_id, {'mode': 'NETWORK'})
+    report = changeset.apply()
+    print_changeset_report(report)
+    return succeeded and changeset_report_succeeded(report)
@@ -17,6 +17,7 @@
 from ksvisionlib import *
 
 from ixvision_ztp_ntolib import *
+from ixvision_ztp_changeset import *
 
 # DEFINE VARs HERE
 
@@ -26,33 +27,31 @@ from ixvision_ztp_ntolib import *
 # - Connection to an NPB
 # - Keywords to use for matching ports
 # - Port type: "net" for network, "tool" for tool ports
+# Returns False if any of the ports failed to change mode
 
 def set_port_mode(host_ip, port, username, password, tags, mode):
 
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=True, logFile="ixvision_ztp_port_mode_debug.log")
+    nto = nto_connect(host_ip, port, username, password)
 
     # Search for ports to be updated - can't be a part of a port group, can't have any existing connections
-    port_list = nto.searchPorts({'enabled': True, 'port_group_id': None, 'dest_filter_list': [], 'source_filter_list': []})
+    inventory = get_nto_inventory(nto)
+    port_list = inventory.search_ports(keywords=[keyword.upper() for keyword in tags], enabled=True, ungrouped=True, unconnected=True)
     matching_port_id_list = []
     for port in port_list:
-        port_details = nto.getPortProperties(str(port['id']), 'id,keywords,mode')
-        if port_details is not None:
-            for keyword in tags:
-                if keyword.upper() in port_details['keywords'] and port['id'] not in matching_port_id_list and port_details['mode'] != port_modes_supported[mode]:
-                    matching_port_id_list.append(port['id'])
-                    print("Found port %s with matching keyword %s in mode %s" % (port['name'], keyword.upper(), port_details['mode']))
+        for keyword in tags:
+            if keyword.upper() in port['keywords'] and port['id'] not in matching_port_id_list and port['mode'] != port_modes_supported[mode]:
+                matching_port_id_list.append(port['id'])
+                print("Found port %s with matching keyword %s in mode %s" % (port['name'], keyword.upper(), port['mode']))
                 
     if len(matching_port_id_list) == 0:
         print("No mode update requied for ports with keywords %s" % ", ".join(tags))
         return
     
-    # Update port mode
+    # Update port mode, all the ports are verified with one read once written
     print("Convering ports into %s mode" % (port_modes_supported[mode]))
+    changeset = NpbChangeSet(nto)
     for port_id in matching_port_id_list:
-        nto.modifyPort(str(port_id), {'mode': port_modes_supported[mode]})
-        # Check if the modification was successful and only add the port to the list of matching ports if yes
-        port_details = nto.getPortProperties(str(port_id), 'id,name,mode')
-        if port_details is not None and port_details['mode'] == port_modes_supported[mode]:
-            print("Port %s mode update succeeded" % port_details['name'])
-        else:
-            print("Port %s mode update failed!" % port_details['name'])
+        changeset.add_port(port_id, {'mode': port_modes_supported[mode]})
+    report = changeset.apply()
+    print_changeset_report(report)
+    return changeset_report_succeeded(report)
@@ -0,0 +1,204 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: ixvision_ztp_session.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: NPB session with a persistent authentication token and a pool of keep-alive connections
+# 1. All REST calls of a session go through one pool of TLS connections, which are kept open between calls
+# 2. Authentication token is saved per NPB and username in a file only the current user can read, along with a salted hash of the password
+# 3. Following ixvztp runs with the same password use the saved token while it is within its lifetime, without logging in again.
+#    A different password, wrong or rotated, is never let through on a saved token: the session logs in with it instead
+# 4. If the NPB rejects the token, the session logs in again and repeats the call
+# 5. Calls go through the governor of the NPB, which adapts the number of calls in flight to how fast the NPB responds,
+#    repeats reads after overload, and pauses calls while the NPB recovers
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import hmac
+import json
+import time
+import hashlib
+import binascii
+import threading
+
+import urllib3
+
+from ksvisionlib import *
+
+from ixvision_ztp_metrics import *
+from ixvision_ztp_log import *
+from ixvision_ztp_governor import *
+
+# DEFINE VARs HERE
+ztp_token_dir = os.path.join(os.path.expanduser('~'), '.ixvztp', 'tokens')
+ztp_token_ttl = 900                     # Seconds to use a saved token for, before logging in again
+ztp_token_hash_iterations = 100000      # Rounds of the password hash saved with a token, to make guessing the password from it slow
+session_pool_size = 16                  # Maximum number of connections to keep open to an NPB
+session_connect_timeout = 10
+session_read_timeout = 120
+session_ok_status = [200, 201, 202, 204]
+
+urllib3.disable_warnings(urllib3.exceptions.InsecureRequestWarning)
+
+# DEFINE FUNCTIONS HERE
+
+def nto_token_filename(host_ip, port, username):
+    return os.path.join(ztp_token_dir, "%s_%s_%s.json" % (host_ip, port, username))
+
+# Salted hash of a password, to check that a saved token was obtained with the same password
+def nto_password_hash(password, salt):
+    if not isinstance(password, bytes):
+        password = password.encode('utf-8')
+    return str(binascii.hexlify(hashlib.pbkdf2_hmac('sha256', password, binascii.unhexlify(str(salt)), ztp_token_hash_iterations)).decode('ascii'))
+
+# Read a saved token. Returns None if there is no token within its lifetime, if it was obtained with a different password,
+# or if the file could be read by other users
+def load_nto_token(host_ip, port, username, password):
+    filename = nto_token_filename(host_ip, port, username)
+    try:
+        file_stat = os.stat(filename)
+        if file_stat.st_mode & 0o077 or (hasattr(os, 'getuid') and file_stat.st_uid != os.getuid()):
+            return None
+        with open(filename) as f:
+            saved_token = json.load(f)
+    except Exception:
+        return None
+    if not isinstance(saved_token, dict) or time.time() - saved_token.get('updated', 0) > ztp_token_ttl:
+        return None
+    try:
+        password_matches = hmac.compare_digest(str(saved_token['password_hash']), nto_password_hash(password, saved_token['salt']))
+    except Exception:
+        password_matches = False
+    if not password_matches:
+        ztp_log('info', 'token_password_changed', npb=host_ip, username=username)
+        return None
+    return saved_token.get('token')
+
+# Save a token, readable only by the current user. The file is replaced atomically, so that parallel runs never see a partial file
+def save_nto_token(host_ip, port, username, password, token):
+    try:
+        if not os.path.isdir(ztp_token_dir):
+            os.makedirs(ztp_token_dir, 0o700)
+        filename = nto_token_filename(host_ip, port, username)
+        temp_filename = "%s.%d.tmp" % (filename, os.getpid())
+        fd = os.open(temp_filename, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        salt = binascii.hexlify(os.urandom(16)).decode('ascii')
+        with os.fdopen(fd, 'w') as f:
+            json.dump({'token': token, 'updated': time.time(), 'salt': salt, 'password_hash': nto_password_hash(password, salt)}, f)
+        os.rename(temp_filename, filename)
+    except Exception as e:
+        print("Warning: can't save NPB authentication token: %s" % e)
+
+# Connection to an NPB that replaces the transport of VisionWebApi. All the VisionWebApi methods go through _callServer(),
+# so they use the connection pool and the saved token of this class
+class NtoSession(VisionWebApi):
+
+    # VisionWebApi.__init__() is not called on purpose: it would log in over a connection of its own
+    def __init__(self, host, username, password, port=8000, pool_size=session_pool_size):
+        self.host = host
+        self.port = port
+        self.user = username
+        self.password = password
+        self.debug = False              # VisionWebApi debug logging is replaced with ztp_log()
+        self.logFile = None
+        self.auth_lock = threading.Lock()
+        self.connection = urllib3.HTTPSConnectionPool(host, port=int(port), maxsize=pool_size, block=True, \
+                                                      cert_reqs='CERT_NONE', assert_hostname=False, retries=False, \
+                                                      timeout=urllib3.Timeout(connect=session_connect_timeout, read=session_read_timeout))
+        self.governor = get_npb_call_governor(host, port, pool_size)
+        self.token = load_nto_token(host, port, username, password)
+        if self.token is None:
+            self.login()
+        else:
+            ztp_log('info', 'token_reused', npb=self.host, username=self.user)
+
+    # Log in and save the new token. If a rejected token is passed, and another thread has already replaced it, nothing is done
+    def login(self, rejected_token=None):
+        with self.auth_lock:
+            if rejected_token is not None and self.token != rejected_token:
+                return
+            headers = urllib3.util.make_headers(basic_auth='%s:%s' % (self.user, self.password))
+            start_time = time.time()
+            response = self.governed(lambda: self.connection.urlopen('GET', '/api/auth', headers=headers))
+            record_rest_call(self.host, 'GET', '/api/auth', response.status, time.time() - start_time, 0, len(response.data))
+            ztp_log('info', 'login', npb=self.host, username=self.user, status=response.status, seconds=round(time.time() - start_time, 6))
+            if response.status not in session_ok_status or response.getheader('x-auth-token') is None:
+                ztp_log('error', 'login_failed', npb=self.host, username=self.user, status=response.status, response=ztp_log_payload(response.data))
+                raise Exception({'status_code': response.status, 'content': response.data.decode('utf-8', 'replace')})
+            self.token = response.getheader('x-auth-token')
+            save_nto_token(self.host, self.port, self.user, self.password, self.token)
+
+    def request(self, method, url, argsAsJson, token):
+        headers = {'Authentication': token, 'Content-type': 'application/json'}
+        start_time = time.time()
+        response = self.connection.urlopen(method, url, body=argsAsJson, headers=headers)
+        duration = time.time() - start_time
+        record_rest_call(self.host, method, url, response.status, duration, len(argsAsJson or ''), len(response.data))
+        if ztp_log_payload_enabled():
+            ztp_log('debug', 'rest_call', npb=self.host, action=get_metrics_action(), method=method, url=url, status=response.status, \
+                    seconds=round(duration, 6), request=ztp_log_payload(argsAsJson), response=ztp_log_payload(response.data))
+        else:
+            ztp_log('info' if response.status < 400 else 'warning', 'rest_call', npb=self.host, action=get_metrics_action(), method=method, url=url, \
+                    status=response.status, seconds=round(duration, 6), bytes_sent=len(argsAsJson or ''), bytes_received=len(response.data))
+        return response
+
+    # Make a call, a function returning the response, once the governor allows it, and report to the governor how it went
+    def governed(self, make_call):
+        probe = self.governor.acquire()
+        start_time = time.time()
+        overloaded = True
+        try:
+            response = make_call()
+            overloaded = response.status in governor_overload_status
+        finally:
+            self.governor.release(time.time() - start_time, overloaded, probe)
+        return response
+
+    def governed_request(self, method, url, argsAsJson, token):
+        return self.governed(lambda: self.request(method, url, argsAsJson, token))
+
+    def _callServer(self, method, url, argsAsJson=None):
+        attempt = 0
+        while True:
+            token = self.token
+            try:
+                response = self.governed_request(method, url, argsAsJson, token)
+                if response.status == 401:
+                    # Saved token has expired or was revoked
+                    record_rest_retry(self.host, method, url)
+                    self.login(token)
+                    response = self.governed_request(method, url, argsAsJson, self.token)
+            except urllib3.exceptions.HTTPError as e:
+                # The connection failed or timed out. Only reads are safe to repeat, as writes might have been carried out
+                if method not in governor_retry_methods or attempt >= governor_retries:
+                    raise
+                retry_after = None
+                ztp_log('warning', 'rest_retry', npb=self.host, method=method, url=url, attempt=attempt + 1, error=str(e))
+            else:
+                # Reads are repeated after overload, writes only if the NPB rejected them with 429 before carrying them out
+                if response.status not in governor_overload_status or attempt >= governor_retries or \
+                   method not in governor_retry_methods and response.status != 429:
+                    break
+                retry_after = response.getheader('Retry-After')
+                ztp_log('warning', 'rest_retry', npb=self.host, method=method, url=url, attempt=attempt + 1, status=response.status)
+            record_rest_retry(self.host, method, url)
+            time.sleep(governor_retry_delay_for(attempt, retry_after))
+            attempt += 1
+
+        content = response.data.decode('utf-8', 'replace')
+        if response.status not in session_ok_status:
+            raise Exception({'status_code': response.status, 'content': content})
+        if len(content) == 0:
+            return None
+        try:
+            return json.loads(content)
+        except ValueError:
+            return content
@@ -6,6 +6,10 @@
 # Author: Alex Bortok (https://github.com/bortok)
 #
 # Description: A module to inquiry system status
+# 1. System identity: name, location, serial number, software version and management addresses
+# 2. Port statistics: traffic and drop counters of all ports are collected with a single request per sample and kept in flat arrays,
+#    so that deltas and rates of all ports are computed at once. Only the previous and the current samples are kept, so memory
+#    stays the same however long the statistics are sampled for. Ports with the most traffic and the most drops are reported
 #
 # COPYRIGHT 2018 - 2019 Keysight Technologies.
 #
@@ -14,9 +18,28 @@
 #
 ###############################################################################
 
+import json
+import time
+import heapq
+import operator
+import itertools
+from array import array
 
 from ksvisionlib import *
 
+from ixvision_ztp_ntolib import *
+from ixvision_ztp_cache import *
+
+# DEFINE VARs HERE
+# Port statistics summed up into traffic, packet and drop counters. Ports have either network (np) or tool (tp) port statistics, depending on their mode
+stats_byte_counters = ['np_total_rx_count_bytes', 'tp_total_tx_count_bytes']
+stats_packet_counters = ['np_total_rx_count_packets', 'tp_total_tx_count_packets']
+stats_drop_counters = ['np_total_rx_count_invalid_packets', 'tp_total_drop_count_packets']
+stats_counter_names = {'bytes': stats_byte_counters, 'packets': stats_packet_counters, 'drops': stats_drop_counters}
+stats_top_default = 10                  # Number of ports to list as top talkers and drop hotspots
+stats_interval_min = 0.001              # Shortest time between two samples of a port to compute rates with, in seconds
+sysinfo_system_properties = ['software_version', 'system_info', 'ip_config']
+
 # DEFINE FUNCTIONS HERE
 
 # Input 
@@ -30,6 +53,17 @@ from ksvisionlib import *
 def print_sysinfo(name, value):
     print("%s%s%s" % (name, ' ' * (20 - len(name)), value))
 
+# Read system name, location, contact, management addresses and software version from the NPB, with a single request
+# They are read every time, as they can be changed without a software update. Only hardware information is cached
+def nto_get_system_identity(nto):
+    try:
+        nto_system_properties = nto._callServer('GET', '/api/system?properties=%s' % ','.join(sysinfo_system_properties), None)
+        if isinstance(nto_system_properties, dict) and len([key for key in sysinfo_system_properties if key not in nto_system_properties]) == 0:
+            return nto_system_properties
+    except Exception:
+        pass
+    return nto.getSystem()
+
 def nto_get_sysinfo(host_ip, port, username, password):
     
     sysinfo_strings = {
@@ -43,12 +77,13 @@ def nto_get_sysinfo(host_ip, port, username, password):
         'serial_num': 'Serial number:'
     }
 
-    nto = VisionWebApi(host=host_ip, username=username, password=password, port=port, debug=False, logFile="ixvision_status_debug.log")
+    nto = nto_connect(host_ip, port, username, password)
 
-    nto_system_properties = nto.getSystem()
+    nto_system_properties = nto_get_system_identity(nto)
+    nto_system_cache = get_nto_system_cache(nto, host_ip, port, nto_system_properties['software_version'])
     nto_system_info = nto_system_properties['system_info']
     nto_ip_info = nto_system_properties['ip_config']
-    nto_hardware_info = nto.getLoginInfo()['hardware_info']
+    nto_hardware_info = nto_system_cache['login_info']['hardware_info']
     
     print_sysinfo(sysinfo_strings['name'], nto_system_info['name'])
     print_sysinfo(sysinfo_strings['location'], nto_system_info['location'])
@@ -64,3 +99,130 @@ def nto_get_sysinfo(host_ip, port, username, password):
     print_sysinfo(sysinfo_strings['mac_address'], ':'.join(nto_hardware_info['mac_address'][i:i+2] for i in range(0,12,2)).upper())
     print
 
+
+# Samples statistics of all NPB ports. Ports are in the same order in every sample, and each counter is kept
+# as a flat array with a value per port, so that counters of all ports are subtracted and divided at once
+class PortStatsSampler(object):
+
+    def __init__(self, nto):
+        self.nto = nto
+        port_list = sorted(get_nto_inventory(nto).load_ports().values(), key=lambda port: port['id'])
+        self.port_id_list = [port['id'] for port in port_list]
+        self.port_names = [port.get('name') or port.get('default_name') for port in port_list]
+        self.port_modes = [port.get('mode') for port in port_list]
+        self.port_index = dict((port_id, index) for index, port_id in enumerate(self.port_id_list))
+        self.previous = None
+        self.current = None
+
+    # Take a new sample of all ports, with a single request, keeping the last one as the previous sample
+    def sample(self):
+        port_count = len(self.port_id_list)
+        sample = dict((key, array('d', [0.0]) * port_count) for key in ['time'] + list(stats_counter_names.keys()))
+        sample_time = time.time()
+        stat_names = [name for key in sorted(stats_counter_names.keys()) for name in stats_counter_names[key]]
+        for stats in nto_get_ports_stats(self.nto, self.port_id_list, stat_names):
+            index = self.port_index.get(stats.get('id'))
+            if index is None:
+                continue
+            sample['time'][index] = stats['stats_time'] / 1000.0 if 'stats_time' in stats else sample_time
+            for key in stats_counter_names:
+                sample[key][index] = sum(stats.get(name) or 0 for name in stats_counter_names[key])
+        sample['sampled'] = sample_time
+        self.previous, self.current = self.current, sample
+        return sample
+
+    # Deltas and per-second rates of all counters of all ports between the previous and the current samples
+    # A counter lower than in the previous sample was reset, and is counted from zero
+    def rates(self):
+        port_count = len(self.port_id_list)
+        interval = array('d', map(max, map(operator.sub, self.current['time'], self.previous['time']), itertools.repeat(stats_interval_min, port_count)))
+        rates = {'interval': interval}
+        for key in stats_counter_names:
+            delta = array('d', map(operator.sub, self.current[key], self.previous[key]))
+            if port_count > 0 and min(delta) < 0:
+                for index in [index for index, value in enumerate(delta) if value < 0]:
+                    delta[index] = self.current[key][index]
+            rates[key] = delta
+            rates[key + '_rate'] = array('d', map(operator.truediv, delta, interval))
+        return rates
+
+# Indexes of the ports with the highest non-zero values, highest first
+def stats_top_ports(values, top_count):
+    return [index for index in heapq.nlargest(top_count, range(len(values)), key=values.__getitem__) if values[index] > 0]
+
+# Report of port counters in a single sample, or of their rates between two samples, with top talkers and drop hotspots
+def stats_report(sampler, top_count):
+    if sampler.previous is None:
+        values = sampler.current
+        columns = ['bytes', 'packets', 'drops']
+        talker_key, drop_key = 'bytes', 'drops'
+        report = {'time': sampler.current['sampled']}
+    else:
+        values = sampler.rates()
+        columns = ['bytes_rate', 'packets_rate', 'drops_rate', 'bytes', 'drops']
+        talker_key, drop_key = 'bytes_rate', 'drops_rate'
+        report = {'time': sampler.current['sampled'], 'interval': sampler.current['sampled'] - sampler.previous['sampled']}
+    report['ports'] = len(sampler.port_id_list)
+    report['totals'] = dict((column, sum(values[column])) for column in columns)
+    for report_key, key in [('top_talkers', talker_key), ('drop_hotspots', drop_key)]:
+        report[report_key] = []
+        for index in stats_top_ports(values[key], top_count):
+            entry = {'port': sampler.port_names[index], 'id': sampler.port_id_list[index], 'mode': sampler.port_modes[index]}
+            entry.update((column, values[column][index]) for column in columns)
+            report[report_key].append(entry)
+    return report
+
+def print_stats_report(report):
+    if 'interval' in report:
+        print("Port statistics of %d ports over %.1fs: %.1f Mbps, %d packets/s, %d drops/s" % \
+              (report['ports'], report['interval'], report['totals']['bytes_rate'] * 8 / 1e6, report['totals']['packets_rate'], report['totals']['drops_rate']))
+        header = "%-12s  %-8s  %10s  %10s  %10s" % ('Port', 'Mode', 'Mbps', 'Packets/s', 'Drops/s')
+        row_values = lambda entry: (entry['bytes_rate'] * 8 / 1e6, entry['packets_rate'], entry['drops_rate'])
+        row_format = "%-12s  %-8s  %10.1f  %10d  %10d"
+    else:
+        print("Port statistics of %d ports: %d bytes, %d packets, %d drops" % \
+              (report['ports'], report['totals']['bytes'], report['totals']['packets'], report['totals']['drops']))
+        header = "%-12s  %-8s  %16s  %14s  %12s" % ('Port', 'Mode', 'Bytes', 'Packets', 'Drops')
+        row_values = lambda entry: (entry['bytes'], entry['packets'], entry['drops'])
+        row_format = "%-12s  %-8s  %16d  %14d  %12d"
+    for report_key, title in [('top_talkers', 'Top talkers'), ('drop_hotspots', 'Drop hotspots')]:
+        if len(report[report_key]) == 0:
+            print("%s: none" % title)
+            continue
+        print("%s:" % title)
+        print(header)
+        for entry in report[report_key]:
+            print(row_format % ((entry['port'], entry['mode']) + row_values(entry)))
+    print
+
+# Input 
+# - Connection to an NPB
+# - Seconds between samples, 0 to take a single sample and report counters
+# - Number of rate reports to print before stopping, 0 to keep sampling until interrupted
+# - Number of ports to list as top talkers and drop hotspots
+# - Whether to print reports as JSON, one line per report
+def nto_get_port_stats(host_ip, port, username, password, interval=0, report_count=0, top_count=stats_top_default, json_output=False):
+    nto = nto_connect(host_ip, port, username, password)
+    sampler = PortStatsSampler(nto)
+
+    def print_report():
+        report = stats_report(sampler, top_count)
+        if json_output:
+            print(json.dumps(report, sort_keys=True))
+        else:
+            print_stats_report(report)
+
+    sampler.sample()
+    if interval <= 0:
+        print_report()
+        return
+
+    report_number = 0
+    try:
+        while report_count == 0 or report_number < report_count:
+            time.sleep(max(0, interval - (time.time() - sampler.current['sampled'])))
+            sampler.sample()
+            report_number += 1
+            print_report()
+    except KeyboardInterrupt:
+        print("Stopped sampling port statistics after %d reports" % report_number)
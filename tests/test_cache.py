@@ -0,0 +1,78 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_cache.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of the on-disk cache of NPB system information
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ixvision_ztp_cache
+from ixvision_ztp_cache import *
+
+# DEFINE FUNCTIONS HERE
+
+# NPB stand-in that records which system information it was asked for
+class SystemNto(object):
+
+    def __init__(self, software_version):
+        self.software_version = software_version
+        self.requests = []
+
+    def _callServer(self, method, url, argsAsJson):
+        self.requests.append(url)
+        return {'software_version': self.software_version}
+
+    def getLoginInfo(self):
+        self.requests.append('login_info')
+        return {'hardware_info': {'system_id': 'NPB0001', 'mac_address': '00005E005301'}}
+
+class SystemCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = ixvision_ztp_cache.ztp_cache_dir
+        ixvision_ztp_cache.ztp_cache_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(ixvision_ztp_cache.ztp_cache_dir)
+        ixvision_ztp_cache.ztp_cache_dir = self.saved
+
+    def test_fresh_cache_is_used_without_requests(self):
+        get_nto_system_cache(SystemNto('5.3.0'), 'npb', 8000)
+        nto = SystemNto('5.3.0')
+        self.assertEqual(get_nto_system_cache(nto, 'npb', 8000)['login_info']['hardware_info']['system_id'], 'NPB0001')
+        self.assertEqual(nto.requests, [])
+
+    def test_known_version_is_not_read_again(self):
+        nto = SystemNto('5.3.0')
+        self.assertEqual(get_nto_system_cache(nto, 'npb', 8000, '5.3.0')['software_version'], '5.3.0')
+        self.assertEqual(nto.requests, ['login_info'])
+
+    def test_fresh_cache_of_another_version_is_refreshed(self):
+        get_nto_system_cache(SystemNto('5.3.0'), 'npb', 8000)
+        nto = SystemNto('5.4.0')
+        self.assertEqual(get_nto_system_cache(nto, 'npb', 8000, '5.4.0')['software_version'], '5.4.0')
+        self.assertEqual(nto.requests, ['login_info'])
+        self.assertEqual(load_nto_system_cache('npb', 8000)['software_version'], '5.4.0')
+
+    def test_identity_fields_are_not_cached(self):
+        get_nto_system_cache(SystemNto('5.3.0'), 'npb', 8000)
+        self.assertEqual(sorted(load_nto_system_cache('npb', 8000).keys()), ['cache_version', 'login_info', 'software_version', 'updated'])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,239 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_criteria.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of filter criteria parsing, merging and canonical form
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ixvision_ztp_criteria
+from ixvision_ztp_criteria import *
+
+# DEFINE FUNCTIONS HERE
+
+def prefix(value):
+    return parse_ipv4_prefix(value)
+
+def formatted_prefixes(prefix_set):
+    return [format_ipv4_prefix(network, length) for network, length in prefix_set.prefixes()]
+
+class ParseIpv4PrefixTest(unittest.TestCase):
+
+    def test_address_and_prefix_length(self):
+        self.assertEqual(parse_ipv4_prefix('10.1.2.3'), ((10 << 24) | (1 << 16) | (2 << 8) | 3, 32))
+        self.assertEqual(parse_ipv4_prefix('10.1.2.3/16'), ((10 << 24) | (1 << 16), 16))
+        self.assertEqual(parse_ipv4_prefix(' 192.168.0.0/24 '), ((192 << 24) | (168 << 16), 24))
+        self.assertEqual(parse_ipv4_prefix('0.0.0.0/0'), (0, 0))
+
+    def test_leading_zeros_are_decimal(self):
+        self.assertEqual(parse_ipv4_prefix('010.000.000.001'), ((10 << 24) | 1, 32))
+
+    def test_netmask(self):
+        self.assertEqual(parse_ipv4_prefix('10.1.2.3/255.255.0.0'), ((10 << 24) | (1 << 16), 16))
+        self.assertEqual(parse_ipv4_prefix('10.1.2.3/255.255.255.255'), ((10 << 24) | (1 << 16) | (2 << 8) | 3, 32))
+        self.assertEqual(parse_ipv4_prefix('10.1.2.3/255.255.255.128'), ((10 << 24) | (1 << 16) | (2 << 8), 25))
+        self.assertEqual(parse_ipv4_prefix('10.1.2.3/0.0.0.0'), (0, 0))
+
+    def test_non_contiguous_netmask(self):
+        self.assertIsNone(parse_ipv4_prefix('10.1.2.3/255.0.255.0'))
+        self.assertIsNone(parse_ipv4_prefix('10.1.2.3/0.0.0.255'))
+
+    def test_invalid(self):
+        for value in ['10.1.2', '10.1.2.3.4', '256.1.2.3', '10.1.2.3/33', '10.1.2.3/', '10.1.2.3/255.255.0', 'a.b.c.d', '', None, 10]:
+            self.assertIsNone(parse_ipv4_prefix(value), value)
+
+class Ipv4PrefixSetTest(unittest.TestCase):
+
+    def test_add_collapses_siblings_and_covered(self):
+        prefix_set = Ipv4PrefixSet()
+        for value in ['10.0.0.0/25', '10.0.0.128/25', '10.0.0.5', '10.0.1.0/24']:
+            prefix_set.add(*prefix(value))
+        self.assertEqual(formatted_prefixes(prefix_set), ['10.0.0.0/23'])
+
+    def test_add_keeps_unaligned_ranges_split(self):
+        prefix_set = Ipv4PrefixSet()
+        for value in ['10.0.1.0/24', '10.0.2.0/24']:
+            prefix_set.add(*prefix(value))
+        self.assertEqual(formatted_prefixes(prefix_set), ['10.0.1.0/24', '10.0.2.0/24'])
+
+    def test_remove_splits_covering_prefix(self):
+        prefix_set = Ipv4PrefixSet()
+        prefix_set.add(*prefix('10.0.0.0/24'))
+        prefix_set.remove(*prefix('10.0.0.64/26'))
+        self.assertEqual(formatted_prefixes(prefix_set), ['10.0.0.0/26', '10.0.0.128/25'])
+
+    def test_remove_across_ranges(self):
+        prefix_set = Ipv4PrefixSet()
+        for value in ['10.0.0.0/24', '10.0.2.0/24', '10.0.4.0/24']:
+            prefix_set.add(*prefix(value))
+        prefix_set.remove(*prefix('10.0.0.0/22'))
+        self.assertEqual(formatted_prefixes(prefix_set), ['10.0.4.0/24'])
+
+    def test_remove_then_add(self):
+        prefix_set = Ipv4PrefixSet()
+        prefix_set.add(*prefix('10.0.0.0/24'))
+        prefix_set.remove(*prefix('10.0.0.0/25'))
+        prefix_set.add(*prefix('10.0.0.0/26'))
+        self.assertEqual(formatted_prefixes(prefix_set), ['10.0.0.0/26', '10.0.0.128/25'])
+
+    def test_whole_address_space(self):
+        prefix_set = Ipv4PrefixSet()
+        prefix_set.add(*prefix('0.0.0.0/1'))
+        prefix_set.add(*prefix('128.0.0.0/1'))
+        self.assertEqual(formatted_prefixes(prefix_set), ['0.0.0.0/0'])
+        prefix_set.remove(*prefix('255.255.255.255'))
+        self.assertEqual(len(prefix_set.prefixes()), 32)
+        self.assertEqual(formatted_prefixes(prefix_set)[-1], '255.255.255.254/32')
+
+    def test_pending_changes_are_applied_in_batches(self):
+        prefix_set = Ipv4PrefixSet()
+        address_count = criteria_chunk_size_default * 2 + 3
+        for address in range(address_count):
+            prefix_set.add((10 << 24) + address * 2, 32)
+        self.assertEqual(len(prefix_set.prefixes()), address_count)
+        for address in range(address_count):
+            prefix_set.add((10 << 24) + address * 2 + 1, 32)
+        self.assertEqual(prefix_set.ranges, [(10 << 24, (10 << 24) + address_count * 2 - 1)])
+
+class MergeIpv4ValuesTest(unittest.TestCase):
+
+    def test_append_and_remove(self):
+        self.assertEqual(merge_ipv4_values(['10.0.0.0/24'], ['10.0.1.0/24', '10.0.0.7'], ['10.0.1.128/25']), ['10.0.0.0/24', '10.0.1.0/25'])
+
+    def test_unchanged_prefixes_keep_their_spelling(self):
+        self.assertEqual(merge_ipv4_values(['10.0.0.1/255.255.255.0', '192.168.1.1'], ['192.168.1.1/32'], []), ['10.0.0.1/255.255.255.0', '192.168.1.1'])
+
+    def test_collapsed_prefixes_are_rewritten(self):
+        self.assertEqual(merge_ipv4_values(['10.0.0.0/25'], ['10.0.0.128/25'], []), ['10.0.0.0/24'])
+
+    def test_other_values_are_kept_after_prefixes(self):
+        self.assertEqual(merge_ipv4_values(['10.0.0.1-10.0.0.9', '10.0.0.0/24'], ['10.0.0.1-10.0.0.9', '1.1.1.1-1.1.1.2'], []),
+                         ['10.0.0.0/24', '10.0.0.1-10.0.0.9', '1.1.1.1-1.1.1.2'])
+
+    def test_other_values_removed_and_added_again(self):
+        value_list = Ipv4ValueList(['10.0.0.1-10.0.0.9'])
+        value_list.remove(['10.0.0.1-10.0.0.9'])
+        value_list.add(['10.0.0.1-10.0.0.9'])
+        self.assertEqual(value_list.values(), ['10.0.0.1-10.0.0.9'])
+
+    def test_spellings_are_bounded_by_the_result(self):
+        value_list = Ipv4ValueList(['10.0.0.0/16'])
+        for address in range(65536):
+            value_list.add(['10.0.%d.%d' % (address >> 8, address & 0xFF)])
+            self.assertLessEqual(len(value_list.spellings), criteria_chunk_size_default + 1)
+        self.assertEqual(value_list.values(), ['10.0.0.0/16'])
+        value_list.drop_spellings()
+        self.assertEqual(list(value_list.spellings.values()), ['10.0.0.0/16'])
+
+    def test_spellings_of_prefixes_left_are_kept(self):
+        added_values = ['192.168.%d.%d' % (address >> 7, (address * 2) & 0xFF) for address in range(criteria_chunk_size_default * 3)]
+        value_list = Ipv4ValueList(['10.0.0.1'])
+        value_list.add(added_values + ['10.0.0.2/31'])
+        self.assertEqual(value_list.values(), ['10.0.0.1', '10.0.0.2/31'] + added_values)
+
+    def test_remove_everything(self):
+        self.assertEqual(merge_ipv4_values(['10.0.0.0/24', '10.0.1.0/24'], [], ['10.0.0.0/8']), [])
+
+class CanonicalCriteriaTest(unittest.TestCase):
+
+    def test_ipv4_lists_are_collapsed_and_ordered(self):
+        criteria = {'ipv4_src': {'addr': ['10.0.1.0/24', '10.0.0.0/24', '10.0.0.5', '9.9.9.9']}}
+        self.assertEqual(canonical_criteria(criteria), {'ipv4_src': {'addr': ['9.9.9.9/32', '10.0.0.0/23']}})
+
+    def test_same_traffic_same_form(self):
+        criteria = {'logical_operation': 'AND', 'ipv4_dst': {'addr': ['10.0.0.0/25', '10.0.0.128/25', '1.2.3.4']}, 'vlan': {'vlan_id': [20, 10.0, 20]}}
+        other_criteria = {'vlan': {'vlan_id': [10, 20]}, 'ipv4_dst': {'addr': ['1.2.3.4/255.255.255.255', '10.0.0.0/24']}, 'logical_operation': ' AND '}
+        self.assertEqual(canonical_criteria(criteria), canonical_criteria(other_criteria))
+        self.assertEqual(criteria_fingerprint(criteria), criteria_fingerprint(other_criteria))
+        self.assertTrue(criteria_match(criteria, other_criteria))
+
+    def test_different_traffic_different_form(self):
+        criteria = {'ipv4_dst': {'addr': ['10.0.0.0/24']}}
+        self.assertNotEqual(criteria_fingerprint(criteria), criteria_fingerprint({'ipv4_src': {'addr': ['10.0.0.0/24']}}))
+        self.assertNotEqual(criteria_fingerprint(criteria), criteria_fingerprint({'ipv4_dst': {'addr': ['10.0.0.0/25']}}))
+
+    def test_other_ipv4_values_are_sorted_after_prefixes(self):
+        criteria = {'ipv4_src_or_dst': {'addr': ['10.0.0.9-10.0.0.20', '10.0.0.1-10.0.0.5', '8.8.8.8', '10.0.0.1-10.0.0.5']}}
+        self.assertEqual(canonical_criteria(criteria)['ipv4_src_or_dst']['addr'], ['8.8.8.8/32', '10.0.0.1-10.0.0.5', '10.0.0.9-10.0.0.20'])
+
+    def test_fingerprint_keyword_is_replaced(self):
+        keywords = set_criteria_fingerprint_keyword(['ZTP', criteria_fingerprint_prefix + 'OLD'], {'vlan': {'vlan_id': [10]}})
+        self.assertEqual(keywords, ['ZTP', criteria_fingerprint_keyword({'vlan': {'vlan_id': [10]}})])
+
+class JsonStreamReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.read_size = ixvision_ztp_criteria.criteria_read_size
+
+    def tearDown(self):
+        ixvision_ztp_criteria.criteria_read_size = self.read_size
+        shutil.rmtree(self.directory)
+
+    def write(self, content):
+        filename = os.path.join(self.directory, 'criteria.json')
+        with open(filename, 'w') as f:
+            f.write(content)
+        return filename
+
+    # Events of a file read with buffers of every size from a single character up, so that values are cut at every position
+    def assertEventsAtAllBoundaries(self, content, expected_events, default_key='addr'):
+        filename = self.write(content)
+        for read_size in range(1, len(content) + 2):
+            ixvision_ztp_criteria.criteria_read_size = read_size
+            self.assertEqual(list(iter_criteria_file(filename, default_key)), expected_events, "read size %d" % read_size)
+
+    def test_json_object(self):
+        self.assertEventsAtAllBoundaries('{"logical_operation": "AND", "ipv4_src": {"addr": ["10.0.0.0/8", "192.168.1.1"]}, "vlan": {"vlan_id": [100, 2000]}}',
+                                         [(('logical_operation',), 'AND', False), (('ipv4_src', 'addr'), '10.0.0.0/8', True), (('ipv4_src', 'addr'), '192.168.1.1', True),
+                                          (('vlan', 'vlan_id'), 100, True), (('vlan', 'vlan_id'), 2000, True)], None)
+
+    def test_numbers_cut_by_the_buffer(self):
+        self.assertEventsAtAllBoundaries('[12345, 678.5, -9]\n{"addr": [1234567]}', [(('addr',), 12345, True), (('addr',), 678.5, True), (('addr',), -9, True),
+                                                                               (('addr',), 1234567, True)])
+
+    def test_newline_delimited_values_and_comments(self):
+        self.assertEventsAtAllBoundaries('# feed\n10.0.0.1\n  "10.0.0.2"\n\n{"addr": ["10.0.0.3"]}\n10.0.0.0/255.0.0.0\n',
+                                         [(('addr',), '10.0.0.1', True), (('addr',), '10.0.0.2', True), (('addr',), '10.0.0.3', True), (('addr',), '10.0.0.0/255.0.0.0', True)])
+
+    def test_last_line_without_newline(self):
+        self.assertEventsAtAllBoundaries('10.0.0.1\n10.0.0.2', [(('addr',), '10.0.0.1', True), (('addr',), '10.0.0.2', True)])
+
+    def test_empty_containers(self):
+        self.assertEventsAtAllBoundaries('{"a": {}, "b": []} []', [])
+
+    def test_malformed_json(self):
+        filename = self.write('{"addr": ["10.0.0.1", ]}')
+        for read_size in [1, 4, 1024]:
+            ixvision_ztp_criteria.criteria_read_size = read_size
+            self.assertRaises(ValueError, list, iter_criteria_file(filename))
+
+    def test_unterminated_object(self):
+        filename = self.write('{"addr": ["10.0.0.1"')
+        for read_size in [1, 7, 1024]:
+            ixvision_ztp_criteria.criteria_read_size = read_size
+            self.assertRaises(ValueError, list, iter_criteria_file(filename))
+
+    def test_load_criteria_file(self):
+        filename = self.write('{"logical_operation": "AND", "ipv4_dst": {"addr": ["10.0.0.0/25", "10.0.0.128/25", "bogus"]}}')
+        ixvision_ztp_criteria.criteria_read_size = 3
+        self.assertEqual(load_criteria_file(filename), ({'logical_operation': 'AND', 'ipv4_dst': {'addr': ['10.0.0.0/24']}}, 1))
+
+if __name__ == '__main__':
+    unittest.main()
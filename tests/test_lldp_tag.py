@@ -0,0 +1,186 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_lldp_tag.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of matching tags in LLDP neighbor descriptions and of port keyword updates
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ixvision_ztp_lldp_tag
+from ixvision_ztp_lldp_tag import *
+
+# DEFINE FUNCTIONS HERE
+
+# Tags found in a text the simple way, one search per tag, in the order TagMatcher reports them: by where they end, longest first
+def expected_tags(tags, text):
+    found_tags = []
+    for end in range(1, len(text) + 1):
+        for tag in sorted(tags, key=len, reverse=True):
+            if len(tag) > 0 and text[:end].endswith(tag) and tag not in found_tags:
+                found_tags.append(tag)
+    return found_tags
+
+class TagMatcherTest(unittest.TestCase):
+
+    def test_single_tag(self):
+        matcher = TagMatcher(['TAP'])
+        self.assertEqual(matcher.match('uplink TAP 1'), ['TAP'])
+        self.assertEqual(matcher.match('uplink SPAN 1'), [])
+        self.assertEqual(matcher.match(''), [])
+
+    def test_case_sensitive(self):
+        self.assertEqual(TagMatcher(['TAP']).match('tap'), [])
+
+    def test_overlapping_and_nested_tags(self):
+        tags = ['he', 'she', 'his', 'hers']
+        self.assertEqual(TagMatcher(tags).match('ushers'), ['she', 'he', 'hers'])
+        self.assertEqual(TagMatcher(['SPAN', 'PAN', 'AN']).match('SPAN'), ['SPAN', 'PAN', 'AN'])
+
+    def test_fallback_after_partial_match(self):
+        self.assertEqual(TagMatcher(['TAPX', 'APE']).match('TAPE'), ['APE'])
+        self.assertEqual(TagMatcher(['aab']).match('aaab'), ['aab'])
+
+    def test_each_tag_reported_once(self):
+        self.assertEqual(TagMatcher(['TAP', 'TAP', '']).match('TAP TAP TAP'), ['TAP'])
+
+    def test_no_tags(self):
+        self.assertEqual(TagMatcher([]).match('anything'), [])
+
+    def test_same_as_searching_each_tag(self):
+        tags = ['TAP', 'SPAN', 'probe', 'AP', 'PA', 'NT', 'TAPS', 'SP', 'be', 'robe']
+        for text in ['TAPSPAN probe', 'ssspanSPANTAPAP', 'xxrobeprobe', 'NTAPSPANT', 'PAPAPAP']:
+            self.assertEqual(TagMatcher(tags).match(text), expected_tags(tags, text), text)
+
+class PortKeywordsTest(unittest.TestCase):
+
+    def test_merge_adds_missing_tags_in_upper_case(self):
+        self.assertEqual(merge_port_keywords(['ZTP'], ['tap', 'SPAN']), ['ZTP', 'TAP', 'SPAN'])
+        self.assertEqual(merge_port_keywords(None, ['tap']), ['TAP'])
+
+    def test_merge_without_changes(self):
+        self.assertIsNone(merge_port_keywords(['ZTP', 'TAP'], ['tap']))
+
+    def test_retag_removes_tags_that_no_longer_match(self):
+        self.assertEqual(retag_port_keywords(['ZTP', 'TAP', 'SPAN'], ['tap', 'span'], ['span']), ['ZTP', 'SPAN'])
+        self.assertEqual(retag_port_keywords(['ZTP', 'TAP'], ['tap', 'span'], ['span']), ['ZTP', 'SPAN'])
+
+    def test_retag_keeps_keywords_not_watched(self):
+        self.assertEqual(retag_port_keywords(['ZTP', 'PROBE', 'TAP'], ['tap'], []), ['ZTP', 'PROBE'])
+        self.assertIsNone(retag_port_keywords(['ZTP', 'PROBE', 'TAP'], ['tap'], ['tap']))
+
+# NPB stand-in for watching LLDP neighbors: ports by ID, a list of neighbor tables to report on each poll,
+# and port IDs whose keyword writes fail on their first attempt
+class WatchedNpb(object):
+
+    def __init__(self, ports, polls, failing_writes=[]):
+        self.ports = ports
+        self.polls = list(polls)
+        self.failing_writes = set(failing_writes)
+        self.writes = []
+
+    def getAllNeighbors(self):
+        return self.polls.pop(0)
+
+    def get_port(self, port_key):
+        for port_details in self.ports.values():
+            if port_key in [port_details['id'], port_details['name'], port_details['default_name']]:
+                return dict(port_details)
+        return None
+
+    def get_ports_properties(self, nto, port_key_list, properties):
+        return dict((port_key, self.get_port(port_key)) for port_key in port_key_list if self.get_port(port_key) is not None)
+
+    def update_ports_keywords(self, nto, port_keyword_changes):
+        failed_port_id_list = []
+        for port_id in sorted(port_keyword_changes):
+            self.writes.append((port_id, port_keyword_changes[port_id]))
+            if port_id in self.failing_writes:
+                self.failing_writes.remove(port_id)
+                failed_port_id_list.append(port_id)
+            else:
+                self.ports[port_id]['keywords'] = port_keyword_changes[port_id]
+        return len(port_keyword_changes) - len(failed_port_id_list), failed_port_id_list
+
+# Inventory loaded when watching started, which other tools and renames leave behind
+class StaleInventory(object):
+
+    def __init__(self, ports):
+        self.ports = dict((port_id, dict(ports[port_id])) for port_id in ports)
+
+    def get_port(self, port_key):
+        for port_details in self.ports.values():
+            if port_key in [port_details['id'], port_details['name'], port_details['default_name']]:
+                return port_details
+        return None
+
+    def update_port(self, port_id, changes):
+        if port_id in self.ports:
+            self.ports[port_id].update(changes)
+
+    def search_ports(self, keywords=None):
+        return [port_details for port_details in self.ports.values() if len(set(keywords) & set(port_details['keywords'])) > 0]
+
+def neighbor(port_description):
+    return {'system_name': 'sw1', 'port_id': 'Eth1', 'port_description': port_description}
+
+class WatchPortTagsTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict((name, getattr(ixvision_ztp_lldp_tag, name)) for name in \
+                          ['nto_connect', 'get_nto_inventory', 'get_ports_properties', 'update_ports_keywords'])
+
+    def tearDown(self):
+        for name in self.saved:
+            setattr(ixvision_ztp_lldp_tag, name, self.saved[name])
+
+    def watch(self, npb, tags, poll_count):
+        inventory = StaleInventory(npb.ports)
+        ixvision_ztp_lldp_tag.nto_connect = lambda *args: npb
+        ixvision_ztp_lldp_tag.get_nto_inventory = lambda nto: inventory
+        ixvision_ztp_lldp_tag.get_ports_properties = npb.get_ports_properties
+        ixvision_ztp_lldp_tag.update_ports_keywords = npb.update_ports_keywords
+        return watch_port_tags('npb', 8000, 'admin', 'admin', tags, interval=0, poll_count=poll_count)
+
+    def test_failed_write_is_retried_on_next_poll(self):
+        npb = WatchedNpb({1: {'id': 1, 'name': 'P01', 'default_name': 'P01', 'keywords': []}},
+                         [{'P01': [neighbor('TAP')]}] * 2, failing_writes=[1])
+        self.assertFalse(self.watch(npb, ['TAP'], 2))
+        self.assertEqual(npb.writes, [(1, ['TAP']), (1, ['TAP'])])
+        self.assertEqual(npb.ports[1]['keywords'], ['TAP'])
+
+    def test_keywords_added_while_watching_are_kept(self):
+        npb = WatchedNpb({1: {'id': 1, 'name': 'P01', 'default_name': 'P01', 'keywords': []}},
+                         [{'P01': [neighbor('TAP')]}])
+        npb.ports[1]['keywords'] = ['PROBE']
+        self.assertTrue(self.watch(npb, ['TAP'], 1))
+        self.assertEqual(npb.ports[1]['keywords'], ['PROBE', 'TAP'])
+
+    def test_tagged_ports_are_tracked_by_id_under_either_name(self):
+        npb = WatchedNpb({1: {'id': 1, 'name': 'uplink', 'default_name': 'P01', 'keywords': ['TAP']}},
+                         [{'uplink': [neighbor('TAP')]}, {'uplink': [neighbor('SPAN')]}])
+        self.assertTrue(self.watch(npb, ['TAP', 'SPAN'], 2))
+        self.assertEqual(npb.writes, [(1, ['SPAN'])])
+
+    def test_ports_renamed_while_watching_are_found(self):
+        npb = WatchedNpb({1: {'id': 1, 'name': 'P01', 'default_name': 'P01', 'keywords': []}},
+                         [{'uplink': [neighbor('TAP')]}])
+        npb.ports[1]['name'] = 'uplink'
+        self.assertTrue(self.watch(npb, ['TAP'], 1))
+        self.assertEqual(npb.writes, [(1, ['TAP'])])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,189 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_ntolib.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of staging and writing NPB port attribute changes, bulk property reads and NPB connections
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import sys
+import time
+import threading
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ixvision_ztp_ntolib
+from ixvision_ztp_ntolib import *
+
+# DEFINE FUNCTIONS HERE
+
+# NPB connection stand-in that records modifyPort requests, and rejects the ones with more attributes than it accepts at once
+class RecordingNto(object):
+
+    def __init__(self, max_attributes=None):
+        self.max_attributes = max_attributes
+        self.requests = []
+
+    def modifyPort(self, port_id, changes):
+        self.requests.append((port_id, dict(changes)))
+        if self.max_attributes is not None and len(changes) > self.max_attributes:
+            raise Exception({'status_code': 400, 'content': 'too many attributes'})
+
+class SplitPortChangesTest(unittest.TestCase):
+
+    def test_independent_changes_go_together(self):
+        changes = {'mode': 'TOOL', 'link_settings': '10G_FULL', 'keywords': ['ZTP']}
+        self.assertEqual(split_port_changes(changes), [changes])
+
+    def test_sequenced_changes_go_after_media_type(self):
+        changes = {'media_type': 'SFP_PLUS_10G', 'link_settings': '10G_FULL', 'forward_error_correction_settings': {'enabled': True}, 'enabled': True}
+        self.assertEqual(split_port_changes(changes), [{'media_type': 'SFP_PLUS_10G', 'link_settings': '10G_FULL'},
+                                                       {'forward_error_correction_settings': {'enabled': True}, 'enabled': True}])
+
+    def test_sequenced_changes_without_media_type(self):
+        changes = {'forward_error_correction_settings': {'enabled': True}, 'enabled': True}
+        self.assertEqual(split_port_changes(changes), [changes])
+
+    def test_no_changes(self):
+        self.assertEqual(split_port_changes({}), [])
+
+    def test_changes_are_not_modified(self):
+        changes = {'media_type': 'QSFP28', 'enabled': True}
+        split_port_changes(changes)
+        self.assertEqual(changes, {'media_type': 'QSFP28', 'enabled': True})
+
+class StagePortChangesTest(unittest.TestCase):
+
+    def test_changes_already_in_effect_are_skipped(self):
+        port_details = {'mode': 'NETWORK', 'enabled': False, 'forward_error_correction_settings': {'enabled': True, 'mode': 'RS'}}
+        pending_changes = stage_port_changes({}, port_details, {'mode': 'NETWORK', 'enabled': True, 'forward_error_correction_settings': {'enabled': True}})
+        self.assertEqual(pending_changes, {'enabled': True})
+
+    def test_attributes_the_port_does_not_have_are_skipped(self):
+        self.assertEqual(stage_port_changes({}, {'mode': 'NETWORK'}, {'media_type': 'QSFP28', 'mode': 'TOOL'}), {'mode': 'TOOL'})
+
+class ApplyPortChangesTest(unittest.TestCase):
+
+    def test_one_request_per_split(self):
+        nto = RecordingNto()
+        changes = {'media_type': 'QSFP28', 'link_settings': '100G_FULL', 'enabled': True}
+        self.assertEqual(apply_port_changes(nto, 5, changes), 2)
+        self.assertEqual(nto.requests, [('5', {'media_type': 'QSFP28', 'link_settings': '100G_FULL'}), ('5', {'enabled': True})])
+
+    def test_rejected_request_is_written_in_groups(self):
+        nto = RecordingNto(max_attributes=2)
+        changes = {'media_type': 'QSFP28', 'link_settings': '100G_FULL', 'mode': 'TOOL', 'keywords': ['ZTP']}
+        self.assertEqual(apply_port_changes(nto, 5, changes), 4)
+        self.assertEqual(nto.requests[1:], [('5', {'media_type': 'QSFP28', 'link_settings': '100G_FULL'}), ('5', {'mode': 'TOOL'}), ('5', {'keywords': ['ZTP']})])
+
+    def test_rejected_single_attribute_is_raised(self):
+        nto = RecordingNto(max_attributes=0)
+        self.assertRaises(Exception, apply_port_changes, nto, 5, {'mode': 'TOOL'})
+
+# NPB stand-in that lists ports with only some of their properties, the way NPBs that ignore projections do,
+# and records which requests were made
+class ProjectingNto(object):
+
+    def __init__(self, ports, listed_properties):
+        self.ports = ports
+        self.listed_properties = listed_properties
+        self.requests = []
+
+    def _callServer(self, method, url, body):
+        self.requests.append((method, url))
+        return [dict((key, port[key]) for key in self.listed_properties if key in port) for port in self.ports.values()]
+
+    def searchPorts(self, search_terms):
+        self.requests.append(('searchPorts', None))
+        return [{'id': port_id} for port_id in self.ports]
+
+    def getPortProperties(self, port_id, properties):
+        self.requests.append(('getPortProperties', port_id))
+        port = self.ports[int(port_id)]
+        return dict((key, port[key]) for key in properties.split(',') if key in port)
+
+def projecting_nto_ports():
+    return dict((port_id, {'id': port_id, 'name': 'P%02d' % port_id, 'default_name': 'P%02d' % port_id, 'mode': 'NETWORK',
+                           'keywords': ['ZTP'], 'enabled': True, 'port_group_id': None, 'source_filter_list': [], 'dest_filter_list': []})
+                for port_id in [1, 2, 3])
+
+class BulkPropertiesTest(unittest.TestCase):
+
+    def test_complete_listing_is_used(self):
+        nto = ProjectingNto(projecting_nto_ports(), ['id', 'name', 'default_name', 'keywords'])
+        port_details_list = get_ports_properties(nto, [1, 'P02'], 'keywords')
+        self.assertEqual(sorted(port_details_list[1].keys()), ['default_name', 'id', 'keywords', 'name'])
+        self.assertEqual(port_details_list['P02']['id'], 2)
+        self.assertEqual(len(nto.requests), 1)
+
+    def test_incomplete_listing_falls_back_to_each_port(self):
+        nto = ProjectingNto(projecting_nto_ports(), ['id'])
+        port_details_list = get_ports_properties(nto, [1, 3], 'keywords')
+        self.assertEqual(port_details_list[1]['keywords'], ['ZTP'])
+        self.assertEqual(port_details_list[3]['keywords'], ['ZTP'])
+        self.assertEqual(sorted(request for request in nto.requests if request[0] == 'getPortProperties'),
+                         [('getPortProperties', '1'), ('getPortProperties', '3')])
+
+    def test_incomplete_listing_falls_back_to_each_port_in_inventory(self):
+        nto = ProjectingNto(projecting_nto_ports(), ['id', 'name', 'default_name'])
+        inventory = NpbInventory(nto)
+        self.assertEqual(inventory.get_port('P02')['keywords'], ['ZTP'])
+        self.assertEqual([port['id'] for port in inventory.search_ports(keywords=['ZTP'])], [1, 2, 3])
+        self.assertEqual(len([request for request in nto.requests if request[0] == 'getPortProperties']), 3)
+
+# NPB session stand-in that takes a while to log in, and counts logins
+class SlowLoginSession(object):
+    logins = []
+
+    def __init__(self, host, username, password, port):
+        SlowLoginSession.logins.append(host)
+        time.sleep(0.3)
+        self.host = host
+
+class NtoConnectTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = ixvision_ztp_ntolib.NtoSession
+        ixvision_ztp_ntolib.NtoSession = SlowLoginSession
+        SlowLoginSession.logins = []
+
+    def tearDown(self):
+        ixvision_ztp_ntolib.NtoSession = self.saved
+        for session_key in list(nto_sessions.keys()):
+            if isinstance(nto_sessions[session_key], SlowLoginSession):
+                del nto_sessions[session_key]
+
+    def connect_in_parallel(self, host_list):
+        sessions = {}
+        def connect(i):
+            sessions[i] = nto_connect(host_list[i], 8000, 'admin', 'admin')
+        thread_list = [threading.Thread(target=connect, args=(i,)) for i in range(len(host_list))]
+        start = time.time()
+        for thread in thread_list:
+            thread.start()
+        for thread in thread_list:
+            thread.join()
+        return [sessions[i] for i in range(len(host_list))], time.time() - start
+
+    def test_logins_to_different_npbs_dont_wait_for_each_other(self):
+        sessions, duration = self.connect_in_parallel(['npb-a', 'npb-b', 'npb-c'])
+        self.assertEqual([nto.host for nto in sessions], ['npb-a', 'npb-b', 'npb-c'])
+        self.assertLess(duration, 0.6)
+
+    def test_same_npb_logs_in_once(self):
+        sessions, _ = self.connect_in_parallel(['npb-a', 'npb-a', 'npb-a'])
+        self.assertEqual(SlowLoginSession.logins, ['npb-a'])
+        self.assertTrue(sessions[0] is sessions[1] and sessions[1] is sessions[2])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,87 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_port_discovery.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of waiting for links to come up during port discovery
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import sys
+import time
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ixvision_ztp_port_discovery
+from ixvision_ztp_port_discovery import *
+
+# DEFINE FUNCTIONS HERE
+
+# Port status reads of ports whose links come up a set number of seconds after polling started, or never if None
+class LinkSchedule(object):
+
+    def __init__(self, ports):
+        self.ports = ports              # (media type, seconds to link up) by port ID
+        self.start = time.time()
+
+    def get_ports_properties(self, nto, port_id_list, properties):
+        elapsed = time.time() - self.start
+        port_details_list = {}
+        for port_id in port_id_list:
+            media_type, link_delay = self.ports[port_id]
+            port_details_list[port_id] = {'id': port_id, 'default_name': 'P%02d' % port_id, 'media_type': media_type,
+                                          'link_status': {'link_up': link_delay is not None and elapsed >= link_delay}}
+        return port_details_list
+
+class SettlePortLinksTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = dict((name, getattr(ixvision_ztp_port_discovery, name)) for name in \
+                          ['get_ports_properties', 'link_settle_min', 'link_poll_interval_start', 'link_poll_interval_max'])
+        ixvision_ztp_port_discovery.link_settle_min = 0.3
+        ixvision_ztp_port_discovery.link_poll_interval_start = 0.05
+        ixvision_ztp_port_discovery.link_poll_interval_max = 0.05
+
+    def tearDown(self):
+        for name in self.saved:
+            setattr(ixvision_ztp_port_discovery, name, self.saved[name])
+
+    def settle(self, ports, timeout, earlier_ports={}):
+        schedule = LinkSchedule(ports)
+        ixvision_ztp_port_discovery.get_ports_properties = schedule.get_ports_properties
+        discoveredPortList = dict((port_id, {'name': 'P%02d' % port_id, 'ZTPSucceeded': False, 'details': {'media_type': ports[port_id][0]}}) for port_id in ports)
+        discoveredPortList.update(earlier_ports)
+        start = time.time()
+        settle_port_links(None, 'npb', discoveredPortList, sorted(ports.keys()), timeout)
+        return dict((port_id, discoveredPortList[port_id]['ZTPSucceeded']) for port_id in ports), time.time() - start
+
+    def test_slow_links_of_other_media_types_are_waited_for(self):
+        results, _ = self.settle({1: ('QSFP28', 0.05), 2: ('QSFP28', 0.05), 3: ('SFP_1G', 1.0)}, 2.0)
+        self.assertEqual(results, {1: True, 2: True, 3: True})
+
+    def test_links_from_earlier_phases_dont_cut_the_wait(self):
+        earlier_ports = {9: {'name': 'P09', 'ZTPSucceeded': True, 'link_time': 0.1, 'details': {'media_type': 'SFP_1G'}}}
+        results, _ = self.settle({1: ('SFP_1G', 1.0)}, 2.0, earlier_ports)
+        self.assertEqual(results, {1: True})
+
+    def test_ports_down_are_cut_short_once_the_same_media_type_came_up(self):
+        results, duration = self.settle({1: ('SFP_PLUS_10G', 0.05), 2: ('SFP_PLUS_10G', None)}, 5.0)
+        self.assertEqual(results, {1: True, 2: False})
+        self.assertLess(duration, 2.0)
+
+    def test_ports_down_wait_for_the_timeout_without_links_of_their_media_type(self):
+        results, duration = self.settle({1: ('QSFP28', 0.05), 2: ('SFP_PLUS_10G', None)}, 1.0)
+        self.assertEqual(results, {1: True, 2: False})
+        self.assertGreaterEqual(duration, 1.0)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+###############################################################################
+#
+# Zero-Touch Automation utility for Ixia Vision Network Packet Brokers
+#
+# File: tests/test_session.py
+# Author: Alex Bortok (https://github.com/bortok)
+#
+# Description: Tests of repeating NPB calls after overload and connection errors
+#
+# COPYRIGHT 2018 - 2019 Keysight Technologies.
+#
+# This code is provided under the MIT license.
+# You can find the complete terms in LICENSE.txt
+#
+###############################################################################
+
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import ixvision_ztp_governor
+from ixvision_ztp_session import *
+
+# DEFINE FUNCTIONS HERE
+
+class StubResponse(object):
+
+    def __init__(self, status):
+        self.status = status
+        self.data = b'{}'
+
+    def getheader(self, name):
+        return None
+
+# Session that answers calls from a list of responses, or raises the ones that are errors, without an NPB behind it
+class ScriptedSession(NtoSession):
+
+    def __init__(self, outcomes):
+        self.host = 'npb'
+        self.token = 'token'
+        self.outcomes = list(outcomes)
+        self.requests = []
+
+    def governed_request(self, method, url, argsAsJson, token):
+        self.requests.append(method)
+        outcome = self.outcomes.pop(0)
+        if isinstance(outcome, Exception):
+            raise outcome
+        return StubResponse(outcome)
+
+class CallRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.saved = ixvision_ztp_governor.governor_retry_delay
+        ixvision_ztp_governor.governor_retry_delay = 0
+
+    def tearDown(self):
+        ixvision_ztp_governor.governor_retry_delay = self.saved
+
+    def test_get_is_repeated_after_overload(self):
+        session = ScriptedSession([503, urllib3.exceptions.ReadTimeoutError(None, '/api/ports', 'timed out'), 200])
+        self.assertEqual(session._callServer('GET', '/api/ports'), {})
+        self.assertEqual(session.requests, ['GET', 'GET', 'GET'])
+
+    def test_put_is_not_repeated_after_gateway_errors(self):
+        for status in [502, 503, 504]:
+            session = ScriptedSession([status, 200])
+            self.assertRaises(Exception, session._callServer, 'PUT', '/api/ports/1', '{}')
+            self.assertEqual(session.requests, ['PUT'])
+
+    def test_put_is_not_repeated_after_connection_errors(self):
+        session = ScriptedSession([urllib3.exceptions.ReadTimeoutError(None, '/api/ports/1', 'timed out'), 200])
+        self.assertRaises(urllib3.exceptions.HTTPError, session._callServer, 'PUT', '/api/ports/1', '{}')
+        self.assertEqual(session.requests, ['PUT'])
+
+    def test_writes_rejected_with_429_are_repeated(self):
+        session = ScriptedSession([429, 200])
+        self.assertEqual(session._callServer('PUT', '/api/ports/1', '{}'), {})
+        self.assertEqual(session.requests, ['PUT', 'PUT'])
+
+if __name__ == '__main__':
+    unittest.main()